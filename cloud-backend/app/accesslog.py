@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+# Structured access log. Request handlers only enqueue a dict; formatting and
+# the write to stdout happen on the listener thread, off the event loop.
+ACCESS_LOG_SAMPLE = float(os.getenv("ACCESS_LOG_SAMPLE", "1.0"))  # fraction of 2xx/3xx/4xx requests logged
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+
+class _DeferredQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record  # keep the dict payload; the listener formats it
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = record.msg if isinstance(record.msg, dict) else {"logger": record.name, "msg": record.getMessage()}
+        if record.exc_info:
+            payload = {**payload, "exc": self.formatException(record.exc_info)}
+        return json.dumps({"ts": round(record.created, 3), "level": record.levelname, **payload}, default=str)
+
+
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_stream = logging.StreamHandler(sys.stdout)
+_stream.setFormatter(_JsonFormatter())
+_listener = QueueListener(_queue, _stream)
+_listener.start()
+atexit.register(_listener.stop)
+
+# Module loggers under "app" (app.jobs, app.snapshot, ...) share the handler
+_app_logger = logging.getLogger("app")
+_app_logger.setLevel(LOG_LEVEL)
+_app_logger.propagate = False
+_app_logger.addHandler(_DeferredQueueHandler(_queue))
+
+logger = logging.getLogger("app.access")
+
+
+def log_access(entry: dict[str, Any]) -> None:
+    """Queue one access record; server errors are always kept, the rest are sampled."""
+    if entry.get("status", 0) < 500 and ACCESS_LOG_SAMPLE < 1.0 and random.random() >= ACCESS_LOG_SAMPLE:
+        return
+    logger.info(entry)
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .models import Agent
+
+
+class AgentInfo(NamedTuple):
+    """Immutable snapshot of an agent row, safe to share across sessions and threads."""
+    id: int
+    code: str
+
+
+# Invalidated on any ORM write to agents in this process; the TTL bounds
+# staleness for writes made by other workers.
+_agent_cache = TTLCache(maxsize=1024, ttl=300)
+
+
+def lookup_agent(db: Session, code: str) -> Optional[AgentInfo]:
+    info = _agent_cache.get(code)
+    if info is None:
+        row = db.execute(select(Agent.id, Agent.code).where(Agent.code == code)).first()
+        if row is None:
+            return None
+        info = AgentInfo(row.id, row.code)
+        _agent_cache.set(code, info)
+    return info
+
+
+def ensure_agent(db: Session, code: str) -> AgentInfo:
+    """Return the agent, creating it on first sight (demo login behaviour)."""
+    info = lookup_agent(db, code)
+    if info is None:
+        agent = Agent(code=code, password_hash="demo")
+        db.add(agent)
+        db.commit()
+        info = AgentInfo(agent.id, agent.code)
+    return info
+
+
+@event.listens_for(Agent, "after_insert")
+@event.listens_for(Agent, "after_update")
+@event.listens_for(Agent, "after_delete")
+def _invalidate_agent(mapper, connection, target: Agent) -> None:
+    _agent_cache.pop(target.code)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import threading
+from typing import Iterable
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .models import Sale
+
+SALE_BLOOM_CAPACITY = int(os.getenv("SALE_BLOOM_CAPACITY", "1000000"))
+SALE_BLOOM_ERROR_RATE = 0.01
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (k bit positions by double hashing one BLAKE2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float = SALE_BLOOM_ERROR_RATE) -> None:
+        self.capacity = max(1, capacity)
+        self.bits = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / self.capacity * math.log(2)))
+        self._array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> list[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class KnownSaleIds:
+    """Process-wide filter of sale external_ids already on the server.
+
+    A miss is definitive and lets ingest skip the existence lookup for the
+    (common) brand-new sale; a hit only means "ask the database". Rows inserted
+    by other processes are unknown here, so callers must still cope with a
+    unique-constraint conflict. Loaded lazily from ``sales`` and rebuilt at
+    twice the size once it holds more ids than it was sized for.
+    """
+
+    def __init__(self, capacity: int = SALE_BLOOM_CAPACITY) -> None:
+        self.capacity = capacity
+        self._bloom: BloomFilter | None = None
+        self._lock = threading.Lock()
+
+    def _load(self, db: Session) -> BloomFilter:
+        with self._lock:
+            bloom = self._bloom
+            if bloom is None or bloom.count > bloom.capacity:
+                rows = db.execute(select(func.count(Sale.id))).scalar() or 0
+                bloom = BloomFilter(max(self.capacity, 2 * rows, bloom.capacity * 2 if bloom else 0))
+                for (ext,) in db.execute(select(Sale.external_id).where(Sale.external_id.is_not(None)).execution_options(yield_per=10_000)):
+                    bloom.add(ext)
+                self._bloom = bloom
+            return bloom
+
+    def maybe_known(self, db: Session, ids: Iterable[str]) -> list[str]:
+        bloom = self._load(db)
+        return [i for i in ids if i in bloom]
+
+    def add(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            if self._bloom is not None:
+                for i in ids:
+                    self._bloom.add(i)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._bloom = None
+
+
+known_sales = KnownSaleIds()
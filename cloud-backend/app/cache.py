@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .models import IngestWatermark
+
+
+def current_watermark(db: Session) -> int:
+    return db.execute(select(IngestWatermark.value).where(IngestWatermark.id == 1)).scalar() or 0
+
+
+def bump_watermark(db: Session) -> None:
+    """Advance the ingest watermark inside the caller's transaction."""
+    db.execute(update(IngestWatermark).where(IngestWatermark.id == 1).values(value=IngestWatermark.value + 1))
+
+
+class TTLCache:
+    """Thread-safe LRU whose entries also expire at a wall-clock time."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        """Store ``value`` until ``expires_at`` or the default TTL, whichever is sooner."""
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        with self._lock:
+            self._data[key] = (deadline, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _Entry(NamedTuple):
+    watermark: int
+    expires: float
+    body: bytes
+    etag: str
+
+
+class ResponseCache:
+    """LRU + TTL cache of serialized JSON responses, keyed by path and query.
+
+    Entries remember the ingest watermark they were computed at; once an upload
+    bumps it they are treated as misses. The TTL bounds staleness from the
+    clock alone (windows like "last 30 days" move even without uploads).
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(request: Request) -> str:
+        return request.url.path + "?" + "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+
+    def get(self, key: str, watermark: int) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry.watermark != watermark or entry.expires < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, watermark: int, body: bytes) -> _Entry:
+        entry = _Entry(watermark, time.monotonic() + self.ttl, body, '"%s"' % hashlib.sha1(body).hexdigest())
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def respond(self, request: Request, db: Session, compute: Callable[[], BaseModel]) -> Response:
+        """Serve from cache (304 when ``If-None-Match`` matches) or compute, store and serve."""
+        key = self.key_for(request)
+        watermark = current_watermark(db)
+        entry = self.get(key, watermark)
+        if entry is None:
+            entry = self.put(key, watermark, compute().model_dump_json().encode())
+        headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+        if entry.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
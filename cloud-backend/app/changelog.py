@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from typing import Any, Iterable, Union
+
+from sqlalchemy import delete, event, func, insert, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .models import ChangeLog, Customer, Product
+
+# Catalog rows are logged by external_id, which is how clients match them;
+# rows without one cannot be matched and are left out.
+ENTITIES = {"product": Product, "customer": Customer}
+IN_CHUNK_SIZE = 500
+
+# Any constant works; it only has to be the same for every writer
+_PG_LOCK_KEY = 0x5EC0
+
+
+def record_changes(db: Union[Session, Connection], entity: str, external_ids: Iterable[str | None], op: str = "upsert") -> None:
+    """Append change entries inside the caller's transaction."""
+    ids = list(dict.fromkeys(i for i in external_ids if i))
+    if not ids:
+        return
+    dialect = db.get_bind().dialect.name if isinstance(db, Session) else db.dialect.name
+    if dialect == "postgresql":
+        # Sequence values are handed out at insert time but become visible at commit.
+        # Serialize log writers so a reader never sees seq N+1 before N and skips N.
+        # (SQLite already allows a single writer at a time.)
+        db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _PG_LOCK_KEY})
+    db.execute(insert(ChangeLog), [{"entity": entity, "external_id": i, "op": op} for i in ids])
+
+
+def fetch_changes(db: Session, after_seq: int, limit: int) -> tuple[dict[str, list[Any]], list[tuple[str, str]], int, bool]:
+    """Entries after ``after_seq`` in sequence order, resolved to current rows.
+
+    Returns ({entity: [row, ...]}, [(entity, external_id) deleted], last_seq, has_more).
+    A row changed several times within the page is returned once.
+    """
+    entries = db.execute(
+        select(ChangeLog.seq, ChangeLog.entity, ChangeLog.external_id, ChangeLog.op)
+        .where(ChangeLog.seq > after_seq)
+        .order_by(ChangeLog.seq)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    latest: dict[tuple[str, str], str] = {}
+    for _, entity, ext, op in entries:
+        latest.pop((entity, ext), None)
+        latest[(entity, ext)] = op
+
+    rows: dict[str, list[Any]] = {entity: [] for entity in ENTITIES}
+    for entity, model in ENTITIES.items():
+        ids = [ext for (e, ext), op in latest.items() if e == entity and op == "upsert"]
+        for i in range(0, len(ids), IN_CHUNK_SIZE):
+            rows[entity].extend(db.execute(select(model).where(model.external_id.in_(ids[i:i + IN_CHUNK_SIZE]))).scalars())
+    deleted = [key for key, op in latest.items() if op == "delete"]
+    last_seq = entries[-1].seq if entries else after_seq
+    return rows, deleted, last_seq, has_more
+
+
+def compact_change_log(db: Session) -> int:
+    """Drop entries superseded by a newer one for the same row; returns rows removed.
+
+    Safe for every client position: a client after any seq still receives the
+    newest entry of each row changed since.
+    """
+    newest = select(func.max(ChangeLog.seq)).group_by(ChangeLog.entity, ChangeLog.external_id)
+    return db.execute(delete(ChangeLog).where(ChangeLog.seq.not_in(newest))).rowcount
+
+
+def backfill_change_log(conn: Connection) -> None:
+    """Seed the log with one entry per existing catalog row, oldest change first within each entity."""
+    if conn.execute(select(ChangeLog.seq).limit(1)).first() is not None:
+        return
+    for entity, model in ENTITIES.items():
+        rows = conn.execute(
+            select(model.external_id, model.updated_at).where(model.external_id.is_not(None)).order_by(model.updated_at, model.id)
+        ).all()
+        if rows:
+            conn.execute(insert(ChangeLog), [{"entity": entity, "external_id": ext, "op": "upsert", "created_at": ts} for ext, ts in rows])
+
+
+# ORM writes (admin edits and scripts) are logged here; the bulk upload path
+# bypasses mapper events and calls record_changes itself.
+def _listen(entity: str, model) -> None:
+    @event.listens_for(model, "after_insert")
+    @event.listens_for(model, "after_update")
+    def _upserted(mapper, connection, target) -> None:
+        record_changes(connection, entity, [target.external_id])
+
+    @event.listens_for(model, "after_delete")
+    def _deleted(mapper, connection, target) -> None:
+        record_changes(connection, entity, [target.external_id], op="delete")
+
+
+for _entity, _model in ENTITIES.items():
+    _listen(_entity, _model)
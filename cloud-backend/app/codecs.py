@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import gzip
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .models import SyncDictionary
+
+try:
+    import zstandard
+except Exception:  # pragma: no cover - optional at runtime
+    zstandard = None  # type: ignore
+
+# Codecs this server can decode, advertised to clients through /sync/download.
+# ``zstd-dict`` uses a dictionary trained on past uploads (same keys, SKUs and
+# agent codes in every row), which pays off most on small batches.
+CODECS: tuple[str, ...] = ("identity", "gzip") + (("zstd", "zstd-dict") if zstandard is not None else ())
+ZSTD_LEVEL = 3
+DICT_SIZE = 32 * 1024
+MAX_PLAINTEXT_BYTES = 256 * 1024 * 1024
+
+# Dictionaries never change once stored, so they are cached by version for good
+_dicts: dict[int, bytes] = {}
+
+
+def current_dictionary_id(db: Session) -> Optional[int]:
+    return db.execute(select(SyncDictionary.id).order_by(SyncDictionary.id.desc()).limit(1)).scalar()
+
+
+def load_dictionary(db: Session, dict_id: int) -> bytes:
+    data = _dicts.get(dict_id)
+    if data is None:
+        data = db.execute(select(SyncDictionary.data).where(SyncDictionary.id == dict_id)).scalar()
+        if data is None:
+            raise ValueError(f"Unknown dictionary {dict_id}")
+        _dicts[dict_id] = data
+    return data
+
+
+def save_dictionary(db: Session, data: bytes) -> int:
+    row = SyncDictionary(data=data)
+    db.add(row)
+    db.flush()
+    return row.id
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = DICT_SIZE) -> bytes:
+    if zstandard is None:
+        raise RuntimeError("zstandard not installed. Install to train sync dictionaries.")
+    return zstandard.train_dictionary(size, list(samples)).as_bytes()
+
+
+def _zstd(zdict: Optional[bytes]):
+    if zstandard is None:
+        raise ValueError("zstd codec not available on this server")
+    return _prepared(zdict) if zdict else None
+
+
+@lru_cache(maxsize=8)
+def _prepared(zdict: bytes):
+    # Parsing and digesting a dictionary costs more than compressing a small batch
+    d = zstandard.ZstdCompressionDict(zdict)
+    d.precompute_compress(level=ZSTD_LEVEL)
+    return d
+
+
+def compress(data: bytes, codec: str, zdict: Optional[bytes] = None) -> bytes:
+    if codec == "identity":
+        return data
+    if codec == "gzip":
+        return gzip.compress(data)
+    if codec in ("zstd", "zstd-dict"):
+        dict_data = _zstd(zdict)
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data).compress(data)
+    raise ValueError(f"Unsupported codec {codec!r}")
+
+
+def decompress(data: bytes, codec: str, zdict: Optional[bytes] = None) -> bytes:
+    """Inverse of ``compress``; raises ValueError for codecs this server cannot decode."""
+    if codec == "identity":
+        return data
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "zstd-dict" and not zdict:
+        raise ValueError("zstd-dict requires dict_id")
+    if codec in ("zstd", "zstd-dict"):
+        dict_data = _zstd(zdict)
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data, max_output_size=MAX_PLAINTEXT_BYTES)
+    raise ValueError(f"Unsupported codec {codec!r}")
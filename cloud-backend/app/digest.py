@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from bisect import bisect_left
+from typing import Any, NamedTuple, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .changelog import ENTITIES, IN_CHUNK_SIZE
+from .models import ChangeLog
+
+# Merkle-style consistency check between a device and the server. Each live
+# catalog row (external_id set, not soft-deleted) hashes to 16 bytes; a range of
+# external_ids [lo, hi) digests to the hash of its row hashes in external_id
+# order. The server splits a range into FANOUT children of equal row count, so
+# a client comparing level by level only descends into ranges that differ and
+# fetches rows once a range is down to LEAF_ROWS.
+#
+# The row encoding covers the fields every client stores and must match
+# ``row_hash`` in the desktop client's services/sync_pull.py byte for byte.
+FANOUT = 16
+MAX_FANOUT = 64
+LEAF_ROWS = 256
+# More changed rows than this since the cached digest and it is rebuilt from scratch
+MAX_DELTA_ROWS = 5000
+
+_FIELDS = {
+    "product": lambda r: (r.external_id, r.name, f"{float(r.price):.2f}", str(int(r.stock)), r.updated_at.isoformat()),
+    "customer": lambda r: (r.external_id, r.name, r.email or "", r.phone or "", r.updated_at.isoformat()),
+}
+
+
+def row_hash(fields: tuple[str, ...]) -> bytes:
+    return hashlib.blake2b("\x1f".join(fields).encode("utf-8"), digest_size=16).digest()
+
+
+class DigestRange(NamedTuple):
+    lo: str
+    hi: str  # exclusive; "" = unbounded
+    count: int
+    digest: str
+
+
+class CatalogDigest:
+    """Sorted external_ids of one entity with their row hashes."""
+
+    def __init__(self, rows: list[tuple[str, bytes]]) -> None:
+        rows.sort()
+        self.ids = [r[0] for r in rows]
+        self.hashes = [r[1] for r in rows]
+
+    def updated(self, changes: dict[str, Optional[bytes]]) -> CatalogDigest:
+        """A copy with ``changes`` applied: a hash adds or replaces the row, None removes it.
+
+        Requests may still be reading this digest, so it is never modified in place.
+        """
+        out = CatalogDigest([])
+        out.ids, out.hashes = list(self.ids), list(self.hashes)
+        for ext, h in changes.items():
+            i = bisect_left(out.ids, ext)
+            present = i < len(out.ids) and out.ids[i] == ext
+            if h is None:
+                if present:
+                    del out.ids[i], out.hashes[i]
+            elif present:
+                out.hashes[i] = h
+            else:
+                out.ids.insert(i, ext)
+                out.hashes.insert(i, h)
+        return out
+
+    def _span(self, lo: str, hi: str) -> tuple[int, int]:
+        return bisect_left(self.ids, lo), bisect_left(self.ids, hi) if hi else len(self.ids)
+
+    def range(self, lo: str, hi: str) -> DigestRange:
+        i, j = self._span(lo, hi)
+        return DigestRange(lo, hi, j - i, hashlib.blake2b(b"".join(self.hashes[i:j]), digest_size=16).hexdigest())
+
+    def children(self, lo: str, hi: str, fanout: int = FANOUT) -> list[DigestRange]:
+        """Split [lo, hi) into up to ``fanout`` ranges of about equal row count."""
+        i, j = self._span(lo, hi)
+        if j - i <= LEAF_ROWS:
+            return []
+        bounds = [lo] + [self.ids[i + k * (j - i) // fanout] for k in range(1, fanout)] + [hi]
+        return [self.range(a, b) for a, b in zip(bounds, bounds[1:]) if a != b]
+
+    def external_ids(self, lo: str, hi: str) -> list[str]:
+        i, j = self._span(lo, hi)
+        return self.ids[i:j]
+
+
+class DigestCache:
+    """Per-entity ``CatalogDigest`` kept in step with the change log.
+
+    When the log has moved on, only the rows logged since the cached seq are
+    re-read and re-hashed and applied to a copy of the digest (O(catalog) list
+    copy, O(changes) queries and hashing). A large backlog of changes, or a
+    cold cache, rebuilds from a full scan.
+    """
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[int, CatalogDigest]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, entity: str) -> CatalogDigest:
+        seq = db.execute(select(func.max(ChangeLog.seq))).scalar() or 0
+        with self._lock:
+            cached = self._data.get(entity)
+        if cached is not None and cached[0] == seq:
+            return cached[1]
+        digest = None
+        if cached is not None and cached[0] < seq:
+            digest = _apply_changes(db, entity, cached[0], cached[1])
+        if digest is None:
+            digest = build_digest(db, entity)
+        with self._lock:
+            current = self._data.get(entity)
+            if current is None or current[0] < seq:
+                self._data[entity] = (seq, digest)
+        return digest
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+def _apply_changes(db: Session, entity: str, after_seq: int, digest: CatalogDigest) -> Optional[CatalogDigest]:
+    """``digest`` brought forward past ``after_seq``, or None if too much changed to be worth it."""
+    ids = db.execute(
+        select(ChangeLog.external_id).where(ChangeLog.entity == entity, ChangeLog.seq > after_seq).distinct().limit(MAX_DELTA_ROWS + 1)
+    ).scalars().all()
+    if len(ids) > MAX_DELTA_ROWS:
+        return None
+    model = ENTITIES[entity]
+    fields = _FIELDS[entity]
+    changes: dict[str, Optional[bytes]] = dict.fromkeys(ids)  # not found = hard-deleted
+    for i in range(0, len(ids), IN_CHUNK_SIZE):
+        for r in db.execute(select(model).where(model.external_id.in_(ids[i:i + IN_CHUNK_SIZE]))).scalars():
+            changes[r.external_id] = row_hash(fields(r)) if r.deleted_at is None else None
+    return digest.updated(changes)
+
+
+def build_digest(db: Session, entity: str) -> CatalogDigest:
+    model = ENTITIES[entity]
+    fields = _FIELDS[entity]
+    q = select(model).where(model.external_id.is_not(None), model.deleted_at.is_(None)).execution_options(yield_per=5000)
+    return CatalogDigest([(r.external_id, row_hash(fields(r))) for r in db.execute(q).scalars()])
+
+
+digests = DigestCache()
+
+
+def range_rows(db: Session, entity: str, external_ids: list[str]) -> list[Any]:
+    """Live rows for ``external_ids`` in that order (ranges are resolved on the digest,
+    so the database collation never decides what falls inside one)."""
+    model = ENTITIES[entity]
+    found: dict[str, Any] = {}
+    for i in range(0, len(external_ids), IN_CHUNK_SIZE):
+        chunk = external_ids[i:i + IN_CHUNK_SIZE]
+        found.update((r.external_id, r) for r in db.execute(select(model).where(model.external_id.in_(chunk))).scalars())
+    return [found[ext] for ext in external_ids if ext in found]
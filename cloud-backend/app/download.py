@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Iterator, Optional
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from .models import Product, Customer
+from .schemas import ProductIn, CustomerIn
+
+MAX_PAGE_SIZE = 5000
+STREAM_CHUNK = 1000
+
+# Cursor keys per entity: absent = not started, [ts, id] = resume after, None = exhausted
+_ENTITIES = (("p", Product), ("c", Customer))
+
+
+def encode_cursor(state: dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict[str, Any]:
+    """Inverse of ``encode_cursor``; raises ValueError on anything malformed."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(state, dict) or not set(state) <= {"p", "c"}:
+        raise ValueError("Invalid cursor")
+    return state
+
+
+def product_out(p: Product) -> ProductIn:
+    return ProductIn(external_id=p.external_id, name=p.name, category=p.category, price=float(p.price), cost_price=float(p.cost_price or 0), stock=p.stock, updated_at=p.updated_at, deleted_at=p.deleted_at)
+
+
+def customer_out(c: Customer) -> CustomerIn:
+    return CustomerIn(external_id=c.external_id, name=c.name, email=c.email, phone=c.phone, updated_at=c.updated_at, deleted_at=c.deleted_at)
+
+
+def _keyset(model, since: datetime, after: Optional[list]):
+    """Rows changed after ``since``, ordered by (updated_at, id), strictly past ``after``."""
+    q = select(model).where(model.updated_at > since)
+    if after:
+        ts, row_id = datetime.fromisoformat(after[0]), int(after[1])
+        q = q.where(or_(model.updated_at > ts, and_(model.updated_at == ts, model.id > row_id)))
+    return q.order_by(model.updated_at, model.id)
+
+
+def fetch_page(db: Session, since: datetime, cursor: Optional[str], limit: int) -> tuple[list[ProductIn], list[CustomerIn], Optional[str]]:
+    """One page of at most ``limit`` products and ``limit`` customers plus the cursor for the next page."""
+    state = decode_cursor(cursor) if cursor else {}
+    out: dict[str, list] = {"p": [], "c": []}
+    next_state: dict[str, Any] = {}
+    for key, model in _ENTITIES:
+        if key in state and state[key] is None:
+            next_state[key] = None
+            continue
+        rows = db.execute(_keyset(model, since, state.get(key)).limit(limit + 1)).scalars().all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        out[key] = rows
+        if more:
+            last = rows[-1]
+            next_state[key] = [last.updated_at.isoformat(), last.id]
+        else:
+            next_state[key] = None
+    products = [product_out(p) for p in out["p"]]
+    customers = [customer_out(c) for c in out["c"]]
+    has_more = any(v is not None for v in next_state.values())
+    return products, customers, encode_cursor(next_state) if has_more else None
+
+
+def stream_ndjson(session_factory, since: datetime, server_time: datetime) -> Iterator[bytes]:
+    """Yield every change as one JSON object per line, then an ``end`` record.
+
+    Walks each table with keyset chunks in its own session, so memory stays
+    bounded by ``STREAM_CHUNK`` rows however large the catalog is.
+    """
+    with session_factory() as db:
+        for kind, model, convert in (("product", Product, product_out), ("customer", Customer, customer_out)):
+            after = None
+            while True:
+                rows = db.execute(_keyset(model, since, after).limit(STREAM_CHUNK)).scalars().all()
+                if not rows:
+                    break
+                yield b"".join(
+                    b'{"type":"%s","data":%s}\n' % (kind.encode(), convert(r).model_dump_json().encode()) for r in rows
+                )
+                after = [rows[-1].updated_at.isoformat(), rows[-1].id]
+                db.expunge_all()
+    yield json.dumps({"type": "end", "server_time": server_time.isoformat()}).encode() + b"\n"
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import itertools
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from .models import UploadBatch
+
+IDEMPOTENCY_RETENTION_HOURS = 72  # longer than any client keeps retrying a batch
+PURGE_EVERY = 1000
+
+_recorded = itertools.count(1)
+
+
+def stored_response(db: Session, agent_code: str, key: str) -> Optional[bytes]:
+    return db.execute(select(UploadBatch.response).where(UploadBatch.agent_code == agent_code, UploadBatch.key == key)).scalar()
+
+
+def record_response(db: Session, agent_code: str, key: str, response: bytes) -> None:
+    """Stage the batch key with its response in the caller's transaction, so both commit with the ingest."""
+    db.add(UploadBatch(agent_code=agent_code, key=key, response=response))
+    if next(_recorded) % PURGE_EVERY == 0:
+        purge_expired(db)
+
+
+def purge_expired(db: Session, older_than_hours: int = IDEMPOTENCY_RETENTION_HOURS) -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    return db.execute(delete(UploadBatch).where(UploadBatch.created_at < cutoff)).rowcount
@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import zlib
+from collections import Counter
+from datetime import datetime
+from typing import Any, Iterable, Optional, Union
+
+from sqlalchemy import Column, insert, select, update
+from sqlalchemy.orm import Session
+
+from .bloom import known_sales
+from .cache import bump_watermark
+from .changelog import record_changes
+from .db import dialect_insert
+from .codecs import decompress, load_dictionary
+from .metrics import SALE_ID_LOOKUPS, UPLOAD_BATCH_SIZE, UPSERTS
+from .models import Product, Customer, Sale, SaleItem
+from .rollups import add_sales_to_heatmap, add_sales_to_rollup
+from .schemas import EncryptedPayload, SaleIn, SyncUploadBody, SyncUploadResponse, SyncUploadSummary, UpsertResult
+from .security import SegmentDecryptor, aesgcm_decrypt, aesgcm_decrypt_frame
+
+# Keep IN lists well below SQLite's bound-parameter limit (999 on older builds)
+IN_CHUNK_SIZE = 500
+
+PRODUCT_FIELDS = ("name", "category", "price", "cost_price", "stock", "updated_at", "deleted_at")
+CUSTOMER_FIELDS = ("name", "email", "phone", "updated_at", "deleted_at")
+
+# Streamed uploads: rows per ingest_batch call, longest accepted NDJSON record,
+# and the most inflated bytes produced from one decompress call
+STREAM_BATCH_ROWS = 1000
+MAX_RECORD_BYTES = 1 << 20
+INFLATE_STEP = 256 * 1024
+# The sealed body is spooled before ingest (in memory up to the first limit,
+# then a temp file). The cap bounds how long one upload holds the write lock.
+STREAM_MAX_BYTES = int(os.getenv("STREAM_MAX_BYTES", str(256 * 1024 * 1024)))
+STREAM_SPOOL_MEMORY_BYTES = 1 << 20
+STREAM_READ_BYTES = 64 * 1024
+_RECORD_LISTS = {"product": "products", "customer": "customers", "sale": "sales"}
+
+
+def _chunks(items: list[Any], size: int = IN_CHUNK_SIZE) -> Iterable[list[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _prefetch(db: Session, key: Column, cols: list[Column], ids: Iterable[str | None]) -> dict[str, tuple]:
+    """Load existing rows for ``ids`` with chunked IN queries, keyed by external_id."""
+    wanted = sorted({i for i in ids if i})
+    found: dict[str, tuple] = {}
+    for chunk in _chunks(wanted):
+        for row in db.execute(select(key, *cols).where(key.in_(chunk))):
+            found[row[0]] = tuple(row[1:])
+    return found
+
+
+def _upsert_catalog(db: Session, model, rows: list, fields: tuple[str, ...], kind: str, results: list[UpsertResult]) -> None:
+    """Last-writer-wins upsert on ``updated_at`` for products/customers.
+
+    Decisions are made in memory against a prefetched id/updated_at map, so the
+    database sees one chunked SELECT plus one executemany per statement type.
+    Duplicate external_ids inside a batch resolve against each other. New rows
+    go through ``INSERT ... ON CONFLICT DO UPDATE ... WHERE newer``, so a row
+    another upload created after the prefetch is resolved by ``updated_at``
+    instead of failing the unique constraint; if the stored row is newer, the
+    result is ``skipped``.
+    """
+    existing = _prefetch(db, model.external_id, [model.id, model.updated_at], (r.external_id for r in rows))
+    inserts: dict[str, dict] = {}
+    slots: dict[str, int] = {}
+    anonymous: list[dict] = []
+    updates: dict[int, dict] = {}
+
+    for r in rows:
+        values = {f: getattr(r, f) for f in fields}
+        ext = r.external_id
+        if not ext:
+            anonymous.append({"external_id": None, **values})
+            status = "inserted"
+        elif ext in inserts:
+            if r.updated_at > inserts[ext]["updated_at"]:
+                inserts[ext].update(values)
+            status = "inserted"
+        elif ext in existing:
+            row_id, updated_at = existing[ext]
+            if r.updated_at > updated_at:
+                updates[row_id] = {"id": row_id, **values}
+                existing[ext] = (row_id, r.updated_at)
+                status = "updated"
+            else:
+                status = "skipped"
+        else:
+            inserts[ext] = {"external_id": ext, **values}
+            slots[ext] = len(results)
+            status = "inserted"
+        results.append(UpsertResult.model_construct(type=kind, external_id=ext or "", status=status))
+
+    if inserts:
+        stmt = dialect_insert(db, model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["external_id"],
+            set_={f: stmt.excluded[f] for f in fields},
+            where=model.updated_at < stmt.excluded.updated_at,
+        ).returning(model.external_id)
+        written = set(db.execute(stmt, list(inserts.values())).scalars())
+        for ext in inserts.keys() - written:
+            results[slots[ext]] = UpsertResult.model_construct(type=kind, external_id=ext, status="skipped")
+    if anonymous:
+        db.execute(insert(model), anonymous)
+    if updates:
+        db.execute(update(model), list(updates.values()))
+
+
+def _insert_sales(db: Session, body: SyncUploadBody, results: list[UpsertResult]) -> list[SaleIn]:
+    """Insert new sales and their items; sales already on the server are reported as ``exists``.
+
+    Sale ids come back from one ``INSERT ... RETURNING`` executemany and are matched
+    to items by external_id, so there is no flush per sale. SQLite cannot guarantee
+    RETURNING order for batched inserts, hence the mapping instead of ``zip``.
+    Only ids the ``known_sales`` Bloom filter may have seen are looked up first.
+    """
+    ids = [s.external_id for s in body.sales if s.external_id]
+    maybe = known_sales.maybe_known(db, ids)
+    SALE_ID_LOOKUPS.inc(len(ids) - len(maybe), verdict="absent")
+    SALE_ID_LOOKUPS.inc(len(maybe), verdict="maybe")
+    existing = _prefetch(db, Sale.external_id, [Sale.id], maybe)
+    keyed: dict[str, SaleIn] = {}
+    slots: dict[str, int] = {}
+    anonymous = []
+    for s in body.sales:
+        ext = s.external_id
+        if not ext:
+            anonymous.append(s)
+            status = "inserted"
+        elif ext in existing or ext in keyed:
+            status = "exists"
+        else:
+            keyed[ext] = s
+            slots[ext] = len(results)
+            status = "inserted"
+        results.append(UpsertResult.model_construct(type="sale", external_id=ext or "", status=status))
+
+    sale_ids: list[tuple[int, Any]] = []
+    if keyed:
+        # ON CONFLICT DO NOTHING: the filter only knows this process's inserts, so a
+        # sale another worker stored meanwhile is skipped here rather than failing the batch
+        stmt = dialect_insert(db, Sale).on_conflict_do_nothing(index_elements=["external_id"]).returning(Sale.id, Sale.external_id)
+        sale_ids.extend((sale_id, keyed.pop(ext)) for sale_id, ext in db.execute(stmt, [_sale_row(s) for s in keyed.values()]))
+        for ext in keyed:
+            results[slots[ext]] = UpsertResult.model_construct(type="sale", external_id=ext, status="exists")
+        known_sales.add(s.external_id for _, s in sale_ids)
+    for s in anonymous:
+        # Clients always send external_ids; keep the legacy path for the odd row without one
+        sale_ids.append((db.scalar(insert(Sale).returning(Sale.id), [_sale_row(s)]), s))
+
+    item_rows = [
+        {"sale_id": sale_id, "product_external_id": it.product_external_id, "quantity": it.quantity, "price": it.price}
+        for sale_id, s in sale_ids
+        for it in s.items
+    ]
+    if item_rows:
+        db.execute(insert(SaleItem), item_rows)
+    return [s for _, s in sale_ids]
+
+
+def _sale_row(s) -> dict[str, Any]:
+    return {
+        "external_id": s.external_id,
+        "agent_code": s.agent_code,
+        "customer_external_id": s.customer_external_id,
+        "created_at": s.created_at,
+        "updated_at": s.updated_at,
+    }
+
+
+def decrypt_upload(enc: EncryptedPayload, db: Optional[Session] = None) -> bytes:
+    """Decrypt an upload payload and decompress it to JSON bytes for ``parse_upload``.
+
+    ``db`` is only needed for ``zstd-dict`` payloads, to load the dictionary.
+    """
+    return decode_plaintext(aesgcm_decrypt(enc.nonce, enc.ciphertext, enc.tag), enc.codec, enc.dict_id, db)
+
+
+def decrypt_upload_frame(frame: bytes, codec: Optional[str] = None, dict_id: Optional[int] = None, db: Optional[Session] = None) -> bytes:
+    """Same as ``decrypt_upload`` for a binary ``nonce | ciphertext | tag`` frame."""
+    return decode_plaintext(aesgcm_decrypt_frame(frame), codec, dict_id, db)
+
+
+def decode_plaintext(raw: bytes, codec: Optional[str] = None, dict_id: Optional[int] = None, db: Optional[Session] = None) -> bytes:
+    if codec is None:
+        try:
+            return gzip.decompress(raw)
+        except Exception:
+            return raw
+    zdict = load_dictionary(db, dict_id) if dict_id is not None and db is not None else None
+    return decompress(raw, codec, zdict)
+
+
+def parse_upload(raw: bytes) -> SyncUploadBody:
+    """Parse and validate upload JSON in one pass, without building intermediate dicts."""
+    return SyncUploadBody.model_validate_json(raw)
+
+
+class UploadStreamReader:
+    """Segmented ciphertext in, ``SyncUploadBody`` batches out.
+
+    The plaintext is gzipped NDJSON, one ``{"type": "product"|"customer"|"sale", ...}``
+    record per line. Decryption, inflation and parsing are all incremental, so
+    memory is bounded by one segment, one record and one batch regardless of the
+    upload size. ``finish`` raises if the stream was cut short.
+    """
+
+    def __init__(self, batch_rows: int = STREAM_BATCH_ROWS) -> None:
+        self.batch_rows = batch_rows
+        self._decryptor = SegmentDecryptor()
+        self._inflate = zlib.decompressobj(wbits=31)
+        self._line = bytearray()
+        self._batch: dict[str, list] = {k: [] for k in _RECORD_LISTS.values()}
+        self._rows = 0
+
+    def feed(self, data: bytes) -> list[SyncUploadBody]:
+        out: list[SyncUploadBody] = []
+        for plaintext in self._decryptor.feed(data):
+            self._inflate_into(plaintext, out)
+        return out
+
+    def finish(self) -> list[SyncUploadBody]:
+        out: list[SyncUploadBody] = []
+        self._inflate_into(self._decryptor.finish(), out)
+        if not self._inflate.eof or self._inflate.unused_data:
+            raise ValueError("Malformed gzip stream")
+        if self._line.strip():
+            self._record(bytes(self._line), out)
+        self._line.clear()
+        if self._rows:
+            out.append(self._flush())
+        return out
+
+    def _inflate_into(self, data: bytes, out: list[SyncUploadBody]) -> None:
+        while data:
+            text = self._inflate.decompress(data, INFLATE_STEP)
+            data = self._inflate.unconsumed_tail
+            start = 0
+            while (end := text.find(b"\n", start)) != -1:
+                self._line += text[start:end]
+                self._record(bytes(self._line), out)
+                self._line.clear()
+                start = end + 1
+            self._line += text[start:]
+            if len(self._line) > MAX_RECORD_BYTES:
+                raise ValueError("Record too large")
+
+    def _record(self, line: bytes, out: list[SyncUploadBody]) -> None:
+        if len(line) > MAX_RECORD_BYTES:
+            raise ValueError("Record too large")
+        if not line.strip():
+            return
+        record = json.loads(line)
+        key = _RECORD_LISTS.get(record.pop("type", None)) if isinstance(record, dict) else None
+        if key is None:
+            raise ValueError("Unknown record type")
+        self._batch[key].append(record)
+        self._rows += 1
+        if self._rows >= self.batch_rows:
+            out.append(self._flush())
+
+    def _flush(self) -> SyncUploadBody:
+        body = SyncUploadBody(**self._batch)
+        self._batch = {k: [] for k in _RECORD_LISTS.values()}
+        self._rows = 0
+        return body
+
+
+# One-letter codes for SyncUploadSummary.status_rle
+STATUS_CODES = {"inserted": "I", "updated": "U", "exists": "E", "skipped": "S", "conflict": "C", "failed": "F"}
+ROUTINE_STATUSES = ("inserted", "updated", "exists")
+
+
+class ResultTally:
+    """Upload results folded in batch by batch for the chosen response mode.
+
+    Only ``full`` keeps every ``UpsertResult``; ``summary`` and ``rle`` keep
+    counts, the non-routine rows and the status runs, so a streamed upload
+    does not hold one object per row.
+    """
+
+    def __init__(self, mode: str = "full") -> None:
+        self.mode = mode
+        self.results: list[UpsertResult] = []
+        self.counts: Counter = Counter()
+        self.exceptions: list[UpsertResult] = []
+        self.runs: list[list] = []  # [code, length]
+
+    def add(self, results: list[UpsertResult]) -> None:
+        if self.mode == "full":
+            self.results += results
+            return
+        self.counts.update((r.type, r.status) for r in results)
+        self.exceptions += [r for r in results if r.status not in ROUTINE_STATUSES]
+        if self.mode == "rle":
+            for r in results:
+                code = STATUS_CODES.get(r.status, "?")
+                if self.runs and self.runs[-1][0] == code:
+                    self.runs[-1][1] += 1
+                else:
+                    self.runs.append([code, 1])
+
+    def response(self) -> Union[SyncUploadResponse, SyncUploadSummary]:
+        # Results are built by ingest from trusted values: skip re-validation
+        if self.mode == "full":
+            return SyncUploadResponse.model_construct(results=self.results, conflicts=[], server_time=datetime.utcnow())
+        counts: dict[str, dict[str, int]] = {}
+        for (entity, status), n in self.counts.items():
+            counts.setdefault(entity, {})[status] = n
+        status_rle = "".join(f"{n}{code}" for code, n in self.runs) if self.mode == "rle" else None
+        return SyncUploadSummary.model_construct(counts=counts, exceptions=self.exceptions, status_rle=status_rle, server_time=datetime.utcnow())
+
+
+def summarize_results(results: list[UpsertResult], rle: bool = False) -> SyncUploadSummary:
+    """Counts per entity and status plus the non-routine rows; optional run-length per-row status."""
+    tally = ResultTally("rle" if rle else "summary")
+    tally.add(results)
+    return tally.response()
+
+
+def ingest_batch(db: Session, body: SyncUploadBody, changes: Optional[list[tuple[str, str]]] = None) -> list[UpsertResult]:
+    """Apply an upload batch with set-based reads and writes. Caller commits.
+
+    Changed catalog rows go to the change log as the last write, because on
+    PostgreSQL that holds the log's advisory lock until commit. A caller that
+    ingests several batches in one transaction passes ``changes`` to collect
+    them instead, and calls ``record_catalog_changes`` just before committing.
+    """
+    UPLOAD_BATCH_SIZE.observe(len(body.products), entity="product")
+    UPLOAD_BATCH_SIZE.observe(len(body.customers), entity="customer")
+    UPLOAD_BATCH_SIZE.observe(len(body.sales), entity="sale")
+    results: list[UpsertResult] = []
+    _upsert_catalog(db, Product, body.products, PRODUCT_FIELDS, "product", results)
+    _upsert_catalog(db, Customer, body.customers, CUSTOMER_FIELDS, "customer", results)
+    new_sales = _insert_sales(db, body, results)
+    if new_sales:
+        catalog = _prefetch(db, Product.external_id, [Product.category, Product.cost_price], (it.product_external_id for s in new_sales for it in s.items))
+        add_sales_to_rollup(db, new_sales, catalog)
+        add_sales_to_heatmap(db, new_sales)
+    outcomes = Counter((r.type, r.status) for r in results)
+    for (entity, status), n in outcomes.items():
+        UPSERTS.inc(n, entity=entity, status=status)
+    if any(status in ("inserted", "updated") for _, status in outcomes):
+        bump_watermark(db)
+    changed = [(r.type, r.external_id) for r in results if r.type in ("product", "customer") and r.status in ("inserted", "updated")]
+    if changes is None:
+        record_catalog_changes(db, changed)
+    else:
+        changes.extend(changed)
+    return results
+
+
+def record_catalog_changes(db: Session, changed: list[tuple[str, str]]) -> None:
+    """Append (entity, external_id) pairs to the change log."""
+    for kind in ("product", "customer"):
+        record_changes(db, kind, (ext for entity, ext in changed if entity == kind))
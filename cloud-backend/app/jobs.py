@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import delete, or_, and_, select, update
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.orm import Session
+
+from .ingest import decrypt_upload, ingest_batch, parse_upload
+from .models import IngestJob
+from .schemas import EncryptedPayload, SyncUploadResponse
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+JOB_POLL_SECONDS = 2.0
+JOB_LEASE_SECONDS = 600  # a running job older than this is assumed orphaned and re-queued
+JOB_MAX_ATTEMPTS = 3
+JOB_RETENTION_HOURS = 72
+
+logger = logging.getLogger(__name__)
+
+
+def submit_job(db: Session, enc: EncryptedPayload, agent_code: str) -> IngestJob:
+    """Durably spool an encrypted upload; it is decrypted later by a worker."""
+    job = IngestJob(id=uuid.uuid4().hex, agent_code=agent_code, status="queued", payload=enc.model_dump_json())
+    db.add(job)
+    db.commit()
+    return job
+
+
+def claim_next(db: Session) -> Optional[str]:
+    """Atomically move the oldest runnable job to ``running``; returns its id.
+
+    The claim is a conditional UPDATE, so several workers (or processes sharing
+    the database) never pick up the same job.
+    """
+    now = datetime.utcnow()
+    runnable = or_(
+        IngestJob.status == "queued",
+        and_(IngestJob.status == "running", IngestJob.claimed_at < now - timedelta(seconds=JOB_LEASE_SECONDS)),
+    )
+    candidates = db.execute(select(IngestJob.id).where(runnable).order_by(IngestJob.created_at).limit(8)).scalars().all()
+    for job_id in candidates:
+        res = db.execute(
+            update(IngestJob)
+            .where(IngestJob.id == job_id, runnable)
+            .values(status="running", claimed_at=now, attempts=IngestJob.attempts + 1)
+        )
+        db.commit()
+        if res.rowcount == 1:
+            return job_id
+    return None
+
+
+def _transient(e: Exception) -> bool:
+    """Worth another attempt: a locked database or a dropped connection.
+
+    Decrypt, auth-tag and validation failures come from the payload itself
+    and would fail the same way every time.
+    """
+    return isinstance(e, OperationalError) or (isinstance(e, DBAPIError) and e.connection_invalidated)
+
+
+def run_job(db: Session, job_id: str) -> None:
+    """Decrypt and ingest one job; the ingest and the job result commit together.
+
+    Transient database errors re-queue the job until JOB_MAX_ATTEMPTS; any
+    other error fails it straight away.
+    """
+    job = db.get(IngestJob, job_id)
+    if job is None or job.status != "running":
+        return
+    try:
+        body = parse_upload(decrypt_upload(EncryptedPayload.model_validate_json(job.payload or "{}"), db))
+        results = ingest_batch(db, body)
+        response = SyncUploadResponse.model_construct(results=results, conflicts=[], server_time=datetime.utcnow())
+        job.status = "done"
+        job.result = response.model_dump_json()
+        job.payload = None
+        job.error = None
+    except Exception as e:
+        db.rollback()
+        job = db.get(IngestJob, job_id)
+        job.error = f"{type(e).__name__}: {e}"
+        job.status = "queued" if _transient(e) and job.attempts < JOB_MAX_ATTEMPTS else "failed"
+    job.finished_at = datetime.utcnow() if job.status in ("done", "failed") else None
+    db.commit()
+
+
+def purge_finished(db: Session, older_than_hours: int = JOB_RETENTION_HOURS) -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    res = db.execute(delete(IngestJob).where(IngestJob.status.in_(("done", "failed")), IngestJob.finished_at < cutoff))
+    db.commit()
+    return res.rowcount
+
+
+class IngestWorkerPool:
+    """Background threads draining the ``ingest_jobs`` spool.
+
+    Workers poll the table, so jobs accepted before a restart are picked up
+    again; ``notify`` just skips the poll delay for freshly submitted jobs.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], workers: int = INGEST_WORKERS) -> None:
+        self.session_factory = session_factory
+        self.workers = workers
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        with self.session_factory() as db:
+            purge_finished(db)
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads.clear()
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                with self.session_factory() as db:
+                    job_id = claim_next(db)
+                    if job_id is not None:
+                        run_job(db, job_id)
+            except Exception:  # keep the worker alive; the lease re-queues the job
+                logger.exception("ingest worker error")
+                job_id = None
+            if job_id is None:
+                self._wake.wait(JOB_POLL_SECONDS)
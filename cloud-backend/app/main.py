@@ -1,72 +1,125 @@
 from __future__ import annotations
 
-import json
-import gzip
+import base64
+import math
+import tempfile
 import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Annotated, Callable
+from typing import Annotated, Callable, Optional, Union
 
-from fastapi import Depends, FastAPI, HTTPException, Request, Query
-from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response, Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy import select, func, extract
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from pydantic import ValidationError
 from jinja2 import Environment, PackageLoader, select_autoescape
 
-from .db import Base, engine, get_session
-from .models import Agent, Product, Customer, Sale, SaleItem
-from .security import create_access_token, verify_token, aesgcm_decrypt
+from .db import Base, SessionLocal, engine, get_session
+from .models import Product, Customer, Sale, IngestJob, DailySalesRollup
+from .ingest import STREAM_MAX_BYTES, STREAM_READ_BYTES, STREAM_SPOOL_MEMORY_BYTES, ResultTally, UploadStreamReader, decrypt_upload, decrypt_upload_frame, ingest_batch, parse_upload, record_catalog_changes
+from .changelog import fetch_changes
+from .digest import FANOUT, MAX_FANOUT, digests, range_rows
+from .download import MAX_PAGE_SIZE, customer_out, fetch_page, product_out, stream_ndjson
+from .jobs import IngestWorkerPool, submit_job
+from .idempotency import purge_expired, record_response, stored_response
+from .cache import ResponseCache
+from .codecs import CODECS, current_dictionary_id, load_dictionary
+from .accesslog import log_access
+from .metrics import HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUEST_BYTES, HTTP_RESPONSE_BYTES, REGISTRY
+from .migrate import migrate
+from .ratelimit import EXEMPT_PATHS, build_limiter, route_class
+from .rollups import heatmap_grid
+from .snapshot import SnapshotBuilder, latest_snapshot
+from .auth import AgentInfo, ensure_agent, lookup_agent
+from .security import create_access_token, verify_token
 from .schemas import (
     LoginRequest, TokenResponse, EncryptedPayload, SyncUploadBody, SyncUploadResponse,
-    UpsertResult, DownloadResponse, ProductIn, CustomerIn, TrendResponse, TrendPoint,
-    HeatmapResponse, CategoryPieResponse, CategoryPieSlice
+    JobAccepted, JobStatusResponse, DownloadResponse, DeletedRef, TrendResponse, TrendPoint,
+    HeatmapResponse, CategoryPieResponse, CategoryPieSlice, DigestRangeOut, DigestResponse, SyncDictionaryOut, SyncUploadSummary
 )
 
-app = FastAPI(title="Sales Tracker Cloud")
 Base.metadata.create_all(bind=engine)
+migrate(engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with SessionLocal() as db:
+        purge_expired(db)
+        db.commit()
+    pool = IngestWorkerPool(SessionLocal)
+    pool.start()
+    app.state.ingest_pool = pool
+    snapshots = SnapshotBuilder(SessionLocal)
+    snapshots.start()
+    try:
+        yield
+    finally:
+        snapshots.stop()
+        pool.stop()
+
+
+app = FastAPI(title="Sales Tracker Cloud", lifespan=lifespan)
 security = HTTPBearer()
 
 env = Environment(loader=PackageLoader("app"), autoescape=select_autoescape())
+analytics_cache = ResponseCache()
 
-# --- Middleware: simple request timing/logging ---
-@app.middleware("http")
-async def log_requests(request: Request, call_next: Callable):
-    start = time.time()
-    response = await call_next(request)
-    duration_ms = int((time.time() - start) * 1000)
-    path = request.url.path
-    method = request.method
-    try:
-        client_ip = request.client.host
-    except Exception:
-        client_ip = "-"
-    print(f"{method} {path} {response.status_code} {duration_ms}ms ip={client_ip}")
-    return response
+# --- Token-bucket rate limiting (per IP and route class) ---
+rate_limiter = build_limiter()
 
-# --- Naive in-memory rate limiting (per-IP, per minute) ---
-_rate: dict[str, tuple[int,int]] = {}
-RATE_LIMIT = 600  # requests/min per IP
 
 @app.middleware("http")
 async def rate_limit(request: Request, call_next: Callable):
+    path = request.url.path
+    if path in EXEMPT_PATHS:
+        return await call_next(request)
     ip = request.client.host if request.client else "-"
-    now_min = int(time.time() // 60)
-    count, window = _rate.get(ip, (0, now_min))
-    if window != now_min:
-        count, window = 0, now_min
-    count += 1
-    _rate[ip] = (count, window)
-    if count > RATE_LIMIT:
-        return PlainTextResponse("Too Many Requests", status_code=429)
+    if rate_limiter.blocking:
+        allowed, retry_after = await run_in_threadpool(rate_limiter.hit, route_class(path), ip)
+    else:
+        allowed, retry_after = rate_limiter.hit(route_class(path), ip)
+    if not allowed:
+        return PlainTextResponse("Too Many Requests", status_code=429, headers={"Retry-After": str(math.ceil(retry_after))})
     return await call_next(request)
 
 
-def get_current_agent(creds: Annotated[HTTPAuthorizationCredentials, Depends(security)], db: Session) -> Agent:
+# --- Metrics + access log (registered last, so it wraps everything including 429s) ---
+@app.middleware("http")
+async def observe_requests(request: Request, call_next: Callable):
+    start = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+    response = None
+    try:
+        response = await call_next(request)
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        duration = time.perf_counter() - start
+        status = response.status_code if response is not None else 500
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_LATENCY.observe(duration, method=request.method, route=route, status=str(status))
+        HTTP_REQUEST_BYTES.inc(int(request.headers.get("content-length") or 0), route=route)
+        if response is not None:
+            HTTP_RESPONSE_BYTES.inc(int(response.headers.get("content-length") or 0), route=route)
+        log_access({
+            "method": request.method, "path": request.url.path, "route": route, "status": status,
+            "ms": round(duration * 1000, 1), "ip": request.client.host if request.client else "-",
+        })
+
+
+def get_current_agent(creds: Annotated[HTTPAuthorizationCredentials, Depends(security)], db: Session = Depends(get_session)) -> AgentInfo:
+    """Resolve the bearer token to its agent; a warm token costs no DB round trip."""
     payload = verify_token(creds.credentials)
     code = payload.get("sub")
     if not code:
         raise HTTPException(status_code=401, detail="Invalid token payload")
-    agent = db.execute(select(Agent).where(Agent.code == code)).scalar_one_or_none()
+    agent = lookup_agent(db, code)
     if not agent:
         raise HTTPException(status_code=401, detail="Unknown agent")
     return agent
@@ -78,6 +131,11 @@ def require_admin(creds: Annotated[HTTPAuthorizationCredentials, Depends(securit
         raise HTTPException(status_code=403, detail="Admins only")
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/healthz")
 def healthz() -> dict:
     return {"ok": True, "ts": datetime.utcnow().isoformat()}
@@ -85,147 +143,310 @@ def healthz() -> dict:
 
 @app.post("/auth/login", response_model=TokenResponse)
 def login(body: LoginRequest, db: Session = Depends(get_session)):
-    agent = db.execute(select(Agent).where(Agent.code == body.agent_code)).scalar_one_or_none()
-    if not agent:
-        agent = Agent(code=body.agent_code, password_hash="demo")
-        db.add(agent)
-        db.commit()
+    agent = ensure_agent(db, body.agent_code)
     token = create_access_token({"sub": agent.code})
     return TokenResponse(access_token=token)
 
 
-@app.post("/sync/upload", response_model=SyncUploadResponse)
-def sync_upload(enc: EncryptedPayload, db: Session = Depends(get_session), creds: HTTPAuthorizationCredentials = Depends(security)):
-    verify_token(creds.credentials)
+# ?response=full (default, one result per row) | summary | rle (summary + per-row run-length status)
+ResponseMode = Annotated[str, Query(alias="response", pattern="^(full|summary|rle)$")]
+UploadResponse = Union[SyncUploadResponse, SyncUploadSummary]
+# Client-chosen batch id; a retry with the same key gets the stored response instead of a re-ingest
+IdempotencyKey = Annotated[Optional[str], Header(alias="Idempotency-Key", max_length=64)]
+
+
+@app.post("/sync/upload", response_model=UploadResponse)
+def sync_upload(enc: EncryptedPayload, mode: ResponseMode = "full", key: IdempotencyKey = None, db: Session = Depends(get_session), agent: AgentInfo = Depends(get_current_agent)):
+    replay = _replay(db, agent.code, key)
+    if replay is not None:
+        return replay
     try:
-        raw = aesgcm_decrypt(enc.nonce, enc.ciphertext, enc.tag)
-        try:
-            data = json.loads(gzip.decompress(raw).decode("utf-8"))
-        except Exception:
-            data = json.loads(raw.decode("utf-8"))
+        raw = decrypt_upload(enc, db)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Decryption failed: {e}")
 
-    body = SyncUploadBody(**data)
-    results: list[UpsertResult] = []
-    conflicts: list[str] = []
-
-    for p in body.products:
-        existing = db.execute(select(Product).where(Product.external_id == p.external_id)).scalar_one_or_none() if p.external_id else None
-        if existing:
-            if p.updated_at > existing.updated_at:
-                existing.name = p.name
-                existing.category = p.category
-                existing.price = p.price
-                existing.cost_price = p.cost_price
-                existing.stock = p.stock
-                existing.updated_at = p.updated_at
-                existing.deleted_at = p.deleted_at
-                status = "updated"
-            else:
-                status = "skipped"
-        else:
-            row = Product(
-                external_id=p.external_id, name=p.name, category=p.category, price=p.price, cost_price=p.cost_price,
-                stock=p.stock, updated_at=p.updated_at, deleted_at=p.deleted_at
-            )
-            db.add(row)
-            status = "inserted"
-        results.append(UpsertResult(type="product", external_id=p.external_id or "", status=status))
-
-    for c in body.customers:
-        existing = db.execute(select(Customer).where(Customer.external_id == c.external_id)).scalar_one_or_none() if c.external_id else None
-        if existing:
-            if c.updated_at > existing.updated_at:
-                existing.name = c.name
-                existing.email = c.email
-                existing.phone = c.phone
-                existing.updated_at = c.updated_at
-                existing.deleted_at = c.deleted_at
-                status = "updated"
-            else:
-                status = "skipped"
-        else:
-            row = Customer(
-                external_id=c.external_id, name=c.name, email=c.email, phone=c.phone,
-                updated_at=c.updated_at, deleted_at=c.deleted_at
-            )
-            db.add(row)
-            status = "inserted"
-        results.append(UpsertResult(type="customer", external_id=c.external_id or "", status=status))
-
-    for s in body.sales:
-        existing = db.execute(select(Sale).where(Sale.external_id == s.external_id)).scalar_one_or_none() if s.external_id else None
-        if existing:
-            status = "exists"
-        else:
-            sale = Sale(
-                external_id=s.external_id,
-                agent_code=s.agent_code,
-                customer_external_id=s.customer_external_id,
-                created_at=s.created_at,
-                updated_at=s.updated_at,
-            )
-            db.add(sale)
-            db.flush()
-            for it in s.items:
-                db.add(SaleItem(sale_id=sale.id, product_external_id=it.product_external_id, quantity=it.quantity, price=it.price))
-            status = "inserted"
-        results.append(UpsertResult(type="sale", external_id=s.external_id or "", status=status))
-
-    db.commit()
-    return SyncUploadResponse(results=results, conflicts=conflicts, server_time=datetime.utcnow())
+    return _apply_upload(db, raw, mode, agent.code, key)
 
 
-@app.get("/sync/download", response_model=DownloadResponse)
-def sync_download(since: str, db: Session = Depends(get_session), creds: HTTPAuthorizationCredentials = Depends(security)):
-    verify_token(creds.credentials)
+@app.post("/sync/upload.bin", response_model=UploadResponse)
+async def sync_upload_bin(request: Request, mode: ResponseMode = "full", key: IdempotencyKey = None, db: Session = Depends(get_session), agent: AgentInfo = Depends(get_current_agent)):
+    """Binary upload: raw ``nonce(12) | ciphertext | tag(16)``, no base64 or JSON envelope.
+
+    The codec travels in ``X-Sync-Codec`` / ``X-Sync-Dict`` headers instead of envelope fields.
+    """
+    frame = await request.body()
+    codec = request.headers.get("x-sync-codec")
+    dict_id = request.headers.get("x-sync-dict")
+    # Decrypt and ingest off the event loop, like the sync endpoint
+    return await run_in_threadpool(_upload_frame, db, frame, codec, dict_id, mode, agent.code, key)
+
+
+def _upload_frame(db: Session, frame: bytes, codec: Optional[str], dict_id: Optional[str], mode: str, agent_code: str, key: Optional[str]) -> Response:
+    replay = _replay(db, agent_code, key)
+    if replay is not None:
+        return replay
     try:
-        since_dt = datetime.fromisoformat(since)
+        raw = decrypt_upload_frame(frame, codec, int(dict_id) if dict_id else None, db)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Decryption failed: {e}")
+    return _apply_upload(db, raw, mode, agent_code, key)
+
+
+@app.post("/sync/upload.stream", response_model=UploadResponse)
+async def sync_upload_stream(request: Request, mode: ResponseMode = "full", key: IdempotencyKey = None, db: Session = Depends(get_session), agent: AgentInfo = Depends(get_current_agent)):
+    """Segmented-AEAD upload of gzipped NDJSON, decrypted and ingested in batches.
+
+    The sealed body is spooled first (in memory up to STREAM_SPOOL_MEMORY_BYTES,
+    then to a temp file; at most STREAM_MAX_BYTES, else 413), so no database
+    transaction is open while the network is read. Ingest then runs in one
+    transaction that is only committed once the final segment has
+    authenticated: a truncated or tampered stream changes nothing, and the
+    write lock is held for local decrypt-and-ingest time only.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MEMORY_BYTES)
+    try:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > STREAM_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"Streamed upload exceeds {STREAM_MAX_BYTES} bytes")
+            spool.write(chunk)
+        spool.seek(0)
+        return await run_in_threadpool(_upload_spooled, db, spool, mode, agent.code, key)
+    finally:
+        spool.close()
+
+
+def _upload_spooled(db: Session, spool, mode: str, agent_code: str, key: Optional[str]) -> Response:
+    replay = _replay(db, agent_code, key)
+    if replay is not None:
+        return replay
+    reader = UploadStreamReader()
+    tally = ResultTally(mode)
+    # Logged once after the last batch, so the change-log lock is not held across batches
+    changes: list[tuple[str, str]] = []
+    while chunk := spool.read(STREAM_READ_BYTES):
+        for batch in _read_stream(reader.feed, chunk):
+            tally.add(ingest_batch(db, batch, changes))
+    for batch in _read_stream(reader.finish):
+        tally.add(ingest_batch(db, batch, changes))
+    record_catalog_changes(db, changes)
+    return _commit_upload(db, tally.response(), agent_code, key)
+
+
+def _read_stream(step: Callable, *args) -> list[SyncUploadBody]:
+    try:
+        return step(*args)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Decryption failed: {e}")
+
+
+def _apply_upload(db: Session, raw: bytes, mode: str, agent_code: str, key: Optional[str]) -> Response:
+    try:
+        body = parse_upload(raw)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    tally = ResultTally(mode)
+    tally.add(ingest_batch(db, body))
+    return _commit_upload(db, tally.response(), agent_code, key)
+
+
+def _commit_upload(db: Session, response: Union[SyncUploadResponse, SyncUploadSummary], agent_code: str, key: Optional[str]) -> Response:
+    # Serialize the constructed model directly, skipping the jsonable_encoder
+    # pass FastAPI would do for a model return value
+    content = response.model_dump_json().encode()
+    if key:
+        record_response(db, agent_code, key, content)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request with the same key committed first; ours is discarded
+        db.rollback()
+        replay = _replay(db, agent_code, key)
+        if replay is None:
+            raise
+        return replay
+    return Response(content=content, media_type="application/json")
+
+
+def _replay(db: Session, agent_code: str, key: Optional[str]) -> Optional[Response]:
+    stored = stored_response(db, agent_code, key) if key else None
+    if stored is None:
+        return None
+    return Response(content=stored, media_type="application/json", headers={"Idempotent-Replayed": "true"})
+
+
+@app.post("/sync/upload/async", response_model=JobAccepted, status_code=202)
+def sync_upload_async(enc: EncryptedPayload, request: Request, db: Session = Depends(get_session), agent: AgentInfo = Depends(get_current_agent)):
+    job = submit_job(db, enc, agent.code)
+    pool = getattr(request.app.state, "ingest_pool", None)
+    if pool is not None:
+        pool.notify()
+    return JobAccepted(job_id=job.id, status=job.status)
+
+
+@app.get("/sync/jobs/{job_id}", response_model=JobStatusResponse)
+def sync_job_status(job_id: str, db: Session = Depends(get_session), agent: AgentInfo = Depends(get_current_agent)):
+    job = db.get(IngestJob, job_id)
+    if not job or agent.code not in (job.agent_code, "admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    result = SyncUploadResponse.model_validate_json(job.result) if job.result else None
+    return JobStatusResponse(job_id=job.id, status=job.status, created_at=job.created_at, finished_at=job.finished_at, error=job.error, result=result)
+
+
+def _parse_since(since: str) -> datetime:
+    try:
+        return datetime.fromisoformat(since)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid 'since' timestamp")
-    prod = [ProductIn(external_id=p.external_id, name=p.name, category=p.category, price=float(p.price), cost_price=float(p.cost_price or 0), stock=p.stock, updated_at=p.updated_at, deleted_at=p.deleted_at) for p in db.execute(select(Product).where(Product.updated_at > since_dt)).scalars()]
-    cust = [CustomerIn(external_id=c.external_id, name=c.name, email=c.email, phone=c.phone, updated_at=c.updated_at, deleted_at=c.deleted_at) for c in db.execute(select(Customer).where(Customer.updated_at > since_dt)).scalars()]
-    return DownloadResponse(products=prod, customers=cust, server_time=datetime.utcnow())
+
+
+@app.get("/sync/download", response_model=DownloadResponse)
+def sync_download(
+    since: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after_seq: Optional[int] = Query(None, ge=0),
+    dict_id: Optional[int] = None,
+    db: Session = Depends(get_session),
+    agent: AgentInfo = Depends(get_current_agent),
+):
+    """Catalog changes, by change-log sequence (``after_seq``) or by timestamp (``since``).
+
+    ``after_seq`` is a primary-key range scan over ``change_log``: no clock
+    dependence, no re-sent ties, and hard deletes arrive as ``deleted``. Pass the
+    returned ``last_seq`` next time and repeat while ``has_more``.
+    """
+    server_time = datetime.utcnow()
+    compression = _compression_info(db, dict_id)
+    if after_seq is not None:
+        rows, deleted, last_seq, has_more = fetch_changes(db, after_seq, limit or MAX_PAGE_SIZE)
+        return DownloadResponse(
+            products=[product_out(p) for p in rows["product"]],
+            customers=[customer_out(c) for c in rows["customer"]],
+            deleted=[DeletedRef(type=t, external_id=ext) for t, ext in deleted],
+            server_time=server_time, last_seq=last_seq, has_more=has_more, **compression,
+        )
+    if since is None:
+        raise HTTPException(status_code=400, detail="Pass since or after_seq")
+    since_dt = _parse_since(since)
+    if limit is None and cursor is None:
+        # Legacy clients: everything in one document
+        prod = [product_out(p) for p in db.execute(select(Product).where(Product.updated_at > since_dt)).scalars()]
+        cust = [customer_out(c) for c in db.execute(select(Customer).where(Customer.updated_at > since_dt)).scalars()]
+        return DownloadResponse(products=prod, customers=cust, server_time=server_time, **compression)
+    try:
+        prod, cust, next_cursor = fetch_page(db, since_dt, cursor, limit or MAX_PAGE_SIZE)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return DownloadResponse(products=prod, customers=cust, server_time=server_time, next_cursor=next_cursor, **compression)
+
+
+def _compression_info(db: Session, have_dict: Optional[int]) -> dict:
+    """Advertised codecs, plus the current dictionary if the client does not have it yet."""
+    info: dict = {"codecs": list(CODECS)}
+    current = current_dictionary_id(db)
+    if "zstd-dict" in CODECS and current is not None and current != have_dict:
+        info["dictionary"] = SyncDictionaryOut(id=current, data=base64.b64encode(load_dictionary(db, current)).decode())
+    return info
+
+
+DigestEntity = Annotated[str, Query(pattern="^(product|customer)$")]
+
+
+@app.get("/sync/digest", response_model=DigestResponse)
+def sync_digest(
+    entity: DigestEntity,
+    lo: str = "",
+    hi: str = "",
+    fanout: int = Query(FANOUT, ge=2, le=MAX_FANOUT),
+    db: Session = Depends(get_session),
+    agent: AgentInfo = Depends(get_current_agent),
+):
+    """Digest of the live ``entity`` rows with external_id in [lo, hi) plus its child ranges.
+
+    Compare level by level and descend only where digests differ; fetch a
+    range without children through ``/sync/digest/rows``.
+    """
+    digest = digests.get(db, entity)
+    node = digest.range(lo, hi)
+    children = [DigestRangeOut(**c._asdict()) for c in digest.children(lo, hi, fanout)]
+    return DigestResponse(entity=entity, children=children, **node._asdict())
+
+
+@app.get("/sync/digest/rows", response_model=DownloadResponse)
+def sync_digest_rows(entity: DigestEntity, lo: str = "", hi: str = "", db: Session = Depends(get_session), agent: AgentInfo = Depends(get_current_agent)):
+    """The live rows a digest range covers."""
+    ids = digests.get(db, entity).external_ids(lo, hi)
+    if len(ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Range holds more than {MAX_PAGE_SIZE} rows; narrow it via /sync/digest")
+    rows = range_rows(db, entity, ids)
+    if entity == "product":
+        return DownloadResponse(products=[product_out(p) for p in rows], customers=[], server_time=datetime.utcnow())
+    return DownloadResponse(products=[], customers=[customer_out(c) for c in rows], server_time=datetime.utcnow())
+
+
+@app.get("/sync/snapshot")
+def sync_snapshot(agent: AgentInfo = Depends(get_current_agent)):
+    """Newest catalog snapshot for bootstrapping a new device; continue with ``after_seq=X-Snapshot-Seq``."""
+    latest = latest_snapshot()
+    if latest is None:
+        raise HTTPException(status_code=404, detail="No snapshot available")
+    seq, path = latest
+    return FileResponse(path, media_type="application/octet-stream", headers={"X-Snapshot-Seq": str(seq)})
+
+
+@app.get("/sync/download.ndjson")
+def sync_download_ndjson(since: str, agent: AgentInfo = Depends(get_current_agent)):
+    since_dt = _parse_since(since)
+    return StreamingResponse(stream_ndjson(SessionLocal, since_dt, datetime.utcnow()), media_type="application/x-ndjson")
 
 
 @app.get("/analytics/trend", response_model=TrendResponse)
-def analytics_trend(days: int = Query(90, ge=1, le=365), db: Session = Depends(get_session), _=Depends(require_admin)):
-    cutoff = datetime.utcnow() - timedelta(days=days)
+def analytics_trend(request: Request, days: int = Query(90, ge=1, le=365), db: Session = Depends(get_session), _=Depends(require_admin)):
+    return analytics_cache.respond(request, db, lambda: _trend(db, days))
+
+
+def _trend(db: Session, days: int) -> TrendResponse:
+    cutoff = (datetime.utcnow() - timedelta(days=days)).date()
     rows = db.execute(
         select(
-            func.date(Sale.created_at),
-            func.sum(SaleItem.quantity * SaleItem.price),
-            func.sum(SaleItem.quantity * (SaleItem.price - (select(Product.cost_price).where(Product.external_id == SaleItem.product_external_id).scalar_subquery()))),
-        ).join(SaleItem, Sale.id == SaleItem.sale_id)
-        .where(Sale.created_at >= cutoff)
-        .group_by(func.date(Sale.created_at))
-        .order_by(func.date(Sale.created_at))
+            DailySalesRollup.day,
+            func.sum(DailySalesRollup.revenue),
+            func.sum(DailySalesRollup.revenue - DailySalesRollup.cost),
+        )
+        .where(DailySalesRollup.day >= cutoff)
+        .group_by(DailySalesRollup.day)
+        .order_by(DailySalesRollup.day)
     ).all()
-    points = [TrendPoint(x=datetime.fromisoformat(d), revenue=float(r or 0), profit=float(p or 0)) for d, r, p in rows]
+    points = [TrendPoint(x=datetime.combine(d, datetime.min.time()), revenue=float(r or 0), profit=float(p or 0)) for d, r, p in rows]
     return TrendResponse(points=points)
 
 
 @app.get("/analytics/heatmap", response_model=HeatmapResponse)
-def analytics_heatmap(db: Session = Depends(get_session), _=Depends(require_admin)):
-    grid = [[0 for _ in range(24)] for _ in range(7)]
-    rows = db.execute(
-        select(extract('dow', Sale.created_at), extract('hour', Sale.created_at), func.count(Sale.id)).group_by(extract('dow', Sale.created_at), extract('hour', Sale.created_at))
-    ).all()
-    for dow, hour, cnt in rows:
-        grid[int(dow)][int(hour)] = int(cnt)
-    return HeatmapResponse(grid=grid)
+def analytics_heatmap(
+    request: Request,
+    days: int = Query(90, ge=1, le=3650),
+    tz_offset: int = Query(0, ge=-720, le=840, description="Minutes east of UTC for local day/hour"),
+    agent: Optional[str] = None,
+    db: Session = Depends(get_session),
+    _=Depends(require_admin),
+):
+    since = datetime.utcnow() - timedelta(days=days)
+    return analytics_cache.respond(request, db, lambda: HeatmapResponse(grid=heatmap_grid(db, since, tz_offset, agent)))
 
 
 @app.get("/analytics/category_pie", response_model=CategoryPieResponse)
-def analytics_category_pie(days: int = Query(30, ge=1, le=365), db: Session = Depends(get_session), _=Depends(require_admin)):
-    cutoff = datetime.utcnow() - timedelta(days=days)
+def analytics_category_pie(request: Request, days: int = Query(30, ge=1, le=365), db: Session = Depends(get_session), _=Depends(require_admin)):
+    return analytics_cache.respond(request, db, lambda: _category_pie(db, days))
+
+
+def _category_pie(db: Session, days: int) -> CategoryPieResponse:
+    cutoff = (datetime.utcnow() - timedelta(days=days)).date()
     rows = db.execute(
-        select(Product.category, func.sum(SaleItem.quantity * SaleItem.price))
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .join(Product, Product.external_id == SaleItem.product_external_id, isouter=True)
-        .where(Sale.created_at >= cutoff)
-        .group_by(Product.category)
+        select(DailySalesRollup.category, func.sum(DailySalesRollup.revenue))
+        .where(DailySalesRollup.day >= cutoff)
+        .group_by(DailySalesRollup.category)
     ).all()
     data = [CategoryPieSlice(category=c or 'Uncategorized', revenue=float(r or 0)) for c, r in rows]
     return CategoryPieResponse(data=data)
@@ -233,23 +454,18 @@ def analytics_category_pie(days: int = Query(30, ge=1, le=365), db: Session = De
 
 @app.get("/admin", response_class=HTMLResponse)
 def admin_dashboard(db: Session = Depends(get_session)):
-    total_sales = float(db.execute(select(func.sum(SaleItem.quantity * SaleItem.price))).scalar() or 0)
+    total_sales = float(db.execute(select(func.sum(DailySalesRollup.revenue))).scalar() or 0)
     total_orders = int(db.execute(select(func.count(Sale.id))).scalar() or 0)
-    cutoff = datetime.utcnow() - timedelta(days=30)
+    cutoff = (datetime.utcnow() - timedelta(days=30)).date()
     top_rows = db.execute(
-        select(SaleItem.product_external_id, func.sum(SaleItem.quantity * SaleItem.price).label("rev"))
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .where(Sale.created_at >= cutoff)
-        .group_by(SaleItem.product_external_id)
-        .order_by(func.sum(SaleItem.quantity * SaleItem.price).desc())
+        select(DailySalesRollup.product_external_id, func.sum(DailySalesRollup.revenue).label("rev"))
+        .where(DailySalesRollup.day >= cutoff)
+        .group_by(DailySalesRollup.product_external_id)
+        .order_by(func.sum(DailySalesRollup.revenue).desc())
         .limit(10)
     ).all()
     # Ensure admin user and embed short-lived token
-    admin = db.execute(select(Agent).where(Agent.code == "admin")).scalar_one_or_none()
-    if not admin:
-        admin = Agent(code="admin", password_hash="demo")
-        db.add(admin)
-        db.commit()
+    ensure_agent(db, "admin")
     token = create_access_token({"sub": "admin"}, expires_delta=timedelta(minutes=30))
     template = env.get_template("admin.html")
     html = template.render(total_sales=total_sales, total_orders=total_orders, top_products=top_rows, api_token=token)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from typing import Iterable, Optional, Sequence
+
+# Minimal Prometheus text-format metrics (no client library dependency).
+# Values are per process; with several uvicorn workers scrape each one or
+# aggregate in Prometheus.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = None) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._values: dict[tuple[str, ...], float] = {}
+        super().__init__(*args, **kwargs)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS, registry: Optional[Registry] = None) -> None:
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket..., +Inf count], sum
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        super().__init__(name, help, labelnames, registry)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[idx] += 1
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            items = [(k, list(c), t[0]) for k, (c, t) in self._values.items()]
+        for key, counts, total in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else _fmt(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {running}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(line for m in self._metrics for line in m.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Request latency by route template and status", ("method", "route", "status"))
+HTTP_REQUEST_BYTES = Counter("http_request_bytes_total", "Request body bytes (Content-Length)", ("route",))
+HTTP_RESPONSE_BYTES = Counter("http_response_bytes_total", "Response body bytes (Content-Length)", ("route",))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served")
+UPLOAD_BATCH_SIZE = Histogram("sync_upload_batch_rows", "Rows per upload batch by entity", ("entity",), buckets=SIZE_BUCKETS)
+UPSERTS = Counter("sync_upserts_total", "Upload rows by entity and outcome", ("entity", "status"))
+SALE_ID_LOOKUPS = Counter("sync_sale_id_lookups_total", "Uploaded sale ids by Bloom filter verdict (absent = no existence query)", ("verdict",))
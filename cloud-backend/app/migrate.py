@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import time
+from typing import Callable, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+from .changelog import backfill_change_log
+from .rollups import rebuild_daily_rollup, rebuild_hourly_counts
+
+# (version, steps). Append only; never edit a migration that has shipped.
+# New tables come from the models via create_all; changes to existing tables
+# and backfills go here. A step is SQL text or a callable taking the connection.
+MIGRATIONS: list[tuple[int, list[Union[str, Callable[[Connection], None]]]]] = [
+    (1, [
+        # analytics: range on created_at, id carried along for the join to sale_items
+        "CREATE INDEX IF NOT EXISTS ix_sales_created_at ON sales (created_at, id)",
+        # covering index: trend/category/admin read these columns per sale without touching the table
+        "CREATE INDEX IF NOT EXISTS ix_sale_items_sale ON sale_items (sale_id, product_external_id, quantity, price)",
+        "CREATE INDEX IF NOT EXISTS ix_sale_items_product ON sale_items (product_external_id)",
+        # /sync/download keyset pagination
+        "CREATE INDEX IF NOT EXISTS ix_products_updated_at ON products (updated_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_customers_updated_at ON customers (updated_at, id)",
+    ]),
+    (2, [
+        # backfill daily_sales_rollup for databases that predate it
+        rebuild_daily_rollup,
+    ]),
+    (3, [
+        rebuild_hourly_counts,
+    ]),
+    (4, [
+        "INSERT INTO ingest_watermark (id, value) SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM ingest_watermark WHERE id = 1)",
+    ]),
+    (5, [
+        # change_log starts empty on databases that predate it
+        backfill_change_log,
+    ]),
+]
+TARGET_VERSION = MIGRATIONS[-1][0]
+# How long a worker waits for another one's migration before giving up (SQLite only)
+MIGRATE_LOCK_WAIT_SECONDS = 600
+
+
+def migrate(engine: Engine) -> int:
+    """Bring the database up to ``TARGET_VERSION``; returns the resulting version.
+
+    Each migration runs in its own transaction together with the version bump.
+    That transaction first locks the schema_version row (a no-op UPDATE: a row
+    lock on Postgres, the write lock on SQLite) and re-reads the version under
+    it, so when several workers start at once exactly one runs each migration
+    and the others wait, then see it done. The steps themselves (rollup
+    rebuilds, change_log backfill) are not safe to run twice.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (id INTEGER PRIMARY KEY CHECK (id=1), version INTEGER NOT NULL)"))
+        conn.execute(text("INSERT INTO schema_version(id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING"))
+        current = conn.execute(text("SELECT version FROM schema_version WHERE id=1")).scalar()
+
+    for version, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        current = _apply(engine, version, statements)
+    return current
+
+
+def _apply(engine: Engine, version: int, statements: list) -> int:
+    deadline = time.monotonic() + MIGRATE_LOCK_WAIT_SECONDS
+    while True:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("UPDATE schema_version SET version = version WHERE id=1"))
+                current = conn.execute(text("SELECT version FROM schema_version WHERE id=1")).scalar()
+                if current >= version:
+                    return current  # another worker got here first
+                for step in statements:
+                    if isinstance(step, str):
+                        conn.execute(text(step))
+                    else:
+                        step(conn)
+                conn.execute(text("UPDATE schema_version SET version=:v WHERE id=1"), {"v": version})
+                return version
+        except OperationalError as e:
+            # SQLite gives up on a held write lock after its busy timeout; Postgres just waits
+            if "locked" not in str(e) or time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
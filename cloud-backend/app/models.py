@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Numeric
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Index, LargeBinary, Numeric, Text
 from sqlalchemy.orm import relationship
 
 from .db import Base
@@ -59,4 +59,78 @@ class SaleItem(Base):
     quantity = Column(Integer, nullable=False)
     price = Column(Numeric(12, 2), nullable=False)
 
-    sale = relationship("Sale", back_populates="items") 
\ No newline at end of file
+    sale = relationship("Sale", back_populates="items") 
+
+
+class IngestJob(Base):
+    """Spooled /sync/upload/async batch; payload is the encrypted body as received."""
+    __tablename__ = "ingest_jobs"
+    id = Column(String(32), primary_key=True)
+    agent_code = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False, default="queued", index=True)
+    payload = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class DailySalesRollup(Base):
+    """Per-day sales aggregate maintained by ingest; see app.rollups."""
+    __tablename__ = "daily_sales_rollup"
+    day = Column(Date, primary_key=True)
+    agent_code = Column(String(64), primary_key=True)
+    product_external_id = Column(String(64), primary_key=True)
+    category = Column(String(255), primary_key=True, default="")  # '' = uncategorized
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    cost = Column(Numeric(14, 2), nullable=False, default=0)
+    quantity = Column(Integer, nullable=False, default=0)
+
+
+class HourlySalesCount(Base):
+    """Sales per UTC hour and agent, feeding the hour-of-week heatmap; see app.rollups."""
+    __tablename__ = "hourly_sales_counts"
+    hour = Column(DateTime, primary_key=True)  # created_at truncated to the hour, UTC
+    agent_code = Column(String(64), primary_key=True)
+    sales = Column(Integer, nullable=False, default=0)
+
+
+class IngestWatermark(Base):
+    """Single row (id=1) whose value increases with every upload that changes data."""
+    __tablename__ = "ingest_watermark"
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+class SyncDictionary(Base):
+    """Versioned zstd dictionaries for upload compression; the highest id is current."""
+    __tablename__ = "sync_dictionaries"
+    id = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class UploadBatch(Base):
+    """Response of a committed upload, replayed for retries with the same Idempotency-Key."""
+    __tablename__ = "upload_batches"
+    agent_code = Column(String(64), primary_key=True)
+    key = Column(String(64), primary_key=True)
+    response = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class ChangeLog(Base):
+    """Append-only log of catalog changes; ``seq`` orders /sync/download?after_seq= pulls."""
+    __tablename__ = "change_log"
+    __table_args__ = (
+        # compaction keeps the newest entry per row
+        Index("ix_change_log_entity_row", "entity", "external_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String(16), nullable=False)  # product | customer
+    external_id = Column(String(64), nullable=False)
+    op = Column(String(8), nullable=False, default="upsert")  # upsert | delete
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
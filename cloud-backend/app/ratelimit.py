@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
+RATE_LIMIT = int(os.getenv("RATE_LIMIT", "600"))  # default budget, requests/min per IP
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | sqlite
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "./ratelimit.db")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+
+
+class Budget(NamedTuple):
+    rate: float  # tokens added per second
+    burst: float  # bucket capacity
+
+
+def _per_minute(per_min: int) -> Budget:
+    # Sustained rate of ``per_min``, bursts of up to a sixth of it
+    return Budget(rate=per_min / 60, burst=max(1, per_min // 6))
+
+
+# Per route class; a client gets one bucket per class it uses
+BUDGETS: dict[str, Budget] = {
+    "auth": _per_minute(int(os.getenv("RATE_LIMIT_AUTH", "60"))),
+    # Agents behind one NAT share a bucket, and a catch-up sync posts several batches at once
+    "sync": _per_minute(int(os.getenv("RATE_LIMIT_SYNC", "600"))),
+    "analytics": _per_minute(int(os.getenv("RATE_LIMIT_ANALYTICS", "600"))),
+    "default": _per_minute(RATE_LIMIT),
+}
+
+EXEMPT_PATHS = ("/healthz",)
+
+
+def route_class(path: str) -> str:
+    if path.startswith("/sync"):
+        return "sync"
+    if path.startswith("/analytics") or path.startswith("/admin"):
+        return "analytics"
+    if path.startswith("/auth"):
+        return "auth"
+    return "default"
+
+
+class TokenBucketLimiter:
+    """In-process token buckets in a fixed-capacity LRU.
+
+    A bucket that has been idle long enough to refill completely is
+    indistinguishable from a new one, so evicting the least recently used key
+    when the map is full never lets a client exceed its budget by more than one
+    burst.
+    """
+
+    blocking = False  # cheap enough to call straight from the event loop
+
+    def __init__(self, budgets: dict[str, Budget] = BUDGETS, max_keys: int = RATE_LIMIT_MAX_KEYS, clock: Callable[[], float] = time.monotonic) -> None:
+        self.budgets = budgets
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: OrderedDict[tuple[str, str], list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, cls: str, client: str) -> tuple[bool, float]:
+        """Take one token; returns (allowed, seconds until a token is available)."""
+        budget = self.budgets.get(cls) or self.budgets["default"]
+        now = self.clock()
+        key = (cls, client)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [budget.burst, now]
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(budget.burst, bucket[0] + (now - bucket[1]) * budget.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0.0
+            return False, (1 - bucket[0]) / budget.rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteTokenBucketLimiter:
+    """Token buckets in a local SQLite file, shared by every uvicorn worker on the host.
+
+    Refill, take and the allow decision happen in a single upsert, so
+    concurrent processes never double-spend a token. Idle buckets are purged
+    every ``purge_every`` calls and the table is capped at ``max_keys`` rows.
+    ``hit`` does file I/O, so async callers run it in a worker thread.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str = RATE_LIMIT_DB, budgets: dict[str, Budget] = BUDGETS, max_keys: int = RATE_LIMIT_MAX_KEYS,
+                 clock: Callable[[], float] = time.time, purge_every: int = 1000) -> None:
+        self.budgets = budgets
+        self.max_keys = max_keys
+        self.clock = clock
+        self.purge_every = purge_every
+        self._calls = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")  # losing buckets on power loss is harmless
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, ts REAL NOT NULL, allowed INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_buckets_ts ON rate_buckets (ts)")
+
+    _HIT = (
+        "INSERT INTO rate_buckets (key, tokens, ts, allowed) VALUES (:key, :burst - 1, :now, 1) "
+        "ON CONFLICT(key) DO UPDATE SET "
+        "tokens = CASE WHEN MIN(:burst, tokens + (:now - ts) * :rate) >= 1 "
+        "THEN MIN(:burst, tokens + (:now - ts) * :rate) - 1 ELSE MIN(:burst, tokens + (:now - ts) * :rate) END, "
+        "allowed = MIN(:burst, tokens + (:now - ts) * :rate) >= 1, "
+        "ts = :now "
+        "RETURNING tokens, allowed"
+    )
+
+    def hit(self, cls: str, client: str) -> tuple[bool, float]:
+        budget = self.budgets.get(cls) or self.budgets["default"]
+        now = self.clock()
+        with self._lock:
+            tokens, allowed = self._conn.execute(
+                self._HIT, {"key": f"{cls}|{client}", "burst": budget.burst, "rate": budget.rate, "now": now}
+            ).fetchone()
+            self._calls += 1
+            if self._calls % self.purge_every == 0:
+                self._purge(now)
+        if allowed:
+            return True, 0.0
+        return False, (1 - tokens) / budget.rate
+
+    def _purge(self, now: float) -> None:
+        # Anything idle longer than the slowest full refill is back to a fresh bucket
+        idle = max(b.burst / b.rate for b in self.budgets.values())
+        self._conn.execute("DELETE FROM rate_buckets WHERE ts < ?", (now - idle,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM rate_buckets").fetchone()[0] - self.max_keys
+        if excess > 0:
+            self._conn.execute("DELETE FROM rate_buckets WHERE key IN (SELECT key FROM rate_buckets ORDER BY ts LIMIT ?)", (excess,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rate_buckets").fetchone()[0]
+
+
+def build_limiter():
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteTokenBucketLimiter()
+    return TokenBucketLimiter()
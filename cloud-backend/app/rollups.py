@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from .cache import bump_watermark
+from .db import dialect_insert
+from .models import DailySalesRollup, HourlySalesCount, Product, Sale, SaleItem
+from .schemas import SaleIn
+
+# Aggregates maintained at ingest time so analytics read O(days) rows instead of
+# O(line items). Category and cost are captured from the product row as it is
+# when the sale arrives; rebuild_daily_rollup() re-derives everything from the
+# raw tables (e.g. after product categories or costs are corrected).
+
+
+def upsert_add(db, model, rows: list[dict[str, Any]], keys: tuple[str, ...], add: tuple[str, ...]) -> None:
+    """``INSERT ... ON CONFLICT (keys) DO UPDATE SET col = col + excluded.col`` as one executemany."""
+    if not rows:
+        return
+    table = model.__table__
+    stmt = dialect_insert(db, table)
+    stmt = stmt.on_conflict_do_update(index_elements=list(keys), set_={c: table.c[c] + stmt.excluded[c] for c in add})
+    db.execute(stmt, rows)
+
+
+def add_sales_to_rollup(db: Session, sales: Iterable[SaleIn], catalog: dict[str, tuple]) -> None:
+    """Fold newly inserted sales into ``daily_sales_rollup``.
+
+    ``catalog`` maps product external_id -> (category, cost_price). Items whose
+    cost is unknown count their full price as cost, i.e. contribute no profit,
+    which is what the old correlated-subquery trend did.
+    """
+    acc: dict[tuple, list] = defaultdict(lambda: [0.0, 0.0, 0])
+    for s in sales:
+        day = s.created_at.date()
+        for it in s.items:
+            category, cost_price = catalog.get(it.product_external_id, (None, None))
+            revenue = it.quantity * it.price
+            cost = it.quantity * (float(cost_price) if cost_price is not None else it.price)
+            bucket = acc[(day, s.agent_code, it.product_external_id, category or "")]
+            bucket[0] += revenue
+            bucket[1] += cost
+            bucket[2] += it.quantity
+    rows = [
+        {"day": day, "agent_code": agent, "product_external_id": sku, "category": cat, "revenue": rev, "cost": cost, "quantity": qty}
+        for (day, agent, sku, cat), (rev, cost, qty) in acc.items()
+    ]
+    upsert_add(db, DailySalesRollup, rows, ("day", "agent_code", "product_external_id", "category"), ("revenue", "cost", "quantity"))
+
+
+def rebuild_daily_rollup(db) -> None:
+    """Recompute ``daily_sales_rollup`` from sales/sale_items in one INSERT ... SELECT.
+
+    Bumps the ingest watermark, so cached analytics computed from the old rollup are dropped.
+    """
+    day = func.date(Sale.created_at)
+    category = func.coalesce(Product.category, "")
+    sel = (
+        select(
+            day,
+            Sale.agent_code,
+            SaleItem.product_external_id,
+            category,
+            func.sum(SaleItem.quantity * SaleItem.price),
+            func.sum(SaleItem.quantity * func.coalesce(Product.cost_price, SaleItem.price)),
+            func.sum(SaleItem.quantity),
+        )
+        .select_from(SaleItem)
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .join(Product, Product.external_id == SaleItem.product_external_id, isouter=True)
+        .group_by(day, Sale.agent_code, SaleItem.product_external_id, category)
+    )
+    db.execute(delete(DailySalesRollup))
+    db.execute(insert(DailySalesRollup).from_select(
+        ["day", "agent_code", "product_external_id", "category", "revenue", "cost", "quantity"], sel
+    ))
+    bump_watermark(db)
+
+
+def _hour_rows(counts: Counter) -> list[dict[str, Any]]:
+    return [{"hour": hour, "agent_code": agent, "sales": n} for (hour, agent), n in counts.items()]
+
+
+def add_sales_to_heatmap(db: Session, sales: Iterable[SaleIn]) -> None:
+    """Bump ``hourly_sales_counts`` for newly inserted sales."""
+    counts = Counter((s.created_at.replace(minute=0, second=0, microsecond=0), s.agent_code) for s in sales)
+    upsert_add(db, HourlySalesCount, _hour_rows(counts), ("hour", "agent_code"), ("sales",))
+
+
+def rebuild_hourly_counts(db) -> None:
+    """Recount ``hourly_sales_counts`` from ``sales``; hour truncation is done in Python to stay dialect-neutral.
+
+    Bumps the ingest watermark like ``rebuild_daily_rollup``.
+    """
+    counts: Counter = Counter()
+    for created_at, agent in db.execute(select(Sale.created_at, Sale.agent_code).execution_options(yield_per=5000)):
+        counts[(created_at.replace(minute=0, second=0, microsecond=0), agent)] += 1
+    db.execute(delete(HourlySalesCount))
+    rows = _hour_rows(counts)
+    if rows:
+        db.execute(insert(HourlySalesCount), rows)
+    bump_watermark(db)
+
+
+def heatmap_grid(db, since: datetime, tz_offset_minutes: int = 0, agent_code: Optional[str] = None) -> list[list[int]]:
+    """7x24 sales counts (rows Sunday=0..Saturday, cols local hour) since ``since``.
+
+    Counters are per UTC hour, so offsets that are not whole hours (e.g. +05:30)
+    are attributed to the local hour the bucket starts in.
+    """
+    grid = [[0 for _ in range(24)] for _ in range(7)]
+    q = (
+        select(HourlySalesCount.hour, func.sum(HourlySalesCount.sales))
+        .where(HourlySalesCount.hour >= since.replace(minute=0, second=0, microsecond=0))
+        .group_by(HourlySalesCount.hour)
+    )
+    if agent_code:
+        q = q.where(HourlySalesCount.agent_code == agent_code)
+    shift = timedelta(minutes=tz_offset_minutes)
+    for hour, n in db.execute(q):
+        local = hour + shift
+        grid[(local.weekday() + 1) % 7][local.hour] += int(n or 0)
+    return grid
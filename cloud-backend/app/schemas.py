@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -19,6 +19,9 @@ class EncryptedPayload(BaseModel):
     nonce: str
     ciphertext: str
     tag: str
+    # Compression of the plaintext; None = legacy (gzip, else plain JSON)
+    codec: Optional[str] = None
+    dict_id: Optional[int] = None
 
 
 class ProductIn(BaseModel):
@@ -74,10 +77,72 @@ class SyncUploadResponse(BaseModel):
     server_time: datetime
 
 
+class SyncUploadSummary(BaseModel):
+    """``?response=summary`` / ``?response=rle`` alternative to ``SyncUploadResponse``.
+
+    ``counts`` is entity -> status -> rows. ``exceptions`` lists only rows that
+    were not inserted, updated or already present. ``status_rle`` (rle mode only)
+    is the per-row status in result order as runs like ``"120I3S"``, see
+    ``STATUS_CODES``.
+    """
+    counts: Dict[str, Dict[str, int]]
+    exceptions: List[UpsertResult] = Field(default_factory=list)
+    status_rle: Optional[str] = None
+    server_time: datetime
+
+
+class JobAccepted(BaseModel):
+    job_id: str
+    status: str
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str  # queued | running | done | failed
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    result: Optional[SyncUploadResponse] = None
+
+
+class DeletedRef(BaseModel):
+    type: str  # product | customer
+    external_id: str
+
+
+class SyncDictionaryOut(BaseModel):
+    id: int
+    data: str  # base64
+
+
 class DownloadResponse(BaseModel):
     products: List[ProductIn]
     customers: List[CustomerIn]
     server_time: datetime
+    # Set when paging (``limit``/``cursor``) and more rows remain
+    next_cursor: Optional[str] = None
+    # Upload codecs the server accepts, and the current zstd dictionary when the
+    # client's ``dict_id`` is stale
+    codecs: List[str] = Field(default_factory=list)
+    dictionary: Optional[SyncDictionaryOut] = None
+    # ``after_seq`` mode: rows removed since, the seq to pass next time, and
+    # whether more entries are waiting
+    deleted: List[DeletedRef] = Field(default_factory=list)
+    last_seq: Optional[int] = None
+    has_more: bool = False
+
+
+class DigestRangeOut(BaseModel):
+    lo: str
+    hi: str  # exclusive; "" = unbounded
+    count: int
+    digest: str  # hex
+
+
+class DigestResponse(DigestRangeOut):
+    entity: str
+    # Empty once the range is small enough to fetch with /sync/digest/rows
+    children: List[DigestRangeOut] = Field(default_factory=list)
 
 
 class TrendPoint(BaseModel):
@@ -0,0 +1,44 @@
+"""Per-request cost of authenticating a sync call, uncached vs cached.
+
+    python -m app.scripts.bench_auth
+"""
+
+from __future__ import annotations
+
+import time
+
+import jwt
+from sqlalchemy import select
+
+from app.auth import ensure_agent, lookup_agent
+from app.db import Base, SessionLocal, engine
+from app.models import Agent
+from app.security import ALGORITHM, SECRET_KEY, create_access_token, verify_token
+
+N = 20_000
+
+
+def uncached(db, token: str) -> None:
+    code = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])["sub"]
+    db.execute(select(Agent).where(Agent.code == code)).scalar_one_or_none()
+
+
+def cached(db, token: str) -> None:
+    lookup_agent(db, verify_token(token)["sub"])
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    token = create_access_token({"sub": "bench-agent"})
+    with SessionLocal() as db:
+        ensure_agent(db, "bench-agent")
+        for name, fn in (("before (decode + SELECT)", uncached), ("after (cached claims + agent)", cached)):
+            fn(db, token)
+            started = time.perf_counter()
+            for _ in range(N):
+                fn(db, token)
+            print(f"{name:32} {(time.perf_counter() - started) / N * 1e6:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
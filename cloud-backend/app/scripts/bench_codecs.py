@@ -0,0 +1,49 @@
+"""Compare upload codecs on simulate_sync batches: compression ratio and CPU time.
+
+The dictionary is trained on batches from other agents than the ones measured,
+as it would be in production (trained on history, used on new uploads).
+
+    python -m app.scripts.bench_codecs
+"""
+
+from __future__ import annotations
+
+import json
+import time
+
+from app.codecs import CODECS, DICT_SIZE, compress, decompress, train_dictionary
+from app.scripts.simulate_sync import make_payload
+
+SIZES = (10, 100, 1_000)
+REPEAT = 20
+
+
+def _cpu_ms(fn, repeat: int = REPEAT) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - started) / repeat * 1000
+
+
+def main():
+    zdict = None
+    if "zstd-dict" in CODECS:
+        history = [json.dumps(make_payload(50, agent=f"agent-{a:03d}", start=k * 50)).encode() for a in range(20) for k in range(10)]
+        zdict = train_dictionary(history, DICT_SIZE)
+    else:
+        print("zstandard not installed; only identity/gzip are measured")
+
+    print(f"{'rows':>6} {'codec':>10} {'bytes':>10} {'ratio':>7} {'comp ms':>9} {'decomp ms':>10}")
+    for n in SIZES:
+        raw = json.dumps(make_payload(n, agent="agent-900")).encode()
+        for codec in CODECS:
+            zd = zdict if codec == "zstd-dict" else None
+            packed = compress(raw, codec, zd)
+            assert decompress(packed, codec, zd) == raw
+            comp = _cpu_ms(lambda: compress(raw, codec, zd))
+            decomp = _cpu_ms(lambda: decompress(packed, codec, zd))
+            print(f"{n:>6} {codec:>10} {len(packed):>10} {len(raw) / len(packed):>7.1f} {comp:>9.3f} {decomp:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
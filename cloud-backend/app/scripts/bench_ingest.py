@@ -0,0 +1,67 @@
+"""Measure /sync/upload ingest latency against batch size.
+
+Runs the ingest engine against a throwaway in-memory SQLite database so the
+numbers reflect statement count rather than disk. Per-row cost should stay
+flat as the batch grows.
+
+    python -m app.scripts.bench_ingest
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import Base
+from app.ingest import ingest_batch
+from app.schemas import SyncUploadBody
+
+SIZES = (100, 1_000, 5_000, 20_000)
+
+
+def make_batch(n: int, agent: str = "agent-001") -> SyncUploadBody:
+    now = datetime.utcnow()
+    sales = []
+    for i in range(n):
+        ts = now - timedelta(minutes=i)
+        sales.append({
+            "external_id": f"{agent}-bench-{i}",
+            "agent_code": agent,
+            "created_at": ts,
+            "updated_at": ts,
+            "items": [
+                {"product_external_id": "SKU-1", "quantity": random.randint(1, 5), "price": 9.99},
+                {"product_external_id": "SKU-2", "quantity": random.randint(1, 3), "price": 19.99},
+            ],
+        })
+    products = [
+        {"external_id": f"SKU-{i}", "name": f"Product {i}", "price": 9.99, "stock": 100, "updated_at": now}
+        for i in range(max(1, n // 10))
+    ]
+    return SyncUploadBody(products=products, sales=sales)
+
+
+def run(n: int) -> float:
+    engine = create_engine("sqlite://", future=True)
+    Base.metadata.create_all(bind=engine)
+    body = make_batch(n)
+    with sessionmaker(bind=engine, future=True)() as db:
+        started = time.perf_counter()
+        ingest_batch(db, body)
+        db.commit()
+        return time.perf_counter() - started
+
+
+def main():
+    print(f"{'sales':>8} {'total ms':>10} {'us/sale':>9}")
+    for n in SIZES:
+        elapsed = run(n)
+        print(f"{n:>8} {elapsed * 1000:>10.1f} {elapsed / n * 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Per-request overhead of the rate-limit middleware.
+
+Times ``limiter.hit`` for both backends over a rotating set of client IPs,
+then a full request through the ASGI stack with the limiter on and off.
+
+    python -m app.scripts.bench_ratelimit
+"""
+
+from __future__ import annotations
+
+import tempfile
+import time
+from pathlib import Path
+
+from app.ratelimit import SQLiteTokenBucketLimiter, TokenBucketLimiter, route_class
+
+N = 50_000
+CLIENTS = 2_000
+
+
+def time_limiter(limiter) -> float:
+    paths = ("/sync/upload", "/analytics/trend", "/auth/login", "/healthz")
+    started = time.perf_counter()
+    for i in range(N):
+        limiter.hit(route_class(paths[i % 4]), f"10.0.{(i % CLIENTS) // 256}.{i % 256}")
+    return (time.perf_counter() - started) / N
+
+
+def time_requests(enabled: bool, n: int = 2_000) -> float:
+    from fastapi.testclient import TestClient
+    from app import main
+
+    original = main.rate_limiter
+    if not enabled:
+        main.rate_limiter = type("Off", (), {"hit": staticmethod(lambda cls, client: (True, 0.0))})()
+    try:
+        client = TestClient(main.app)
+        client.get("/openapi.json")
+        started = time.perf_counter()
+        for _ in range(n):
+            client.get("/openapi.json")
+        return (time.perf_counter() - started) / n
+    finally:
+        main.rate_limiter = original
+
+
+def main():
+    print(f"memory limiter: {time_limiter(TokenBucketLimiter()) * 1e6:8.2f} us/hit")
+    with tempfile.TemporaryDirectory() as d:
+        sqlite = SQLiteTokenBucketLimiter(str(Path(d) / "rl.db"))
+        print(f"sqlite limiter: {time_limiter(sqlite) * 1e6:8.2f} us/hit")
+    # Interleave and keep the best run of each to damp warm-up and GC noise
+    runs = [(time_requests(True), time_requests(False)) for _ in range(3)]
+    on, off = min(r[0] for r in runs), min(r[1] for r in runs)
+    print(f"request with limiter {on * 1e6:8.1f} us, without {off * 1e6:8.1f} us, overhead {(on - off) * 1e6:6.1f} us")
+
+
+if __name__ == "__main__":
+    main()
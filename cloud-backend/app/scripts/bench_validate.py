@@ -0,0 +1,61 @@
+"""Parse-plus-validate and response serialization time for large upload batches.
+
+Compares the old two-pass path (``json.loads`` then ``SyncUploadBody(**data)``)
+with single-pass ``model_validate_json``, and FastAPI's default response
+encoding with writing ``model_dump_json`` bytes directly and with the
+``?response=summary`` mode.
+
+    python -m app.scripts.bench_validate
+"""
+
+from __future__ import annotations
+
+import json
+import time
+import tracemalloc
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+
+from app.ingest import parse_upload, summarize_results
+from app.schemas import SyncUploadBody, SyncUploadResponse, UpsertResult
+from app.scripts.simulate_sync import make_payload
+
+SALES = 10_000
+REPEAT = 5
+
+
+def _ms(fn) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def _peak_mb(fn) -> float:
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def main():
+    raw = json.dumps(make_payload(SALES)).encode()
+    results = [UpsertResult.model_construct(type="sale", external_id=f"agent-001-test-{i}", status="inserted") for i in range(SALES)]
+    response = SyncUploadResponse.model_construct(results=results, conflicts=[], server_time=datetime.utcnow())
+
+    print(f"{SALES} sales, {len(raw) / 1e6:.1f} MB of JSON (best of {REPEAT})")
+    two_pass = lambda: SyncUploadBody(**json.loads(raw))  # noqa: E731
+    print(f"  json.loads + SyncUploadBody(**data)   {_ms(two_pass):8.1f} ms  peak {_peak_mb(two_pass):6.1f} MB")
+    print(f"  SyncUploadBody.model_validate_json    {_ms(lambda: parse_upload(raw)):8.1f} ms  peak {_peak_mb(lambda: parse_upload(raw)):6.1f} MB")
+    print(f"  response via jsonable_encoder         {_ms(lambda: json.dumps(jsonable_encoder(SyncUploadResponse.model_validate(response.model_dump())))):8.1f} ms")
+    print(f"  response via model_dump_json          {_ms(lambda: response.model_dump_json()):8.1f} ms  {len(response.model_dump_json()) / 1e3:8.1f} kB")
+    summary = lambda: summarize_results(results).model_dump_json()  # noqa: E731
+    print(f"  ?response=summary                     {_ms(summary):8.1f} ms  {len(summary()) / 1e3:8.1f} kB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""Build the catalog snapshot served at /sync/snapshot now, instead of waiting for the builder thread.
+
+    python -m app.scripts.build_snapshot
+"""
+
+from __future__ import annotations
+
+import time
+
+from app.db import Base, SessionLocal, engine
+from app.migrate import migrate
+from app.snapshot import SNAPSHOT_DIR, build_snapshot
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    migrate(engine)
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        seq, path = build_snapshot(db)
+    print(f"snapshot at seq {seq}: {path} ({path.stat().st_size / 1024:.1f} KiB) in {time.perf_counter() - started:.2f}s")
+    print(f"serving from {SNAPSHOT_DIR.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
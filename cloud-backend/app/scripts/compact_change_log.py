@@ -0,0 +1,28 @@
+"""Drop change_log entries superseded by a newer entry for the same row.
+
+Safe to run at any time, e.g. nightly from cron:
+
+    python -m app.scripts.compact_change_log
+"""
+
+from __future__ import annotations
+
+import time
+
+from app.changelog import compact_change_log
+from app.db import Base, SessionLocal, engine
+from app.migrate import migrate
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    migrate(engine)
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        removed = compact_change_log(db)
+        db.commit()
+    print(f"removed {removed} superseded change_log entries in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
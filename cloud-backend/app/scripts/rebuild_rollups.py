@@ -0,0 +1,30 @@
+"""Recompute ingest-time aggregates from the raw sales tables.
+
+Run after correcting product categories/costs, or if the aggregates are ever
+suspected to have drifted:
+
+    python -m app.scripts.rebuild_rollups
+"""
+
+from __future__ import annotations
+
+import time
+
+from app.db import Base, SessionLocal, engine
+from app.migrate import migrate
+from app.rollups import rebuild_daily_rollup, rebuild_hourly_counts
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    migrate(engine)
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        rebuild_daily_rollup(db)
+        rebuild_hourly_counts(db)
+        db.commit()
+    print(f"daily_sales_rollup and hourly_sales_counts rebuilt in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,34 @@
+"""Load generator for the sync API.
+
+N agents run concurrently. Each agent logs in, then uploads batches of sales
+(optionally with product and customer rows), pulls catalog changes every few
+batches and pauses for a random think time between batches. Latency
+percentiles, throughput and error rates are recorded per endpoint. The JSON
+report can be compared against an earlier run with ``--compare``.
+
+    python -m app.scripts.simulate_sync --agents 20 --batches 10 --batch-size 500
+    python -m app.scripts.simulate_sync --in-process --report new.json --compare old.json
+
+``--in-process`` drives the app through TestClient, against DATABASE_URL or a
+fresh temporary SQLite file. Otherwise requests go to ``--server`` (e.g. a
+local ``uvicorn app.main:app``), which must share SYNC_AES_KEY_BASE64.
+"""
+
 from __future__ import annotations
 
+import argparse
 import base64
+import hashlib
 import json
 import os
-from datetime import datetime, timedelta
 import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
 import requests
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
@@ -29,27 +53,240 @@ def enc_payload(data: dict) -> dict[str, str]:
     }
 
 
-def main():
-    tok = requests.post(f"{SERVER}/auth/login", json={"agent_code": AGENT, "password": PASSWORD}).json()["access_token"]
+def make_payload(n: int = 1000, agent: str = AGENT, start: int = 0, products: int = 0, customers: int = 0, catalog: int = 1000,
+                 rng: Optional[random.Random] = None) -> dict:
+    """``n`` sales plus ``products``/``customers`` catalog rows drawn from a pool of ``catalog`` ids.
+
+    Catalog rows are shared between agents, so larger mixes produce updates
+    and stale writes as well as inserts.
+    """
+    rng = rng or random
     now = datetime.utcnow()
     sales = []
-    for i in range(1000):
+    for i in range(start, start + n):
         sales.append({
-            "external_id": f"{AGENT}-test-{i}",
-            "agent_code": AGENT,
+            "external_id": f"{agent}-test-{i}",
+            "agent_code": agent,
             "customer_external_id": None,
             "created_at": (now - timedelta(minutes=i)).isoformat(),
             "updated_at": (now - timedelta(minutes=i)).isoformat(),
             "items": [
-                {"product_external_id": "SKU-1", "quantity": random.randint(1, 5), "price": 9.99},
-                {"product_external_id": "SKU-2", "quantity": random.randint(1, 3), "price": 19.99},
+                {"product_external_id": "SKU-1", "quantity": rng.randint(1, 5), "price": 9.99},
+                {"product_external_id": "SKU-2", "quantity": rng.randint(1, 3), "price": 19.99},
             ],
         })
-    payload = {"products": [], "customers": [], "sales": sales}
-    enc = enc_payload(payload)
-    res = requests.post(f"{SERVER}/sync/upload", json=enc, headers={"Authorization": f"Bearer {tok}"})
-    print(res.status_code, res.text)
+    prods = [
+        {"external_id": f"SKU-{k}", "name": f"Product {k}", "category": f"Cat {k % 20}", "price": round(rng.uniform(1, 100), 2),
+         "stock": rng.randint(0, 500), "updated_at": now.isoformat()}
+        for k in rng.sample(range(1, catalog + 1), min(products, catalog))
+    ]
+    custs = [
+        {"external_id": f"CUST-{k}", "name": f"Customer {k}", "phone": f"555-{k:04d}", "updated_at": now.isoformat()}
+        for k in rng.sample(range(1, catalog + 1), min(customers, catalog))
+    ]
+    return {"products": prods, "customers": custs, "sales": sales}
+
+
+# --- measurement ---
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))]
+
+
+class Recorder:
+    """Thread-safe per-endpoint latencies, statuses and errors."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: dict[str, int] = defaultdict(int)
+        self.rows = 0
+
+    def record(self, endpoint: str, seconds: float, status: str, ok: bool) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def add_rows(self, n: int) -> None:
+        with self._lock:
+            self.rows += n
+
+    def report(self, duration: float) -> dict[str, Any]:
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            endpoints[name] = {
+                "requests": len(values),
+                "errors": self.errors[name],
+                "error_rate": round(self.errors[name] / len(values), 4),
+                "throughput_rps": round(len(values) / duration, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+                "statuses": dict(self.statuses[name]),
+            }
+        return {"duration_s": round(duration, 3), "rows_uploaded": self.rows, "rows_per_s": round(self.rows / duration, 1), "endpoints": endpoints}
+
+
+# --- transport ---
+
+Call = Callable[..., Any]
+
+
+def http_transport(server: str) -> Callable[[], Call]:
+    """One pooled requests.Session per agent."""
+    def factory() -> Call:
+        session = requests.Session()
+        return lambda method, path, **kw: session.request(method, server + path, timeout=60, **kw)
+    return factory
+
+
+def in_process_transport() -> tuple[Callable[[], Call], Callable[[], None]]:
+    """Drive the ASGI app in this process; returns (per-agent factory, close)."""
+    global KEY_B64
+    tmp = tempfile.mkdtemp(prefix="loadtest-")
+    if not os.getenv("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'cloud.db')}"
+    # The app's snapshot builder would otherwise write ./snapshots into the working tree
+    os.environ.setdefault("SNAPSHOT_DIR", os.path.join(tmp, "snapshots"))
+    if not KEY_B64:
+        KEY_B64 = os.environ["SYNC_AES_KEY_BASE64"] = base64.b64encode(os.urandom(32)).decode()
+    # Measure the app, not the per-IP limiter: every simulated agent shares one "IP"
+    for var in ("RATE_LIMIT_AUTH", "RATE_LIMIT_SYNC", "RATE_LIMIT_ANALYTICS"):
+        os.environ.setdefault(var, "1000000")
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    # Server errors count as 500s rather than aborting the agent
+    client = TestClient(app, raise_server_exceptions=False)
+    client.__enter__()
+    return (lambda: client.request), (lambda: client.__exit__(None, None, None))
+
+
+# --- agents ---
+
+class Scenario(argparse.Namespace):
+    agents: int
+    batches: int
+    batch_size: int
+    products: int
+    customers: int
+    catalog: int
+    think: float
+    download_every: int
+    seed: int
+
+
+def _timed(rec: Recorder, endpoint: str, call: Call, method: str, path: str, **kw) -> Optional[Any]:
+    started = time.perf_counter()
+    try:
+        res = call(method, path, **kw)
+    except Exception as e:
+        rec.record(endpoint, time.perf_counter() - started, type(e).__name__, ok=False)
+        return None
+    rec.record(endpoint, time.perf_counter() - started, str(res.status_code), ok=res.status_code < 400)
+    return res if res.status_code < 400 else None
+
+
+def run_agent(index: int, sc: Scenario, call: Call, rec: Recorder) -> None:
+    agent = f"load-{index:03d}"
+    rng = random.Random(sc.seed * 1000 + index)
+    res = _timed(rec, "POST /auth/login", call, "POST", "/auth/login", json={"agent_code": agent, "password": PASSWORD})
+    if res is None:
+        return
+    headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+    after_seq = 0
+    for b in range(sc.batches):
+        payload = make_payload(sc.batch_size, agent, start=b * sc.batch_size, products=sc.products, customers=sc.customers,
+                               catalog=sc.catalog, rng=rng)
+        enc = enc_payload(payload)
+        key = hashlib.sha256(f"{agent}:{b}".encode()).hexdigest()[:32]
+        if _timed(rec, "POST /sync/upload", call, "POST", "/sync/upload", params={"response": "summary"}, json=enc,
+                  headers={**headers, "Idempotency-Key": key}) is not None:
+            rec.add_rows(sum(len(v) for v in payload.values()))
+        if sc.download_every and (b + 1) % sc.download_every == 0:
+            page = _timed(rec, "GET /sync/download", call, "GET", "/sync/download", params={"after_seq": after_seq, "limit": 500}, headers=headers)
+            if page is not None:
+                after_seq = page.json().get("last_seq") or after_seq
+        if sc.think > 0 and b + 1 < sc.batches:
+            time.sleep(rng.expovariate(1 / sc.think))
+
+
+def run(sc: Scenario, factory: Callable[[], Call]) -> dict[str, Any]:
+    rec = Recorder()
+    threads = [threading.Thread(target=run_agent, args=(i, sc, factory(), rec), daemon=True) for i in range(sc.agents)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return rec.report(time.perf_counter() - started)
+
+
+# --- output ---
+
+def print_report(report: dict[str, Any], baseline: Optional[dict[str, Any]] = None) -> None:
+    print(f"{report['rows_uploaded']} rows in {report['duration_s']:.1f}s ({report['rows_per_s']:.0f} rows/s)")
+    print(f"{'endpoint':<20} {'reqs':>6} {'err%':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, e in report["endpoints"].items():
+        line = f"{name:<20} {e['requests']:>6} {e['error_rate'] * 100:>6.1f} {e['throughput_rps']:>8.1f} {e['p50_ms']:>8.1f} {e['p95_ms']:>8.1f} {e['p99_ms']:>8.1f}"
+        old = (baseline or {}).get("endpoints", {}).get(name)
+        if old and old["p95_ms"]:
+            line += f"   p95 {(e['p95_ms'] / old['p95_ms'] - 1) * 100:+.0f}% vs baseline"
+        print(line)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> tuple[Scenario, argparse.Namespace]:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--agents", type=int, default=10, help="concurrent agents")
+    p.add_argument("--batches", type=int, default=5, help="upload batches per agent")
+    p.add_argument("--batch-size", type=int, default=1000, help="sales per batch")
+    p.add_argument("--products", type=int, default=0, help="product rows per batch")
+    p.add_argument("--customers", type=int, default=0, help="customer rows per batch")
+    p.add_argument("--catalog", type=int, default=1000, help="size of the shared product/customer id pool")
+    p.add_argument("--think", type=float, default=0.5, help="mean seconds between an agent's batches (exponential)")
+    p.add_argument("--download-every", type=int, default=1, help="pull /sync/download after every Nth batch (0 = never)")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--server", default=SERVER)
+    p.add_argument("--in-process", action="store_true", help="run the app in this process instead of calling --server")
+    p.add_argument("--report", default="load_report.json", help="where to write the JSON report")
+    p.add_argument("--compare", help="earlier report to show p95 changes against")
+    args = p.parse_args(argv)
+    return Scenario(**{k: getattr(args, k) for k in Scenario.__annotations__}), args
+
+
+def main(argv: Optional[list[str]] = None):
+    sc, args = parse_args(argv)
+    close = None
+    started_at = datetime.utcnow().isoformat()
+    if args.in_process:
+        factory, close = in_process_transport()
+        target = "in-process"
+    else:
+        factory, target = http_transport(args.server), args.server
+    try:
+        report = run(sc, factory)
+    finally:
+        if close is not None:
+            close()
+    report = {"started_at": started_at, "target": target, "scenario": vars(sc), **report}
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"report written to {args.report}")
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
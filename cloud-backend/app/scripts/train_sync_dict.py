@@ -0,0 +1,66 @@
+"""Train a new zstd dictionary for upload compression from recent sync data.
+
+Re-serializes the most recent sales (with their items) and catalog rows the
+way clients upload them, in small batches, and trains on those samples. The
+dictionary is stored as a new version; clients pick it up on their next
+/sync/download and start sending ``zstd-dict`` payloads.
+
+    python -m app.scripts.train_sync_dict [max_sales]
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.codecs import DICT_SIZE, save_dictionary, train_dictionary
+from app.db import Base, SessionLocal, engine
+from app.download import customer_out, product_out
+from app.migrate import migrate
+from app.models import Customer, Product, Sale
+
+SAMPLE_ROWS = 50
+
+
+def samples(db, max_sales: int) -> list[bytes]:
+    out = []
+    sales = db.execute(select(Sale).options(selectinload(Sale.items)).order_by(Sale.id.desc()).limit(max_sales)).scalars().all()
+    for i in range(0, len(sales), SAMPLE_ROWS):
+        batch = [
+            {
+                "external_id": s.external_id, "agent_code": s.agent_code, "customer_external_id": s.customer_external_id,
+                "created_at": s.created_at.isoformat(), "updated_at": s.updated_at.isoformat(),
+                "items": [{"product_external_id": it.product_external_id, "quantity": it.quantity, "price": float(it.price)} for it in s.items],
+            }
+            for s in sales[i:i + SAMPLE_ROWS]
+        ]
+        out.append(json.dumps({"products": [], "customers": [], "sales": batch}).encode("utf-8"))
+    for model, to_out, key in ((Product, product_out, "products"), (Customer, customer_out, "customers")):
+        rows = db.execute(select(model).order_by(model.updated_at.desc()).limit(max_sales)).scalars().all()
+        for i in range(0, len(rows), SAMPLE_ROWS):
+            body = {"products": [], "customers": [], "sales": []}
+            body[key] = [to_out(r).model_dump(mode="json") for r in rows[i:i + SAMPLE_ROWS]]
+            out.append(json.dumps(body).encode("utf-8"))
+    return out
+
+
+def main():
+    max_sales = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    Base.metadata.create_all(bind=engine)
+    migrate(engine)
+    with SessionLocal() as db:
+        data = samples(db, max_sales)
+        if len(data) < 10:
+            print(f"only {len(data)} samples; sync more data before training a dictionary")
+            return
+        zdict = train_dictionary(data, DICT_SIZE)
+        dict_id = save_dictionary(db, zdict)
+        db.commit()
+    print(f"dictionary {dict_id} trained on {len(data)} samples ({len(zdict)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
 import base64
+import hashlib
 import os
+import struct
 from datetime import datetime, timedelta
-from typing import Any, Dict
+from typing import Any, Iterable, Iterator
 
 import jwt
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from fastapi import HTTPException, status
 
+from .cache import TTLCache
+
 SECRET_KEY = os.getenv("SECRET_KEY", "change-me")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 12
@@ -28,15 +32,32 @@ def create_access_token(data: dict[str, Any], expires_delta: timedelta | None =
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+# Verified claims keyed by token digest, held no longer than the token's own exp
+_claims_cache = TTLCache(maxsize=4096, ttl=300)
+
+
 def verify_token(token: str) -> dict[str, Any]:
+    key = hashlib.sha256(token.encode()).digest()
+    claims = _claims_cache.get(key)
+    if claims is not None:
+        return claims
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    _claims_cache.set(key, claims, expires_at=claims.get("exp"))
+    return claims
+
+
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+# AEAD objects are stateless; build the key schedule once
+_aesgcm = AESGCM(SYNC_AES_KEY)
 
 
 def aesgcm_decrypt(nonce_b64: str, ciphertext_b64: str, tag_b64: str) -> bytes:
-    aesgcm = AESGCM(SYNC_AES_KEY)
+    aesgcm = _aesgcm
     nonce = base64.b64decode(nonce_b64)
     ct = base64.b64decode(ciphertext_b64)
     tag = base64.b64decode(tag_b64)
@@ -44,8 +65,25 @@ def aesgcm_decrypt(nonce_b64: str, ciphertext_b64: str, tag_b64: str) -> bytes:
     return aesgcm.decrypt(nonce, ct + tag, None)
 
 
+def aesgcm_decrypt_frame(frame: bytes | memoryview) -> bytes:
+    """Decrypt a binary ``nonce | ciphertext | tag`` frame.
+
+    AESGCM takes ciphertext and tag as one contiguous buffer, which is exactly
+    the tail of the frame, so both slices are zero-copy memoryviews.
+    """
+    view = memoryview(frame)
+    if len(view) < NONCE_SIZE + TAG_SIZE:
+        raise ValueError("Frame too short")
+    return _aesgcm.decrypt(view[:NONCE_SIZE], view[NONCE_SIZE:], None)
+
+
+def aesgcm_encrypt_frame(plaintext: bytes) -> bytes:
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + _aesgcm.encrypt(nonce, plaintext, None)
+
+
 def aesgcm_encrypt(plaintext: bytes) -> dict[str, str]:
-    aesgcm = AESGCM(SYNC_AES_KEY)
+    aesgcm = _aesgcm
     nonce = os.urandom(12)
     ct = aesgcm.encrypt(nonce, plaintext, None)
     # split tag (last 16 bytes)
@@ -55,4 +93,93 @@ def aesgcm_encrypt(plaintext: bytes) -> dict[str, str]:
         "nonce": base64.b64encode(nonce).decode(),
         "ciphertext": base64.b64encode(body).decode(),
         "tag": base64.b64encode(tag).decode(),
-    } 
\ No newline at end of file
+    } 
+
+# Segmented AEAD for streamed uploads (STREAM construction):
+#   header  = b"SGS1" | segment_size (u32 BE) | nonce_prefix (7 bytes)
+#   segment = AES-GCM(plaintext[segment_size]) incl. 16-byte tag; the final one may be shorter
+#   nonce_i = nonce_prefix | i (u32 BE) | 1 if final else 0
+# The header is the associated data of every segment. A counter in the nonce
+# catches reordering and dropped segments, the final flag catches truncation.
+STREAM_MAGIC = b"SGS1"
+STREAM_HEADER_SIZE = 4 + 4 + 7
+MIN_SEGMENT_SIZE = 1024
+MAX_SEGMENT_SIZE = 1 << 20
+DEFAULT_SEGMENT_SIZE = 64 * 1024
+
+
+def _segment_nonce(prefix: bytes, index: int, final: bool) -> bytes:
+    if index >= 1 << 32:
+        raise ValueError("Too many segments")
+    return prefix + struct.pack(">IB", index, final)
+
+
+def encrypt_segments(chunks: Iterable[bytes], segment_size: int = DEFAULT_SEGMENT_SIZE) -> Iterator[bytes]:
+    """Yield the header and then one sealed segment per ``segment_size`` bytes of plaintext."""
+    prefix = os.urandom(7)
+    header = STREAM_MAGIC + struct.pack(">I", segment_size) + prefix
+    yield header
+    buf = bytearray()
+    index = 0
+    for chunk in chunks:
+        buf += chunk
+        # Keep at least one byte back: only the last segment may be sealed as final
+        while len(buf) > segment_size:
+            yield _aesgcm.encrypt(_segment_nonce(prefix, index, False), bytes(buf[:segment_size]), header)
+            del buf[:segment_size]
+            index += 1
+    yield _aesgcm.encrypt(_segment_nonce(prefix, index, True), bytes(buf), header)
+
+
+class SegmentDecryptor:
+    """Incremental inverse of ``encrypt_segments``.
+
+    Buffers at most one segment plus the incoming chunk. ``feed`` returns the
+    plaintext of every segment known not to be the last; ``finish`` opens the
+    final one and fails if the stream stopped early.
+    """
+
+    def __init__(self) -> None:
+        self._buf = bytearray()
+        self._header: bytes | None = None
+        self._prefix = b""
+        self._sealed = 0
+        self._index = 0
+        self._done = False
+
+    def feed(self, data: bytes) -> list[bytes]:
+        if self._done:
+            raise ValueError("Data after final segment")
+        self._buf += data
+        if self._header is None:
+            if len(self._buf) < STREAM_HEADER_SIZE:
+                return []
+            header = bytes(self._buf[:STREAM_HEADER_SIZE])
+            if header[:4] != STREAM_MAGIC:
+                raise ValueError("Not a segmented stream")
+            (segment_size,) = struct.unpack(">I", header[4:8])
+            if not MIN_SEGMENT_SIZE <= segment_size <= MAX_SEGMENT_SIZE:
+                raise ValueError("Unsupported segment size")
+            self._header, self._prefix, self._sealed = header, header[8:], segment_size + TAG_SIZE
+            del self._buf[:STREAM_HEADER_SIZE]
+        out = []
+        while len(self._buf) > self._sealed:
+            out.append(self._open(memoryview(self._buf)[:self._sealed], final=False))
+            del self._buf[:self._sealed]
+        return out
+
+    def finish(self) -> bytes:
+        if self._header is None or len(self._buf) < TAG_SIZE:
+            raise ValueError("Truncated stream")
+        self._done = True
+        plaintext = self._open(memoryview(self._buf), final=True)
+        self._buf = bytearray()
+        return plaintext
+
+    def _open(self, sealed: memoryview, final: bool) -> bytes:
+        try:
+            plaintext = _aesgcm.decrypt(_segment_nonce(self._prefix, self._index, final), sealed, self._header)
+        finally:
+            sealed.release()
+        self._index += 1
+        return plaintext
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, create_engine, func, insert, select
+from sqlalchemy.orm import Session
+
+from .models import ChangeLog, Customer, Product
+from .security import encrypt_segments
+
+# Cold-start bootstrap for new devices: a SQLite file holding the live catalog,
+# gzipped and sealed with the segmented sync-key format (see security.py). The
+# file is named after the change_log seq it covers, so a client that imports it
+# continues with /sync/download?after_seq=<seq>.
+SNAPSHOT_DIR = Path(os.getenv("SNAPSHOT_DIR", "./snapshots"))
+SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "3600"))  # 0 disables the builder thread
+SNAPSHOT_KEEP = 2  # the previous file stays while clients may still be downloading it
+COPY_BATCH = 5000
+READ_CHUNK = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+_NAME = re.compile(r"^snapshot-(\d+)\.sgs$")
+
+# Layout of the file inside the envelope. Clients copy these tables into their
+# own products/customers by external_id, so only rows that have one are included.
+_meta = MetaData()
+snapshot_products = Table(
+    "products", _meta,
+    Column("external_id", String(64), primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("category", String(255)),
+    Column("price", Float, nullable=False),
+    Column("cost_price", Float),
+    Column("stock", Integer, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+    Column("deleted_at", DateTime),
+)
+snapshot_customers = Table(
+    "customers", _meta,
+    Column("external_id", String(64), primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("email", String(255)),
+    Column("phone", String(100)),
+    Column("updated_at", DateTime, nullable=False),
+    Column("deleted_at", DateTime),
+)
+snapshot_info = Table(
+    "snapshot_info", _meta,
+    Column("key", String(32), primary_key=True),
+    Column("value", String(64), nullable=False),
+)
+
+_SOURCES = ((snapshot_products, Product), (snapshot_customers, Customer))
+
+
+def snapshot_path(directory: Path, seq: int) -> Path:
+    return directory / f"snapshot-{seq:012d}.sgs"
+
+
+def list_snapshots(directory: Path = SNAPSHOT_DIR) -> list[tuple[int, Path]]:
+    """(seq, path) of every finished snapshot, newest first."""
+    if not directory.is_dir():
+        return []
+    found = [(int(m.group(1)), p) for p in directory.iterdir() if (m := _NAME.match(p.name))]
+    return sorted(found, reverse=True)
+
+
+def latest_snapshot(directory: Path = SNAPSHOT_DIR) -> Optional[tuple[int, Path]]:
+    snapshots = list_snapshots(directory)
+    return snapshots[0] if snapshots else None
+
+
+def _copy_catalog(db: Session, target) -> None:
+    with target.begin() as conn:
+        for table, model in _SOURCES:
+            cols = [model.__table__.c[c.name] for c in table.columns]
+            rows = db.execute(select(*cols).where(model.external_id.is_not(None)).execution_options(yield_per=COPY_BATCH))
+            for batch in rows.partitions():
+                conn.execute(insert(table), [dict(r._mapping) for r in batch])
+
+
+def _sealed_chunks(path: Path) -> Iterator[bytes]:
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_CHUNK):
+            yield gz.compress(chunk)
+    yield gz.flush()
+
+
+def build_snapshot(db: Session, directory: Path = SNAPSHOT_DIR) -> tuple[int, Path]:
+    """Write a snapshot of the current catalog; returns (seq, path).
+
+    The change_log position is read before the rows, so every change up to
+    ``seq`` is in the file. Rows changed after it may be too; replaying those
+    entries on the client is harmless since catalog writes are last-write-wins.
+    If nothing was logged since the newest snapshot, that file is reused.
+    """
+    seq = db.execute(select(func.max(ChangeLog.seq))).scalar() or 0
+    latest = latest_snapshot(directory)
+    if latest is not None and latest[0] == seq:
+        latest[1].touch()
+        return latest
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp_db = tempfile.mkstemp(dir=directory, suffix=".sqlite.tmp")
+    os.close(fd)
+    tmp_out = Path(tmp_db).with_suffix(".sgs.tmp")
+    target = create_engine(f"sqlite:///{Path(tmp_db).as_posix()}")
+    try:
+        _meta.create_all(target)
+        _copy_catalog(db, target)
+        with target.begin() as conn:
+            conn.execute(insert(snapshot_info), [{"key": "seq", "value": str(seq)}, {"key": "format", "value": "1"}])
+        target.dispose()
+        with open(tmp_out, "wb") as out:
+            for part in encrypt_segments(_sealed_chunks(Path(tmp_db))):
+                out.write(part)
+        path = snapshot_path(directory, seq)
+        os.replace(tmp_out, path)
+    finally:
+        target.dispose()
+        for leftover in (Path(tmp_db), tmp_out):
+            leftover.unlink(missing_ok=True)
+    for _, old in list_snapshots(directory)[SNAPSHOT_KEEP:]:
+        old.unlink(missing_ok=True)
+    return seq, path
+
+
+class SnapshotBuilder:
+    """Background thread rebuilding the snapshot every ``interval`` seconds.
+
+    Runs once at start when no snapshot exists or the newest one is older
+    than the interval, so restarts do not postpone the first build.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], interval: int = SNAPSHOT_INTERVAL_SECONDS, directory: Path = SNAPSHOT_DIR) -> None:
+        self.session_factory = session_factory
+        self.interval = interval
+        self.directory = directory
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="snapshot-builder", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _due_in(self) -> float:
+        latest = latest_snapshot(self.directory)
+        if latest is None:
+            return 0.0
+        return max(0.0, latest[1].stat().st_mtime + self.interval - time.time())
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self._due_in()):
+            try:
+                with self.session_factory() as db:
+                    build_snapshot(db, self.directory)
+            except Exception:  # keep the thread alive; the next round retries
+                logger.exception("snapshot build failed")
+                self._stop.wait(min(self.interval, 60))
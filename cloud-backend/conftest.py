@@ -0,0 +1,42 @@
+"""
+Pytest configuration for the cloud backend: isolated database and a fixed sync key.
+"""
+import base64
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+# Must be set before app.db / app.security are imported
+_tmp = tempfile.mkdtemp(prefix="cloud-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{Path(_tmp, 'cloud.db').as_posix()}")
+os.environ.setdefault("SYNC_AES_KEY_BASE64", base64.b64encode(b"\x01" * 32).decode())
+os.environ.setdefault("SNAPSHOT_DIR", str(Path(_tmp, "snapshots")))
+os.environ.setdefault("SNAPSHOT_INTERVAL_SECONDS", "0")
+# Every TestClient request comes from one "IP"; keep the limiter out of the way
+for _var in ("RATE_LIMIT_AUTH", "RATE_LIMIT_SYNC", "RATE_LIMIT_ANALYTICS"):
+    os.environ.setdefault(_var, "100000")
+
+
+@pytest.fixture()
+def db():
+    """Session on a fresh in-memory database with the full schema."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.db import Base
+
+    engine = create_engine("sqlite://", future=True)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, future=True)()
+    try:
+        yield session
+    finally:
+        session.close()
+        # Undisposed in-memory connections get finalized on arbitrary threads later
+        engine.dispose()
@@ -0,0 +1,47 @@
+import hashlib
+from datetime import timedelta
+
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import security
+from app.auth import lookup_agent
+from app.db import SessionLocal, engine
+from app.main import app, get_current_agent
+from app.models import Agent
+
+
+def test_warm_token_needs_no_database_query():
+    client = TestClient(app)
+    tok = client.post("/auth/login", json={"agent_code": "agent-auth", "password": "x"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {tok}"}
+    client.get("/sync/jobs/missing", headers=headers)  # warm both caches
+
+    statements: list[str] = []
+    listener = lambda *a: statements.append(a[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        with SessionLocal() as db:
+            agent = get_current_agent(HTTPAuthorizationCredentials(scheme="Bearer", credentials=tok), db)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert agent.code == "agent-auth"
+    assert statements == []
+
+
+def test_claims_cache_respects_exp_and_agent_writes_invalidate():
+    tok = security.create_access_token({"sub": "agent-exp"}, expires_delta=timedelta(seconds=30))
+    claims = security.verify_token(tok)
+    deadline, cached = security._claims_cache._data[hashlib.sha256(tok.encode()).digest()]
+    assert cached == claims and deadline <= claims["exp"]
+
+    with SessionLocal() as db:
+        assert lookup_agent(db, "agent-renamed") is None
+        db.add(Agent(code="agent-renamed", password_hash="x"))
+        db.commit()
+        assert lookup_agent(db, "agent-renamed").code == "agent-renamed"
+        row = db.query(Agent).filter_by(code="agent-renamed").one()
+        db.delete(row)
+        db.commit()
+        assert lookup_agent(db, "agent-renamed") is None
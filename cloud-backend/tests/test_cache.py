@@ -0,0 +1,42 @@
+import gzip
+import json
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app.cache import ResponseCache
+from app.main import analytics_cache, app
+from app.security import aesgcm_encrypt
+
+
+def test_response_cache_lru_and_watermark():
+    cache = ResponseCache(maxsize=2, ttl=60)
+    cache.put("a", 1, b"A")
+    cache.put("b", 1, b"B")
+    assert cache.get("a", 1).body == b"A"
+    cache.put("c", 1, b"C")  # evicts b, the least recently used
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 2) is None  # watermark moved on
+
+
+def test_analytics_etag_and_invalidation_on_upload():
+    client = TestClient(app)
+    admin = client.post("/auth/login", json={"agent_code": "admin", "password": "x"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {admin}"}
+    analytics_cache.clear()
+
+    first = client.get("/analytics/category_pie?days=30", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    hits = analytics_cache.hits
+    again = client.get("/analytics/category_pie?days=30", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304 and analytics_cache.hits == hits + 1
+
+    now = datetime.utcnow().isoformat()
+    body = {"sales": [{"external_id": "cache-sale-1", "agent_code": "a", "created_at": now, "updated_at": now,
+                       "items": [{"product_external_id": "cache-sku", "quantity": 1, "price": 3}]}]}
+    enc = aesgcm_encrypt(gzip.compress(json.dumps(body).encode()))
+    assert client.post("/sync/upload", json=enc, headers=headers).status_code == 200
+
+    fresh = client.get("/analytics/category_pie?days=30", headers={**headers, "If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["etag"] != etag
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from app.changelog import compact_change_log, fetch_changes
+from app.ingest import ingest_batch, record_catalog_changes
+from app.models import ChangeLog, Product
+from app.schemas import SyncUploadBody
+
+
+def _products(t: datetime, *skus: str) -> SyncUploadBody:
+    return SyncUploadBody(products=[{"external_id": sku, "name": sku, "price": 1, "stock": 1, "updated_at": t} for sku in skus])
+
+
+def test_uploads_and_orm_edits_are_logged_in_order(db):
+    t = datetime(2024, 1, 1)
+    ingest_batch(db, _products(t, "A", "B"))
+    ingest_batch(db, _products(t, "A"))  # stale: skipped, not logged
+    ingest_batch(db, _products(t + timedelta(hours=1), "B"))
+    db.commit()
+    assert [(e.entity, e.external_id) for e in db.execute(select(ChangeLog).order_by(ChangeLog.seq)).scalars()] == [
+        ("product", "A"), ("product", "B"), ("product", "B"),
+    ]
+
+    rows, deleted, last_seq, has_more = fetch_changes(db, 0, 2)
+    assert [p.external_id for p in rows["product"]] == ["A", "B"] and has_more
+    rows, deleted, last_seq, has_more = fetch_changes(db, last_seq, 10)
+    assert [p.external_id for p in rows["product"]] == ["B"] and not has_more
+    assert fetch_changes(db, last_seq, 10)[0]["product"] == []
+
+    db.delete(db.execute(select(Product).where(Product.external_id == "A")).scalar_one())
+    db.commit()
+    rows, deleted, after, _ = fetch_changes(db, last_seq, 10)
+    assert deleted == [("product", "A")] and rows["product"] == [] and after == last_seq + 1
+
+
+def test_batches_of_one_transaction_log_their_changes_once(db):
+    t = datetime(2024, 1, 1)
+    changes: list[tuple[str, str]] = []
+    ingest_batch(db, _products(t, "A", "B"), changes)
+    ingest_batch(db, _products(t + timedelta(hours=1), "A"), changes)
+    assert db.scalar(select(func.count(ChangeLog.seq))) == 0
+    record_catalog_changes(db, changes)
+    db.commit()
+    assert [e.external_id for e in db.execute(select(ChangeLog).order_by(ChangeLog.seq)).scalars()] == ["A", "B"]
+
+
+def test_compaction_keeps_newest_entry_per_row(db):
+    t = datetime(2024, 1, 1)
+    for i in range(3):
+        ingest_batch(db, _products(t + timedelta(hours=i), "A", "B"))
+    ingest_batch(db, _products(t + timedelta(hours=5), "C"))
+    db.commit()
+    assert compact_change_log(db) == 4
+    db.commit()
+    assert db.scalar(select(func.count(ChangeLog.seq))) == 3
+    rows, _, last_seq, _ = fetch_changes(db, 0, 10)
+    assert sorted(p.external_id for p in rows["product"]) == ["A", "B", "C"]
+    assert last_seq == 7
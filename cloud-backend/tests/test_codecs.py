@@ -0,0 +1,56 @@
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.codecs import CODECS, compress, save_dictionary
+from app.db import SessionLocal
+from app.ingest import decrypt_upload
+from app.main import app
+from app.schemas import EncryptedPayload
+from app.security import aesgcm_encrypt
+
+
+def _enc(raw: bytes, **fields) -> EncryptedPayload:
+    return EncryptedPayload(**aesgcm_encrypt(raw), **fields)
+
+
+def test_codec_field_selects_decoder():
+    body = {"sales": []}
+    raw = json.dumps(body).encode()
+    assert json.loads(decrypt_upload(_enc(gzip.compress(raw)))) == body  # legacy: no codec field
+    assert json.loads(decrypt_upload(_enc(raw))) == body
+    assert json.loads(decrypt_upload(_enc(gzip.compress(raw), codec="gzip"))) == body
+    assert json.loads(decrypt_upload(_enc(raw, codec="identity"))) == body
+    with pytest.raises(ValueError):
+        decrypt_upload(_enc(raw, codec="brotli"))
+
+
+def test_zstd_dictionary_roundtrip(db):
+    zstandard = pytest.importorskip("zstandard")
+    samples = [json.dumps({"sales": [{"external_id": f"agent-001-{i}-{j}", "agent_code": "agent-001"} for j in range(20)]}).encode() for i in range(200)]
+    zdict = zstandard.train_dictionary(4096, samples).as_bytes()
+    dict_id = save_dictionary(db, zdict)
+    raw = samples[0]
+    assert json.loads(decrypt_upload(_enc(compress(raw, "zstd-dict", zdict), codec="zstd-dict", dict_id=dict_id), db)) == json.loads(raw)
+    assert json.loads(decrypt_upload(_enc(compress(raw, "zstd"), codec="zstd"), db)) == json.loads(raw)
+
+
+def test_download_advertises_codecs_and_ships_stale_dictionary():
+    with SessionLocal() as db:
+        dict_id = save_dictionary(db, b"not-a-real-dictionary")
+        db.commit()
+    with TestClient(app) as client:
+        tok = client.post("/auth/login", json={"agent_code": "agent-codec", "password": "x"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {tok}"}
+        since = datetime.utcnow().isoformat()
+        r = client.get("/sync/download", params={"since": since, "limit": 10, "dict_id": 0}, headers=headers).json()
+        assert r["codecs"] == list(CODECS)
+        if "zstd-dict" in CODECS:
+            assert r["dictionary"]["id"] == dict_id
+        else:
+            assert r["dictionary"] is None
+        current = client.get("/sync/download", params={"since": since, "limit": 10, "dict_id": dict_id}, headers=headers).json()
+        assert current["dictionary"] is None
@@ -0,0 +1,87 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.digest import LEAF_ROWS, CatalogDigest, _FIELDS, row_hash
+from app.main import app
+from app.security import aesgcm_encrypt_frame
+
+
+def test_row_hash_encoding_is_pinned():
+    # The desktop client must produce the same bytes (its tests/test_reconcile.py pins these too)
+    p = SimpleNamespace(external_id="SKU-1", name="Tea", price=Decimal("2.5"), stock=7, updated_at=datetime(2024, 1, 2, 3, 4, 5, 600000))
+    c = SimpleNamespace(external_id="C-1", name="Ann", email=None, phone="555", updated_at=datetime(2024, 1, 2))
+    assert row_hash(_FIELDS["product"](p)).hex() == "30b52f82a8bdfb9de62f538460e23a9b"
+    assert row_hash(_FIELDS["customer"](c)).hex() == "62ce4826bf53fb4bd2c890eeb601673b"
+
+
+def test_children_partition_the_range():
+    n = LEAF_ROWS * 20
+    digest = CatalogDigest([(f"K{i:05d}", i.to_bytes(16, "big")) for i in range(n)])
+    children = digest.children("", "", 16)
+    assert len(children) == 16 and {c.count for c in children} == {n // 16}
+    assert children[0].lo == "" and children[-1].hi == ""
+    assert all(a.hi == b.lo for a, b in zip(children, children[1:]))
+    assert digest.range("", "").count == n
+    leaf = digest.children(children[3].lo, children[3].hi, 2)[0]
+    assert leaf.count <= LEAF_ROWS and digest.children(leaf.lo, leaf.hi) == []
+
+
+def _frame(body: dict) -> bytes:
+    return aesgcm_encrypt_frame(json.dumps(body).encode())
+
+
+def test_digest_endpoints_narrow_down_to_changed_rows():
+    now = datetime.utcnow().isoformat()
+    products = [{"external_id": f"DIG-{i:04d}", "name": f"Digest {i}", "price": 1, "stock": 1, "updated_at": now} for i in range(600)]
+    with TestClient(app) as client:
+        tok = client.post("/auth/login", json={"agent_code": "agent-dig", "password": "x"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {tok}"}
+        client.post("/sync/upload.bin", content=_frame({"products": products}), headers=headers)
+        before = client.get("/sync/digest", params={"entity": "product", "lo": "DIG-", "hi": "DIG."}, headers=headers).json()
+        assert before["count"] == 600 and len(before["children"]) == 16
+
+        changed = dict(products[123], stock=5, updated_at=datetime.utcnow().isoformat())
+        client.post("/sync/upload.bin", content=_frame({"products": [changed]}), headers=headers)
+        after = client.get("/sync/digest", params={"entity": "product", "lo": "DIG-", "hi": "DIG."}, headers=headers).json()
+        differ = [b for a, b in zip(before["children"], after["children"]) if a != b]
+        assert len(differ) == 1 and differ[0]["lo"] <= "DIG-0123" < differ[0]["hi"]
+
+        rows = client.get("/sync/digest/rows", params={"entity": "product", "lo": differ[0]["lo"], "hi": differ[0]["hi"]}, headers=headers).json()
+        assert len(rows["products"]) == differ[0]["count"]
+        assert [p["stock"] for p in rows["products"] if p["external_id"] == "DIG-0123"] == [5]
+        assert client.get("/sync/digest", params={"entity": "sale"}, headers=headers).status_code == 422
+
+
+def test_cache_applies_logged_changes_without_rebuilding(db, monkeypatch):
+    import app.digest as digest_mod
+    from app.ingest import ingest_batch
+    from app.models import Product
+    from app.schemas import SyncUploadBody
+
+    t = datetime(2024, 1, 1)
+    ingest_batch(db, SyncUploadBody(products=[{"external_id": f"INC-{i:03d}", "name": f"Inc {i}", "price": 1, "stock": 1, "updated_at": t} for i in range(50)]))
+    db.commit()
+    cache = digest_mod.DigestCache()
+    cache.get(db, "product")
+
+    builds = []
+    monkeypatch.setattr(digest_mod, "build_digest", lambda *a: builds.append(a) or pytest.fail("full rebuild"))
+    ingest_batch(db, SyncUploadBody(products=[
+        {"external_id": "INC-007", "name": "Inc 7", "price": 2, "stock": 1, "updated_at": datetime(2024, 2, 1)},
+        {"external_id": "INC-008", "name": "Inc 8", "price": 1, "stock": 1, "updated_at": datetime(2024, 2, 1), "deleted_at": datetime(2024, 2, 1)},
+        {"external_id": "INC-100", "name": "Inc 100", "price": 1, "stock": 1, "updated_at": datetime(2024, 2, 1)},
+    ]))
+    db.commit()
+    db.delete(db.query(Product).filter_by(external_id="INC-009").one())
+    db.commit()
+    incremental = cache.get(db, "product")
+    monkeypatch.undo()
+
+    full = digest_mod.build_digest(db, "product")
+    assert incremental.ids == full.ids and incremental.hashes == full.hashes
+    assert "INC-100" in incremental.ids and "INC-008" not in incremental.ids and "INC-009" not in incremental.ids
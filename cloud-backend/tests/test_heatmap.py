@@ -0,0 +1,41 @@
+import random
+from datetime import datetime, timedelta
+
+from app.ingest import ingest_batch
+from app.rollups import heatmap_grid, rebuild_hourly_counts
+from app.schemas import SyncUploadBody
+
+
+def _brute_force(sales: list[dict], since: datetime, tz_offset: int, agent=None) -> list[list[int]]:
+    grid = [[0] * 24 for _ in range(7)]
+    for s in sales:
+        if s["created_at"].replace(minute=0, second=0, microsecond=0) < since.replace(minute=0, second=0, microsecond=0):
+            continue
+        if agent and s["agent_code"] != agent:
+            continue
+        local = s["created_at"] + timedelta(minutes=tz_offset)
+        grid[(local.weekday() + 1) % 7][local.hour] += 1
+    return grid
+
+
+def test_heatmap_counters_match_brute_force_recount(db):
+    rng = random.Random(7)
+    now = datetime(2024, 6, 30, 18, 30)
+    sales = [
+        {
+            "external_id": f"h-{i}", "agent_code": rng.choice(["a1", "a2", "a3"]),
+            "created_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 120)), "updated_at": now,
+        }
+        for i in range(3000)
+    ]
+    for start in range(0, len(sales), 700):
+        ingest_batch(db, SyncUploadBody(sales=sales[start:start + 700]))
+        db.commit()
+
+    for days, tz, agent in ((30, 0, None), (90, 300, None), (365, -480, "a2"), (7, 60, "a1")):
+        since = now - timedelta(days=days)
+        assert heatmap_grid(db, since, tz, agent) == _brute_force(sales, since, tz, agent)
+
+    rebuild_hourly_counts(db)
+    since = now - timedelta(days=365)
+    assert heatmap_grid(db, since, 300) == _brute_force(sales, since, 300)
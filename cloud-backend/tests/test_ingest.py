@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, select
+
+from app.ingest import ingest_batch
+from app.models import Product, Sale, SaleItem
+from app.schemas import SyncUploadBody
+
+
+def _body(n_sales: int, t: datetime) -> SyncUploadBody:
+    return SyncUploadBody(
+        products=[{"external_id": "SKU-1", "name": "Widget", "price": 9.99, "stock": 5, "updated_at": t}],
+        sales=[
+            {
+                "external_id": f"s-{i}", "agent_code": "agent-001", "created_at": t, "updated_at": t,
+                "items": [{"product_external_id": "SKU-1", "quantity": 2, "price": 9.99}],
+            }
+            for i in range(n_sales)
+        ],
+    )
+
+
+def test_ingest_insert_update_skip(db):
+    t = datetime(2024, 1, 1)
+    results = ingest_batch(db, _body(3, t))
+    db.commit()
+    assert [r.status for r in results] == ["inserted"] * 4
+    assert db.scalar(select(func.count(SaleItem.id))) == 3
+
+    again = _body(3, t)
+    again.products[0].name = "Renamed"
+    assert [r.status for r in ingest_batch(db, again)] == ["skipped"] + ["exists"] * 3
+
+    newer = _body(0, t + timedelta(hours=1))
+    newer.products[0].name = "Renamed"
+    assert [r.status for r in ingest_batch(db, newer)] == ["updated"]
+    db.commit()
+    assert db.scalar(select(Product.name)) == "Renamed"
+
+
+def test_ingest_items_follow_their_sale(db):
+    t = datetime(2024, 1, 1)
+    body = _body(2, t)
+    body.sales[1].items[0].quantity = 7
+    ingest_batch(db, body)
+    db.commit()
+    qty = dict(db.execute(select(Sale.external_id, SaleItem.quantity).join(SaleItem, Sale.id == SaleItem.sale_id)).all())
+    assert qty == {"s-0": 2, "s-1": 7}
+
+
+def test_ingest_statement_count_is_constant(db):
+    statements: list[str] = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *a: statements.append(a[2]))
+    ingest_batch(db, _body(1200, datetime(2024, 1, 1)))
+    # product prefetch+insert, customer nothing, 3 sale prefetch chunks, sales insert, items insert
+    assert len(statements) < 20
+
+
+def test_sale_unknown_to_bloom_filter_reports_exists(db):
+    from app.bloom import known_sales
+
+    known_sales.reset()  # the filter is process-wide; other tests used the same ids
+    t = datetime(2024, 1, 1)
+    ingest_batch(db, _body(1, t))
+    # Another worker inserts a sale this process's filter has never seen
+    db.add(Sale(external_id="s-1", agent_code="agent-002", created_at=t, updated_at=t))
+    db.commit()
+    assert "s-1" not in known_sales.maybe_known(db, ["s-1"])
+
+    results = ingest_batch(db, _body(3, t))
+    assert [r.status for r in results if r.type == "sale"] == ["exists", "exists", "inserted"]
+    db.commit()
+    assert db.scalar(select(func.count(Sale.id))) == 3
+
+
+def test_concurrent_new_sku_resolves_by_updated_at(db, monkeypatch):
+    import app.ingest as ingest
+
+    t = datetime(2024, 1, 1)
+    ingest_batch(db, _body(0, t))
+    db.commit()
+    # A second upload that prefetched before the first one committed still sees SKU-1 as new
+    monkeypatch.setattr(ingest, "_prefetch", lambda *a, **k: {})
+    older = _body(0, t - timedelta(hours=1))
+    older.products[0].name = "Stale"
+    assert [r.status for r in ingest_batch(db, older)] == ["skipped"]
+    newer = _body(0, t + timedelta(hours=1))
+    newer.products[0].name = "Racer"
+    assert [r.status for r in ingest_batch(db, newer)] == ["inserted"]
+    db.commit()
+    assert db.scalars(select(Product.name)).all() == ["Racer"]
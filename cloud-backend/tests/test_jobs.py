@@ -0,0 +1,81 @@
+import gzip
+import json
+import time
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.security import aesgcm_encrypt
+
+
+def _encrypted(body: dict) -> dict:
+    return aesgcm_encrypt(gzip.compress(json.dumps(body).encode("utf-8")))
+
+
+def _login(client: TestClient, agent: str) -> dict:
+    tok = client.post("/auth/login", json={"agent_code": agent, "password": "x"}).json()["access_token"]
+    return {"Authorization": f"Bearer {tok}"}
+
+
+def test_async_upload_reports_results_through_job_status():
+    now = datetime.utcnow().isoformat()
+    body = {"sales": [{"external_id": "job-sale-1", "agent_code": "agent-job", "created_at": now, "updated_at": now, "items": []}]}
+    with TestClient(app) as client:
+        headers = _login(client, "agent-job")
+        accepted = client.post("/sync/upload/async", json=_encrypted(body), headers=headers)
+        assert accepted.status_code == 202
+        job_id = accepted.json()["job_id"]
+
+        deadline = time.time() + 10
+        while True:
+            status = client.get(f"/sync/jobs/{job_id}", headers=headers).json()
+            if status["status"] in ("done", "failed") or time.time() > deadline:
+                break
+            time.sleep(0.05)
+        assert status["status"] == "done"
+        assert status["result"]["results"] == [{"type": "sale", "external_id": "job-sale-1", "status": "inserted"}]
+
+        other = _login(client, "agent-other")
+        assert client.get(f"/sync/jobs/{job_id}", headers=other).status_code == 404
+
+
+def test_async_upload_with_bad_ciphertext_fails_job():
+    with TestClient(app) as client:
+        headers = _login(client, "agent-job")
+        enc = _encrypted({})
+        enc["tag"] = enc["nonce"][:len(enc["tag"])]
+        job_id = client.post("/sync/upload/async", json=enc, headers=headers).json()["job_id"]
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            status = client.get(f"/sync/jobs/{job_id}", headers=headers).json()
+            if status["status"] == "failed":
+                break
+            time.sleep(0.05)
+        assert status["status"] == "failed" and status["error"]
+
+
+def test_only_transient_errors_are_retried(db, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+
+    from app import jobs
+    from app.schemas import EncryptedPayload
+
+    bad = _encrypted({})
+    bad["tag"] = bad["nonce"][:len(bad["tag"])]
+    job_id = jobs.submit_job(db, EncryptedPayload(**bad), "agent-job").id
+    assert jobs.claim_next(db) == job_id
+    jobs.run_job(db, job_id)
+    job = db.get(jobs.IngestJob, job_id)
+    assert (job.status, job.attempts) == ("failed", 1)
+
+    def locked(db, body):
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(jobs, "ingest_batch", locked)
+    job_id = jobs.submit_job(db, EncryptedPayload(**_encrypted({})), "agent-job").id
+    for attempt in range(1, jobs.JOB_MAX_ATTEMPTS + 1):
+        assert jobs.claim_next(db) == job_id
+        jobs.run_job(db, job_id)
+        job = db.get(jobs.IngestJob, job_id)
+        assert job.status == ("failed" if attempt == jobs.JOB_MAX_ATTEMPTS else "queued")
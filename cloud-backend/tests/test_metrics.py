@@ -0,0 +1,26 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.metrics import Histogram, Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    reg = Registry()
+    h = Histogram("t_latency", "test", ("route",), buckets=(0.1, 1.0), registry=reg)
+    for v in (0.05, 0.5, 0.5, 3.0):
+        h.observe(v, route="/x")
+    text = reg.render()
+    assert 't_latency_bucket{route="/x",le="0.1"} 1' in text
+    assert 't_latency_bucket{route="/x",le="1"} 3' in text
+    assert 't_latency_bucket{route="/x",le="+Inf"} 4' in text
+    assert 't_latency_count{route="/x"} 4' in text
+
+
+def test_metrics_endpoint_reports_route_templates():
+    client = TestClient(app)
+    tok = client.post("/auth/login", json={"agent_code": "agent-metrics", "password": "x"}).json()["access_token"]
+    client.get("/sync/jobs/does-not-exist", headers={"Authorization": f"Bearer {tok}"})
+    text = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="POST",route="/auth/login",status="200"}' in text
+    assert 'route="/sync/jobs/{job_id}",status="404"' in text
+    assert "# TYPE http_requests_in_flight gauge" in text
@@ -0,0 +1,100 @@
+import re
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+
+from app.db import Base, SessionLocal, engine
+from app.ingest import ingest_batch
+from app.main import app
+from app.migrate import TARGET_VERSION, migrate
+from app.schemas import SyncUploadBody
+
+FULL_SCAN = re.compile(r"^SCAN (sales|sale_items|products|customers|daily_sales_rollup|change_log)(?! USING)")
+
+
+def test_migrate_is_idempotent(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'm.db'}")
+    Base.metadata.create_all(bind=eng)
+    assert migrate(eng) == TARGET_VERSION
+    assert migrate(eng) == TARGET_VERSION
+    with eng.connect() as conn:
+        names = {r[0] for r in conn.execute(text("SELECT name FROM sqlite_master WHERE type='index'"))}
+    assert {"ix_sales_created_at", "ix_sale_items_sale", "ix_products_updated_at"} <= names
+
+
+def _plans_for(client: TestClient, headers: dict, urls: list[str]) -> dict[str, list[str]]:
+    captured: list[tuple[str, tuple]] = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            captured.append((statement, parameters))
+
+    plans: dict[str, list[str]] = {}
+    event.listen(engine, "before_cursor_execute", _capture)
+    try:
+        for url in urls:
+            captured.clear()
+            assert client.get(url, headers=headers).status_code == 200
+            raw = engine.raw_connection()
+            try:
+                cur = raw.cursor()
+                plans[url] = [
+                    row[3]
+                    for stmt, params in captured
+                    for row in cur.execute("EXPLAIN QUERY PLAN " + stmt, params).fetchall()
+                ]
+            finally:
+                raw.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", _capture)
+    return plans
+
+
+def test_analytics_and_download_queries_use_indexes():
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        ingest_batch(db, SyncUploadBody(
+            products=[{"external_id": f"ix-p-{i}", "name": "p", "category": "c", "price": 1, "cost_price": 0.5, "stock": 1, "updated_at": now} for i in range(50)],
+            sales=[
+                {"external_id": f"ix-s-{i}", "agent_code": "a", "created_at": now - timedelta(days=i % 200), "updated_at": now,
+                 "items": [{"product_external_id": f"ix-p-{i % 50}", "quantity": 1, "price": 1}]}
+                for i in range(500)
+            ],
+        ))
+        db.commit()
+    client = TestClient(app)
+    tok = client.post("/auth/login", json={"agent_code": "admin", "password": "x"}).json()["access_token"]
+    plans = _plans_for(client, {"Authorization": f"Bearer {tok}"}, [
+        "/analytics/trend?days=30",
+        "/analytics/category_pie?days=30",
+        f"/sync/download?since={(now - timedelta(hours=1)).isoformat()}&limit=10",
+        "/sync/download?after_seq=10&limit=10",
+    ])
+    for url, details in plans.items():
+        assert details, url
+        scans = [d for d in details if FULL_SCAN.match(d)]
+        assert not scans, f"{url}: {scans}"
+
+
+def test_concurrent_migrate_runs_each_step_once(tmp_path, monkeypatch):
+    import threading
+    import time
+
+    import app.migrate as m
+
+    eng = create_engine(f"sqlite:///{tmp_path / 'm.db'}")
+    runs = []
+
+    def slow_step(conn):
+        runs.append(1)
+        time.sleep(0.3)
+
+    monkeypatch.setattr(m, "MIGRATIONS", [(1, [slow_step]), (2, ["CREATE TABLE t2 (id INTEGER)"])])
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(m.migrate(eng))) for _ in range(3)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert results == [2, 2, 2] and runs == [1]
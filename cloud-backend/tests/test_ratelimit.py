@@ -0,0 +1,58 @@
+from app.ratelimit import Budget, SQLiteTokenBucketLimiter, TokenBucketLimiter, route_class
+
+BUDGETS = {"sync": Budget(rate=1.0, burst=3), "default": Budget(rate=10.0, burst=5)}
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.t = 1000.0
+
+    def __call__(self) -> float:
+        return self.t
+
+
+def _drain(limiter, n: int) -> list[bool]:
+    return [limiter.hit("sync", "1.2.3.4")[0] for _ in range(n)]
+
+
+def test_route_classes():
+    assert route_class("/sync/upload") == "sync"
+    assert route_class("/analytics/trend") == "analytics"
+    assert route_class("/auth/login") == "auth"
+    assert route_class("/metrics") == "default"
+
+
+def test_memory_bucket_burst_refill_and_capacity():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(BUDGETS, max_keys=3, clock=clock)
+    assert _drain(limiter, 4) == [True, True, True, False]
+    allowed, retry = limiter.hit("sync", "1.2.3.4")
+    assert not allowed and 0 < retry <= 1
+    clock.t += 1.0
+    assert _drain(limiter, 2) == [True, False]
+    # other classes and clients have their own buckets
+    assert limiter.hit("default", "1.2.3.4")[0]
+    for ip in ("a", "b", "c"):
+        limiter.hit("sync", ip)
+    assert len(limiter) == 3
+
+
+def test_sqlite_buckets_are_shared_between_instances(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "rl.db")
+    first = SQLiteTokenBucketLimiter(path, BUDGETS, clock=clock)
+    second = SQLiteTokenBucketLimiter(path, BUDGETS, clock=clock)
+    assert _drain(first, 2) == [True, True]
+    assert _drain(second, 2) == [True, False]
+    clock.t += 2.0
+    assert _drain(first, 3) == [True, True, False]
+
+
+def test_sqlite_purges_idle_buckets(tmp_path):
+    clock = FakeClock()
+    limiter = SQLiteTokenBucketLimiter(str(tmp_path / "rl.db"), BUDGETS, max_keys=10, clock=clock, purge_every=5)
+    for i in range(4):
+        limiter.hit("sync", f"ip-{i}")
+    clock.t += 60
+    limiter.hit("sync", "fresh")  # fifth call triggers the purge
+    assert len(limiter) == 1
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app.cache import current_watermark
+from app.ingest import ingest_batch
+from app.models import DailySalesRollup, IngestWatermark
+from app.rollups import rebuild_daily_rollup, rebuild_hourly_counts
+from app.schemas import SyncUploadBody
+
+
+def _rollup(db) -> list[tuple]:
+    rows = db.execute(select(DailySalesRollup).order_by(DailySalesRollup.day, DailySalesRollup.agent_code, DailySalesRollup.product_external_id)).scalars()
+    return [(r.day, r.agent_code, r.product_external_id, r.category, round(float(r.revenue), 2), round(float(r.cost), 2), r.quantity) for r in rows]
+
+
+def test_incremental_rollup_matches_rebuild(db):
+    t = datetime(2024, 3, 1, 12)
+    products = [
+        {"external_id": "SKU-1", "name": "A", "category": "Tools", "price": 10, "cost_price": 6, "stock": 1, "updated_at": t},
+        {"external_id": "SKU-2", "name": "B", "price": 20, "stock": 1, "updated_at": t},
+    ]
+    for batch in range(3):
+        sales = [
+            {
+                "external_id": f"r-{batch}-{i}", "agent_code": f"agent-{i % 2}",
+                "created_at": t + timedelta(hours=7 * i), "updated_at": t,
+                "items": [
+                    {"product_external_id": "SKU-1", "quantity": i + 1, "price": 10},
+                    {"product_external_id": "SKU-2", "quantity": 1, "price": 20},
+                    {"product_external_id": "SKU-unknown", "quantity": 2, "price": 5},
+                ],
+            }
+            for i in range(6)
+        ]
+        ingest_batch(db, SyncUploadBody(products=products if batch == 0 else [], sales=sales))
+        db.commit()
+
+    incremental = _rollup(db)
+    assert incremental
+    # Day one, agent-0 is sale i=0 (qty 1) in each of the 3 batches; i=2 and i=4 fall on day two
+    tools = [r for r in incremental if r[:3] == (t.date(), "agent-0", "SKU-1")]
+    assert tools == [(t.date(), "agent-0", "SKU-1", "Tools", 30, 18, 3)]
+    unknown = [r for r in incremental if r[2] == "SKU-unknown"]
+    assert all(r[3] == "" and r[4] == r[5] for r in unknown)
+
+    rebuild_daily_rollup(db)
+    db.commit()
+    assert _rollup(db) == incremental
+
+
+def test_rebuild_invalidates_cached_analytics(db):
+    db.add(IngestWatermark(id=1, value=0))
+    db.commit()
+    rebuild_daily_rollup(db)
+    rebuild_hourly_counts(db)
+    db.commit()
+    assert current_watermark(db) == 2
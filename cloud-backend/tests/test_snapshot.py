@@ -0,0 +1,58 @@
+import gzip
+import sqlite3
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app.db import SessionLocal
+from app.ingest import ingest_batch
+from app.main import app
+from app.schemas import SyncUploadBody
+from app.security import SegmentDecryptor
+from app.snapshot import build_snapshot, list_snapshots
+
+
+def _open(sealed: bytes, tmp_path) -> sqlite3.Connection:
+    d = SegmentDecryptor()
+    plain = b"".join(d.feed(sealed)) + d.finish()
+    path = tmp_path / "opened.sqlite"
+    path.write_bytes(gzip.decompress(plain))
+    return sqlite3.connect(path)
+
+
+def test_snapshot_holds_catalog_at_its_seq(db, tmp_path):
+    t = datetime(2024, 1, 1)
+    ingest_batch(db, SyncUploadBody(
+        products=[{"external_id": f"SNAP-{i}", "name": f"P{i}", "price": 1.5, "stock": i, "updated_at": t} for i in range(3)],
+        customers=[{"external_id": "C-1", "name": "Ann", "updated_at": t}],
+    ))
+    db.commit()
+    seq, path = build_snapshot(db, tmp_path / "out")
+    assert seq == 4 and path.name == "snapshot-000000000004.sgs"
+
+    conn = _open(path.read_bytes(), tmp_path)
+    assert conn.execute("SELECT value FROM snapshot_info WHERE key = 'seq'").fetchone() == ("4",)
+    assert conn.execute("SELECT external_id, stock FROM products ORDER BY external_id").fetchall() == [("SNAP-0", 0), ("SNAP-1", 1), ("SNAP-2", 2)]
+    assert conn.execute("SELECT name FROM customers").fetchall() == [("Ann",)]
+    conn.close()
+
+    # Nothing logged since: the file is reused; newer builds keep only the latest two
+    assert build_snapshot(db, tmp_path / "out") == (seq, path)
+    for n in range(2):
+        ingest_batch(db, SyncUploadBody(products=[{"external_id": f"SNAP-X{n}", "name": f"X{n}", "price": 1, "stock": 1, "updated_at": t}]))
+        db.commit()
+        build_snapshot(db, tmp_path / "out")
+    assert [s for s, _ in list_snapshots(tmp_path / "out")] == [6, 5]
+
+
+def test_snapshot_endpoint():
+    with TestClient(app) as client:
+        tok = client.post("/auth/login", json={"agent_code": "agent-snap", "password": "x"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {tok}"}
+        assert client.get("/sync/snapshot", headers=headers).status_code == 404
+        with SessionLocal() as db:
+            seq, path = build_snapshot(db)
+        r = client.get("/sync/snapshot", headers=headers)
+        assert r.status_code == 200
+        assert r.headers["X-Snapshot-Seq"] == str(seq) and r.content == path.read_bytes()
+        assert client.get("/sync/snapshot").status_code in (401, 403)
@@ -0,0 +1,144 @@
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.security import SegmentDecryptor, aesgcm_encrypt_frame, encrypt_segments
+
+
+def _login(client: TestClient, agent: str) -> dict:
+    tok = client.post("/auth/login", json={"agent_code": agent, "password": "x"}).json()["access_token"]
+    return {"Authorization": f"Bearer {tok}"}
+
+
+def test_binary_upload_matches_json_upload():
+    now = datetime.utcnow().isoformat()
+    body = {"sales": [{"external_id": "bin-sale-1", "agent_code": "agent-bin", "created_at": now, "updated_at": now, "items": []}]}
+    frame = aesgcm_encrypt_frame(gzip.compress(json.dumps(body).encode("utf-8")))
+    with TestClient(app) as client:
+        headers = {**_login(client, "agent-bin"), "Content-Type": "application/octet-stream"}
+        r = client.post("/sync/upload.bin", content=frame, headers=headers)
+        assert r.status_code == 200
+        assert r.json()["results"] == [{"type": "sale", "external_id": "bin-sale-1", "status": "inserted"}]
+
+        again = client.post("/sync/upload.bin", content=frame, headers=headers)
+        assert again.json()["results"][0]["status"] == "exists"
+
+
+def test_binary_upload_rejects_bad_frames():
+    frame = aesgcm_encrypt_frame(b"{}")
+    with TestClient(app) as client:
+        headers = _login(client, "agent-bin")
+        assert client.post("/sync/upload.bin", content=frame[:20], headers=headers).status_code == 400
+        tampered = frame[:-1] + bytes([frame[-1] ^ 1])
+        assert client.post("/sync/upload.bin", content=tampered, headers=headers).status_code == 400
+
+
+def test_summary_response_mode():
+    now = datetime.utcnow().isoformat()
+    sales = [{"external_id": f"sum-sale-{i}", "agent_code": "agent-sum", "created_at": now, "updated_at": now, "items": []} for i in range(3)]
+    stale = {"external_id": "SUM-SKU", "name": "Old", "price": 1, "stock": 1, "updated_at": "2000-01-01T00:00:00"}
+    fresh = dict(stale, name="New", updated_at=now)
+    with TestClient(app) as client:
+        headers = _login(client, "agent-sum")
+        first = aesgcm_encrypt_frame(json.dumps({"products": [fresh], "sales": sales[:2]}).encode())
+        r = client.post("/sync/upload.bin", params={"response": "summary"}, content=first, headers=headers).json()
+        assert r["counts"] == {"product": {"inserted": 1}, "sale": {"inserted": 2}}
+        assert r["exceptions"] == [] and r["status_rle"] is None
+
+        second = aesgcm_encrypt_frame(json.dumps({"products": [stale], "sales": sales}).encode())
+        r = client.post("/sync/upload.bin", params={"response": "rle"}, content=second, headers=headers).json()
+        assert r["counts"] == {"product": {"skipped": 1}, "sale": {"exists": 2, "inserted": 1}}
+        assert r["exceptions"] == [{"type": "product", "external_id": "SUM-SKU", "status": "skipped"}]
+        assert r["status_rle"] == "1S2E1I"
+
+        bad = client.post("/sync/upload.bin", params={"response": "terse"}, content=second, headers=headers)
+        assert bad.status_code == 422
+
+
+def test_retry_with_idempotency_key_replays_stored_response():
+    now = datetime.utcnow().isoformat()
+    body = {"sales": [{"external_id": "idem-sale-1", "agent_code": "agent-idem", "created_at": now, "updated_at": now, "items": []}]}
+    frame = aesgcm_encrypt_frame(json.dumps(body).encode())
+    with TestClient(app) as client:
+        headers = {**_login(client, "agent-idem"), "Idempotency-Key": "batch-0001"}
+        first = client.post("/sync/upload.bin", content=frame, headers=headers)
+        retry = client.post("/sync/upload.bin", content=b"not even decryptable", headers=headers)
+        assert retry.status_code == 200 and retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.content == first.content
+        assert first.json()["results"][0]["status"] == "inserted"
+
+        # Keys are scoped per agent
+        other = {**_login(client, "agent-idem-2"), "Idempotency-Key": "batch-0001"}
+        fresh = client.post("/sync/upload.bin", content=frame, headers=other)
+        assert "Idempotent-Replayed" not in fresh.headers
+        assert fresh.json()["results"][0]["status"] == "exists"
+
+
+def test_invalid_upload_body_is_422():
+    frame = aesgcm_encrypt_frame(json.dumps({"sales": [{"external_id": "no-agent"}]}).encode())
+    with TestClient(app) as client:
+        r = client.post("/sync/upload.bin", content=frame, headers=_login(client, "agent-bin"))
+        assert r.status_code == 422
+        assert r.json()["detail"][0]["loc"][-1] == "agent_code"
+
+
+def _stream(records: list[dict], segment_size: int = 1024) -> list[bytes]:
+    ndjson = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+    return list(encrypt_segments([gzip.compress(ndjson)], segment_size))
+
+
+def _open(parts: list[bytes]) -> bytes:
+    d = SegmentDecryptor()
+    out = b"".join(p for part in parts for p in d.feed(part))
+    return out + d.finish()
+
+
+def test_segments_detect_truncation_and_reordering():
+    data = bytes(range(256)) * 20
+    header, *segments = list(encrypt_segments([data], 1024))
+    assert len(segments) == 5
+    assert _open([header, *segments]) == data
+    with pytest.raises(Exception):
+        _open([header, *segments[:-1]])
+    with pytest.raises(Exception):
+        _open([header, segments[1], segments[0], *segments[2:]])
+    with pytest.raises(ValueError):
+        _open([header])
+
+
+def test_streamed_upload_ingests_in_batches():
+    now = datetime.utcnow().isoformat()
+    records = [{"type": "product", "external_id": "STREAM-SKU", "name": "Streamed", "price": 2.5, "stock": 1, "updated_at": now}]
+    records += [
+        {"type": "sale", "external_id": f"stream-sale-{i}", "agent_code": "agent-stream", "created_at": now, "updated_at": now,
+         "items": [{"product_external_id": "STREAM-SKU", "quantity": 1, "price": 2.5}]}
+        for i in range(2500)
+    ]
+    parts = _stream(records)
+    with TestClient(app) as client:
+        headers = {**_login(client, "agent-stream"), "Content-Type": "application/octet-stream"}
+        truncated = client.post("/sync/upload.stream", content=b"".join(parts[:-1]), headers=headers)
+        assert truncated.status_code == 400
+
+        r = client.post("/sync/upload.stream", content=iter(parts), headers=headers)
+        assert r.status_code == 200
+        statuses = [x["status"] for x in r.json()["results"]]
+        assert len(statuses) == 2501 and set(statuses) == {"inserted"}
+
+        again = client.post("/sync/upload.stream", params={"response": "rle"}, content=iter(parts), headers=headers)
+        assert again.json()["counts"] == {"product": {"skipped": 1}, "sale": {"exists": 2500}}
+        assert again.json()["status_rle"] == "1S2500E"
+
+
+def test_streamed_upload_size_cap(monkeypatch):
+    import app.main as main
+
+    monkeypatch.setattr(main, "STREAM_MAX_BYTES", 100)
+    parts = _stream([{"type": "product", "external_id": f"CAP-{i}", "name": f"Cap {i}", "price": 1, "stock": 1, "updated_at": "2024-01-01T00:00:00"} for i in range(50)])
+    with TestClient(app) as client:
+        headers = {**_login(client, "agent-cap"), "Content-Type": "application/octet-stream"}
+        assert client.post("/sync/upload.stream", content=iter(parts), headers=headers).status_code == 413
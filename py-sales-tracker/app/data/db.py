@@ -6,7 +6,8 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 BASE_DIR = Path(__file__).resolve().parents[2]
-DATA_DIR = BASE_DIR / "data"
+# SALES_TRACKER_DATA_DIR moves sales.db and the sync files elsewhere (the tests use a temp dir)
+DATA_DIR = Path(os.getenv("SALES_TRACKER_DATA_DIR") or BASE_DIR / "data")
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 DB_PATH = DATA_DIR / "sales.db"
 
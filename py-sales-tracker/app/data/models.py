@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, Numeric, String
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, Numeric, String, Text
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -9,6 +9,7 @@ Base = declarative_base()
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (Index("ix_products_updated_at_id", "updated_at", "id"),)
 
     id = Column(Integer, primary_key=True)
     external_id = Column(String(64), unique=True, nullable=True)
@@ -26,6 +27,7 @@ class Product(Base):
 
 class Customer(Base):
     __tablename__ = "customers"
+    __table_args__ = (Index("ix_customers_updated_at_id", "updated_at", "id"),)
 
     id = Column(Integer, primary_key=True)
     external_id = Column(String(64), unique=True, nullable=True)
@@ -63,5 +65,24 @@ class SaleItem(Base):
     product = relationship("Product")
 
 
+class OutboxEvent(Base):
+    """Event waiting to be synced; ``seq`` is its queue offset and is never reused."""
+    __tablename__ = "sync_outbox"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq = Column(Integer, primary_key=True)
+    event_type = Column(String(64), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class OutboxOffset(Base):
+    """Single row: events up to ``acked`` have been accepted by the server."""
+    __tablename__ = "sync_outbox_offset"
+
+    id = Column(Integer, primary_key=True)
+    acked = Column(Integer, nullable=False, default=0)
+
+
 def init_db(engine) -> None:
     Base.metadata.create_all(bind=engine) 
\ No newline at end of file
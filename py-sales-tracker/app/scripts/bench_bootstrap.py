@@ -0,0 +1,104 @@
+"""Cold-start catalog sync for a new install: JSON pages vs. snapshot import.
+
+Both paths start from an empty database and end with the same 100k products.
+Network transfer is left out; the byte counts show what each path downloads.
+The snapshot is built here the way the server builds it (SQLite file, gzip,
+segmented AES-GCM), so only the client side is timed.
+
+    python -m app.scripts.bench_bootstrap [n_skus]
+"""
+
+from __future__ import annotations
+
+import base64
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.data.models import Product, init_db
+from app.services import sync
+from app.services.bootstrap import SNAPSHOT_CHUNK, import_snapshot
+from app.services.sync_pull import PULL_PAGE_SIZE, _apply_page
+
+N_SKUS = 100_000
+
+
+def _catalog(n: int) -> list[dict]:
+    t0 = datetime(2024, 1, 1)
+    return [
+        {"external_id": f"SKU-{i:06d}", "name": f"Product {i}", "category": f"Cat {i % 40}", "price": 10 + i % 500,
+         "cost_price": 6 + i % 300, "stock": i % 100, "updated_at": (t0 + timedelta(seconds=i)).isoformat(), "deleted_at": None}
+        for i in range(n)
+    ]
+
+
+def _snapshot(rows: list[dict], path: Path) -> list[bytes]:
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE products (external_id VARCHAR(64) PRIMARY KEY, name VARCHAR(255) NOT NULL, category VARCHAR(255), "
+                 "price FLOAT NOT NULL, cost_price FLOAT, stock INTEGER NOT NULL, updated_at DATETIME NOT NULL, deleted_at DATETIME)")
+    conn.execute("CREATE TABLE customers (external_id VARCHAR(64) PRIMARY KEY, name VARCHAR(255) NOT NULL, email VARCHAR(255), "
+                 "phone VARCHAR(100), updated_at DATETIME NOT NULL, deleted_at DATETIME)")
+    conn.execute("CREATE TABLE snapshot_info (key VARCHAR(32) PRIMARY KEY, value VARCHAR(64) NOT NULL)")
+    # SQLAlchemy's SQLite DATETIME storage format, as the server writes it
+    conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+        (r["external_id"], r["name"], r["category"], r["price"], r["cost_price"], r["stock"],
+         datetime.fromisoformat(r["updated_at"]).strftime("%Y-%m-%d %H:%M:%S.%f"), None)
+        for r in rows
+    ])
+    conn.execute("INSERT INTO snapshot_info VALUES ('seq', ?)", (str(len(rows)),))
+    conn.commit()
+    conn.close()
+    data = path.read_bytes()
+    return list(sync._encrypt_stream(data[i:i + SNAPSHOT_CHUNK] for i in range(0, len(data), SNAPSHOT_CHUNK)))
+
+
+def _fresh_db(path: Path):
+    engine = create_engine(f"sqlite:///{path.as_posix()}", future=True)
+    init_db(engine)
+    return engine
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_SKUS
+    if not sync.SYNC_AES_KEY_BASE64:
+        sync.SYNC_AES_KEY_BASE64 = base64.b64encode(os.urandom(32)).decode()
+    rows = _catalog(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        pages = [json.dumps({"products": rows[i:i + PULL_PAGE_SIZE]}).encode() for i in range(0, n, PULL_PAGE_SIZE)]
+        engine = _fresh_db(Path(tmp, "json.db"))
+        started = time.perf_counter()
+        with sessionmaker(bind=engine, future=True)() as session:
+            for page in pages:
+                _apply_page(session, json.loads(page))
+            assert session.execute(select(func.count(Product.id))).scalar() == n
+        json_s = time.perf_counter() - started
+        json_bytes = sum(len(gzip.compress(p)) for p in pages)
+        engine.dispose()
+
+        sealed = _snapshot(rows, Path(tmp, "snapshot.sqlite"))
+        engine = _fresh_db(Path(tmp, "snap.db"))
+        started = time.perf_counter()
+        seq = import_snapshot(engine, iter(sealed))
+        snap_s = time.perf_counter() - started
+        with engine.connect() as conn:
+            assert seq == n and conn.execute(select(func.count(Product.id))).scalar() == n
+        snap_bytes = sum(len(p) for p in sealed)
+        engine.dispose()
+
+    print(f"{n} SKUs, cold start")
+    print(f"{'path':>10} {'download KiB':>13} {'seconds':>9}")
+    print(f"{'json pages':>10} {json_bytes / 1024:>13.0f} {json_s:>9.2f}   ({len(pages)} pages of {PULL_PAGE_SIZE}, gzip)")
+    print(f"{'snapshot':>10} {snap_bytes / 1024:>13.0f} {snap_s:>9.2f}   ({json_s / snap_s:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
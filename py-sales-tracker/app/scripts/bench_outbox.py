@@ -0,0 +1,75 @@
+"""Enqueue throughput with a large backlog: SQLite outbox vs. the old JSON file queue.
+
+The JSON queue re-read and rewrote the whole file on every enqueue, so its
+cost grows with the backlog; an outbox append is one INSERT. Also times
+draining the backlog in batches (pending + ack) and compaction.
+
+    python -m app.scripts.bench_outbox [pending]
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+
+from app.data.models import OutboxEvent
+from app.services.outbox import Outbox
+
+PENDING = 100_000
+OUTBOX_ENQUEUES = 2_000
+JSON_ENQUEUES = 20
+DRAIN_BATCH = 1_000
+
+
+def _legacy_enqueue(path: Path, event: dict) -> None:
+    queue = json.loads(path.read_text(encoding="utf-8"))
+    queue.append(event)
+    path.write_text(json.dumps(queue, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def main():
+    pending = int(sys.argv[1]) if len(sys.argv) > 1 else PENDING
+    now = datetime.utcnow()
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = Path(tmp, "offline_queue.json")
+        legacy.write_text(json.dumps([{"event_type": "sale_created", "payload": {"sale_id": i}, "ts": now.isoformat()} for i in range(pending)], indent=2))
+        started = time.perf_counter()
+        for i in range(JSON_ENQUEUES):
+            _legacy_enqueue(legacy, {"event_type": "sale_created", "payload": {"sale_id": pending + i}, "ts": now.isoformat()})
+        json_rate = JSON_ENQUEUES / (time.perf_counter() - started)
+
+        engine = create_engine(f"sqlite:///{Path(tmp, 'sales.db').as_posix()}", future=True)
+        box = Outbox(engine, legacy_path=None)
+        box.pending(limit=1)  # creates the tables
+        with engine.begin() as conn:
+            conn.execute(insert(OutboxEvent), [{"event_type": "sale_created", "payload": json.dumps({"sale_id": i}), "created_at": now} for i in range(pending)])
+        started = time.perf_counter()
+        for i in range(OUTBOX_ENQUEUES):
+            box.append("sale_created", {"sale_id": pending + i})
+        outbox_rate = OUTBOX_ENQUEUES / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        drained = 0
+        while batch := box.pending(limit=DRAIN_BATCH):
+            box.ack(batch[-1].seq)
+            drained += len(batch)
+        drain_s = time.perf_counter() - started
+        started = time.perf_counter()
+        removed = box.compact()
+        compact_s = time.perf_counter() - started
+        engine.dispose()
+
+    print(f"enqueue with {pending} events pending")
+    print(f"  json file queue: {json_rate:>9.1f} events/s ({1000 / json_rate:.1f} ms each)")
+    print(f"  sqlite outbox:   {outbox_rate:>9.1f} events/s ({1000 / outbox_rate:.2f} ms each, one fsync'd transaction per event)")
+    print(f"drain {drained} events in batches of {DRAIN_BATCH}: {drain_s:.2f}s; compact {removed} rows: {compact_s:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Per-sync request overhead against a running backend: fresh login and
+connection every time vs. the pooled SyncClient with a cached token.
+
+Each round is what a small sync costs before any data moves: get a token,
+then one GET /sync/download page.
+
+    python -m app.scripts.bench_sync_client [rounds]   # SYNC_SERVER, default http://127.0.0.1:8000
+"""
+
+from __future__ import annotations
+
+import statistics
+import sys
+import time
+
+import requests
+
+from app.services.sync import AGENT_CODE, AGENT_PASSWORD, SYNC_SERVER, SyncClient
+
+ROUNDS = 200
+PARAMS = {"after_seq": 0, "limit": 1}
+
+
+def before() -> None:
+    r = requests.post(f"{SYNC_SERVER}/auth/login", json={"agent_code": AGENT_CODE, "password": AGENT_PASSWORD}, timeout=5)
+    r.raise_for_status()
+    token = r.json()["access_token"]
+    requests.get(f"{SYNC_SERVER}/sync/download", params=PARAMS, headers={"Authorization": f"Bearer {token}"}, timeout=8).raise_for_status()
+
+
+def after(client: SyncClient) -> None:
+    token = client.token()
+    client.session.get(f"{SYNC_SERVER}/sync/download", params=PARAMS, headers={"Authorization": f"Bearer {token}"}, timeout=8).raise_for_status()
+
+
+def _run(name: str, fn, rounds: int) -> None:
+    fn()  # warm up the server side (agent row, caches)
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    print(f"{name:34} p50 {statistics.median(times):7.2f} ms   p95 {times[int(len(times) * 0.95) - 1]:7.2f} ms")
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else ROUNDS
+    client = SyncClient()
+    _run("before (login + new connections)", before, rounds)
+    _run("after (cached token, keep-alive)", lambda: after(client), rounds)
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import zlib
+from typing import Any, Iterable
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.services.sync import DATA_DIR, _decrypt_stream, _save_state, client
+
+# A new install would otherwise replay the whole catalog as JSON pages. The
+# server publishes a SQLite snapshot of products/customers (gzipped, sealed with
+# the sync key) tagged with the change_log seq it covers; we attach it, copy
+# it in with two INSERT ... SELECT statements and continue from that seq.
+SYNC_BOOTSTRAP = os.getenv("SYNC_BOOTSTRAP", "1") != "0"
+SNAPSHOT_CHUNK = 64 * 1024
+
+# Local rows with the same external_id are kept when they are newer. A product
+# created locally before its first upload has no external_id yet; one with the
+# same name as a snapshot product adopts that product's external_id first, so
+# the copy merges into it instead of colliding on the unique name.
+_ADOPT_PRODUCTS = """
+UPDATE OR IGNORE main.products
+SET external_id = (SELECT s.external_id FROM snap.products s WHERE s.name = products.name ORDER BY s.updated_at DESC LIMIT 1)
+WHERE external_id IS NULL AND name IN (SELECT name FROM snap.products)
+"""
+_COPY_PRODUCTS = """
+INSERT INTO main.products (external_id, name, category, price, cost_price, stock, updated_at, deleted_at)
+SELECT external_id, name, category, price, cost_price, stock, updated_at, deleted_at FROM snap.products WHERE true
+ON CONFLICT(external_id) DO UPDATE SET
+    name = excluded.name, category = excluded.category, price = excluded.price, cost_price = excluded.cost_price,
+    stock = excluded.stock, updated_at = excluded.updated_at, deleted_at = excluded.deleted_at
+    WHERE products.updated_at IS NULL OR excluded.updated_at > products.updated_at
+ON CONFLICT DO NOTHING
+"""
+_COPY_CUSTOMERS = """
+INSERT INTO main.customers (external_id, name, email, phone, updated_at, deleted_at)
+SELECT external_id, name, email, phone, updated_at, deleted_at FROM snap.customers WHERE true
+ON CONFLICT(external_id) DO UPDATE SET
+    name = excluded.name, email = excluded.email, phone = excluded.phone,
+    updated_at = excluded.updated_at, deleted_at = excluded.deleted_at
+    WHERE customers.updated_at IS NULL OR excluded.updated_at > customers.updated_at
+ON CONFLICT DO NOTHING
+"""
+# Snapshot rows that still found no place (a name taken by a local row with another external_id)
+_UNPLACED = """
+SELECT (SELECT count(*) FROM snap.products s WHERE NOT EXISTS (SELECT 1 FROM main.products p WHERE p.external_id = s.external_id))
+     + (SELECT count(*) FROM snap.customers s WHERE NOT EXISTS (SELECT 1 FROM main.customers c WHERE c.external_id = s.external_id))
+"""
+
+
+def needs_bootstrap(state: dict[str, Any]) -> bool:
+    """True for an install that has never pulled anything."""
+    return (
+        SYNC_BOOTSTRAP
+        and "download_seq" not in state
+        and state.get("download_mode") != "since"
+        and state.get("last_download", "1970-01-01T00:00:00") == "1970-01-01T00:00:00"
+    )
+
+
+def import_snapshot(engine: Engine, chunks: Iterable[bytes]) -> int:
+    """Decrypt and inflate a snapshot to a temp file, then bulk-copy it into the local DB.
+
+    Returns the change_log seq to continue pulling from: the snapshot's, or 0
+    if some rows could not be copied, so the regular pull sees them again
+    instead of starting past them.
+    """
+    fd, path = tempfile.mkstemp(dir=DATA_DIR, suffix=".snapshot.tmp")
+    try:
+        inflate = zlib.decompressobj(wbits=31)
+        with os.fdopen(fd, "wb") as out:
+            for plain in _decrypt_stream(chunks):
+                out.write(inflate.decompress(plain))
+            out.write(inflate.flush())
+        if not inflate.eof:
+            raise ValueError("Truncated snapshot")
+        raw = engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            # ATTACH/DETACH are not allowed inside a transaction; pysqlite only opens one at the first INSERT
+            cur.execute("ATTACH DATABASE ? AS snap", (path,))
+            try:
+                seq = int(cur.execute("SELECT value FROM snap.snapshot_info WHERE key = 'seq'").fetchone()[0])
+                cur.execute(_ADOPT_PRODUCTS)
+                cur.execute(_COPY_PRODUCTS)
+                cur.execute(_COPY_CUSTOMERS)
+                if cur.execute(_UNPLACED).fetchone()[0]:
+                    seq = 0
+                raw.commit()
+            except Exception:
+                raw.rollback()
+                raise
+            finally:
+                cur.execute("DETACH DATABASE snap")
+        finally:
+            raw.close()
+    finally:
+        os.unlink(path)
+    return seq
+
+
+def bootstrap_from_snapshot(session: Session, state: dict[str, Any], token: str) -> bool:
+    """Seed the catalog from ``/sync/snapshot``; False if the server has none (or predates snapshots)."""
+    session.commit()  # no open transaction may hold the database while we write through another connection
+    try:
+        with client.session.get(f"{client.server}/sync/snapshot", headers={"Authorization": f"Bearer {token}"}, stream=True, timeout=30) as r:
+            if r.status_code != 200:
+                client.throttled(r)
+                return False
+            seq = import_snapshot(session.get_bind(), r.iter_content(SNAPSHOT_CHUNK))
+    except Exception:
+        return False
+    session.expire_all()
+    state["download_seq"] = seq
+    _save_state(state)
+    return True
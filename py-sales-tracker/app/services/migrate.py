@@ -3,11 +3,11 @@ from __future__ import annotations
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
-TARGET_VERSION = 3  # bump when migrations change
+TARGET_VERSION = 5  # bump when migrations change
 
 
 def migrate(engine: Engine) -> None:
-    with engine.connect() as conn:
+    with engine.begin() as conn:
         conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (id INTEGER PRIMARY KEY CHECK (id=1), version INTEGER NOT NULL);"))
         row = conn.execute(text("SELECT version FROM schema_version WHERE id=1;")).fetchone()
         current = row[0] if row else 0
@@ -34,6 +34,11 @@ def migrate(engine: Engine) -> None:
             conn.execute(text("ALTER TABLE customers ADD COLUMN updated_at DATETIME;"))
         if _can_add(conn, 'customers', 'deleted_at'):
             conn.execute(text("ALTER TABLE customers ADD COLUMN deleted_at DATETIME;"))
+        # Incremental uploads page by (updated_at, id); the composite index serves the range and the order
+        conn.execute(text("DROP INDEX IF EXISTS ix_products_updated_at;"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_customers_updated_at;"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_updated_at_id ON products (updated_at, id);"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_customers_updated_at_id ON customers (updated_at, id);"))
         conn.execute(text("PRAGMA foreign_keys=on;"))
         # Bump version
         if row:
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.data.db import DATA_DIR, engine
+from app.data.models import OutboxEvent, OutboxOffset
+
+# Replaces data/offline_queue.json, which was read and rewritten whole on every
+# enqueue. Events are appended as rows of ``sync_outbox`` in data/sales.db;
+# consumers read them in ``seq`` order, acknowledge up to an offset once the
+# server has them, and ``compact`` drops acknowledged rows.
+LEGACY_QUEUE_PATH = DATA_DIR / "offline_queue.json"
+
+
+class OutboxEntry(NamedTuple):
+    seq: int
+    event_type: str
+    payload: Dict[str, Any]
+    created_at: datetime
+
+
+class Outbox:
+    def __init__(self, engine: Engine, legacy_path: Optional[Path] = LEGACY_QUEUE_PATH) -> None:
+        self.engine = engine
+        self.legacy_path = legacy_path
+        self._ready = False
+
+    def _ensure(self) -> None:
+        if self._ready:
+            return
+        OutboxEvent.__table__.create(self.engine, checkfirst=True)
+        OutboxOffset.__table__.create(self.engine, checkfirst=True)
+        with self.engine.begin() as conn:
+            if conn.execute(select(OutboxOffset.id)).first() is None:
+                conn.execute(insert(OutboxOffset).values(id=1, acked=0))
+            imported = self._import_legacy(conn)
+        if imported:
+            # Only once the rows are committed; a crash in between re-imports the
+            # file next time, and the server answers the repeated sales with ``exists``
+            self.legacy_path.replace(self.legacy_path.with_suffix(".json.imported"))
+        self._ready = True
+
+    def _import_legacy(self, conn) -> bool:
+        """Copy events left in offline_queue.json into the outbox; True if there was a file to retire."""
+        if self.legacy_path is None or not self.legacy_path.exists():
+            return False
+        try:
+            events = json.loads(self.legacy_path.read_text(encoding="utf-8"))
+        except Exception:
+            events = []
+        rows = [
+            {"event_type": ev["event_type"], "payload": json.dumps(ev.get("payload", {})),
+             "created_at": datetime.fromisoformat(ev["ts"]) if ev.get("ts") else datetime.utcnow()}
+            for ev in events if isinstance(ev, dict) and ev.get("event_type")
+        ]
+        if rows:
+            conn.execute(insert(OutboxEvent), rows)
+        return True
+
+    def append(self, event_type: str, payload: Dict[str, Any]) -> int:
+        """O(1): one INSERT in its own transaction. Returns the event's seq."""
+        self._ensure()
+        with self.engine.begin() as conn:
+            result = conn.execute(insert(OutboxEvent).values(event_type=event_type, payload=json.dumps(payload, ensure_ascii=False)))
+            return result.inserted_primary_key[0]
+
+    def stage(self, session: Session, event_type: str, payload: Dict[str, Any]) -> None:
+        """Add an event to the caller's transaction: it is queued if, and only if, that transaction commits."""
+        session.add(OutboxEvent(event_type=event_type, payload=json.dumps(payload, ensure_ascii=False)))
+
+    def acked(self) -> int:
+        self._ensure()
+        with self.engine.connect() as conn:
+            return conn.execute(select(OutboxOffset.acked).where(OutboxOffset.id == 1)).scalar() or 0
+
+    def pending(self, limit: Optional[int] = None, after: Optional[int] = None) -> list[OutboxEntry]:
+        """Unacknowledged events in order, starting after ``after`` (default: the acked offset)."""
+        self._ensure()
+        with self.engine.connect() as conn:
+            if after is None:
+                after = conn.execute(select(OutboxOffset.acked).where(OutboxOffset.id == 1)).scalar() or 0
+            q = select(OutboxEvent.seq, OutboxEvent.event_type, OutboxEvent.payload, OutboxEvent.created_at).where(OutboxEvent.seq > after).order_by(OutboxEvent.seq)
+            if limit is not None:
+                q = q.limit(limit)
+            return [OutboxEntry(seq, kind, json.loads(payload), ts) for seq, kind, payload, ts in conn.execute(q)]
+
+    def ack(self, seq: int) -> None:
+        """Mark every event up to ``seq`` as delivered; the offset never moves back."""
+        self._ensure()
+        with self.engine.begin() as conn:
+            conn.execute(update(OutboxOffset).where(OutboxOffset.id == 1, OutboxOffset.acked < seq).values(acked=seq))
+
+    def compact(self) -> int:
+        """Delete acknowledged events; returns how many were removed."""
+        self._ensure()
+        with self.engine.begin() as conn:
+            acked = select(OutboxOffset.acked).where(OutboxOffset.id == 1).scalar_subquery()
+            return conn.execute(delete(OutboxEvent).where(OutboxEvent.seq <= acked)).rowcount
+
+    def __len__(self) -> int:
+        """Number of unacknowledged events."""
+        self._ensure()
+        with self.engine.connect() as conn:
+            acked = select(OutboxOffset.acked).where(OutboxOffset.id == 1).scalar_subquery()
+            return conn.execute(select(func.count()).select_from(OutboxEvent).where(OutboxEvent.seq > acked)).scalar() or 0
+
+
+outbox = Outbox(engine)
@@ -3,52 +3,77 @@ from __future__ import annotations
 import json
 import os
 import base64
+import hashlib
 import time
 import gzip
+import struct
+import tempfile
+import threading
+import zlib
 from datetime import datetime
-from pathlib import Path
-from typing import Any, Dict
+from decimal import Decimal
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from sqlalchemy import select
+from sqlalchemy import String, cast, literal, select, tuple_, update
 
-from app.data.models import Product, Customer
+from app.data.db import DATA_DIR
+from app.data.models import Customer, Product, Sale
+from app.services.outbox import outbox
 import random
 
-BASE_DIR = Path(__file__).resolve().parents[2]
-DATA_DIR = BASE_DIR / "data"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-QUEUE_PATH = DATA_DIR / "offline_queue.json"
+try:
+    import zstandard
+except Exception:  # pragma: no cover - optional at runtime
+    zstandard = None  # type: ignore
+
 SYNC_STATE_PATH = DATA_DIR / "sync_state.json"
+SYNC_DICT_PATH = DATA_DIR / "sync_dict.bin"
 
 SYNC_SERVER = os.getenv("SYNC_SERVER", "http://127.0.0.1:8000")
 AGENT_CODE = os.getenv("AGENT_CODE", "agent-001")
 AGENT_PASSWORD = os.getenv("AGENT_PASSWORD", "password")
 SYNC_AES_KEY_BASE64 = os.getenv("SYNC_AES_KEY_BASE64", "")
+# "binary" posts raw nonce|ciphertext|tag to /sync/upload.bin (no base64/JSON envelope);
+# "stream" posts segmented ciphertext of gzipped NDJSON to /sync/upload.stream
+SYNC_UPLOAD_FORMAT = os.getenv("SYNC_UPLOAD_FORMAT", "json")
+STREAM_SEGMENT_SIZE = 64 * 1024
+# auto = best codec the server advertised on the last download (zstd-dict > zstd > gzip)
+SYNC_CODEC = os.getenv("SYNC_CODEC", "auto")
+# Log in again this many seconds before the cached token expires
+TOKEN_REFRESH_MARGIN = 60
 
 
-def _read_queue() -> list[dict[str, Any]]:
-    if not QUEUE_PATH.exists():
-        return []
-    try:
-        return json.loads(QUEUE_PATH.read_text(encoding="utf-8"))
-    except Exception:
-        return []
-
+def enqueue(event_type: str, payload: Dict[str, Any]) -> None:
+    outbox.append(event_type, payload)
 
-def _write_queue(queue: list[dict[str, Any]]) -> None:
-    QUEUE_PATH.write_text(json.dumps(queue, ensure_ascii=False, indent=2), encoding="utf-8")
 
+def sale_snapshot(sale: Sale, customer: Optional[Customer], lines: Iterable[tuple[Product, int, Decimal]]) -> dict[str, Any]:
+    """The sale exactly as it will be uploaded, captured while it is being saved.
 
-def enqueue(event_type: str, payload: Dict[str, Any]) -> None:
-    queue = _read_queue()
-    queue.append({
-        "event_type": event_type,
-        "payload": payload,
-        "ts": datetime.utcnow().isoformat(),
-    })
-    _write_queue(queue)
+    Products and customers without an external_id get the one
+    ``_collect_changes`` would give them, so the items can reference them.
+    """
+    items = []
+    for product, quantity, price in lines:
+        if not product.external_id:
+            product.external_id = f"{AGENT_CODE}-p-{product.id}"
+        items.append({"product_external_id": product.external_id, "quantity": int(quantity), "price": float(price)})
+    if customer is not None and not customer.external_id:
+        customer.external_id = f"{AGENT_CODE}-c-{customer.id}"
+    created = sale.created_at.isoformat()
+    return {
+        "external_id": f"{AGENT_CODE}-{sale.id}",
+        "agent_code": AGENT_CODE,
+        "customer_external_id": customer.external_id if customer is not None else None,
+        "created_at": created,
+        "updated_at": created,
+        "items": items,
+    }
 
 
 def _load_state() -> dict[str, Any]:
@@ -61,125 +86,480 @@ def _load_state() -> dict[str, Any]:
 
 
 def _save_state(state: dict[str, Any]) -> None:
-    SYNC_STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Written beside the file and renamed over it, so a reader never sees half a state
+    fd, tmp = tempfile.mkstemp(dir=SYNC_STATE_PATH.parent, suffix=".state.tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, SYNC_STATE_PATH)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
 
-def _get_token() -> str:
+class SyncClient:
+    """Keep-alive HTTP session and login token shared by uploads, pulls and reconcile.
+
+    The token is reused until TOKEN_REFRESH_MARGIN seconds before its ``exp``
+    claim, so a sync normally goes straight to its first request over an
+    already open connection. ``invalidate()`` drops it after a 401, and
+    ``throttled()`` remembers a 429's Retry-After for the backoff loop.
+    """
+
+    def __init__(self, server: str = "", pool_size: int = 4) -> None:
+        self.server = server or SYNC_SERVER
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._token = ""
+        self._expires = 0.0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def token(self) -> str:
+        with self._lock:
+            if self._token and time.time() < self._expires - TOKEN_REFRESH_MARGIN:
+                return self._token
+            try:
+                r = self.session.post(f"{self.server}/auth/login", json={"agent_code": AGENT_CODE, "password": AGENT_PASSWORD}, timeout=5)
+                self.throttled(r)
+                r.raise_for_status()
+                token = r.json()["access_token"]
+            except Exception:
+                return ""
+            self._token, self._expires = token, _token_exp(token)
+            return token
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._token, self._expires = "", 0.0
+
+    def throttled(self, r) -> None:
+        """Note the Retry-After (in seconds) of a 429 response; other responses are ignored."""
+        if r.status_code != 429:
+            return
+        try:
+            delay = float(r.headers.get("Retry-After", ""))
+        except ValueError:
+            delay = 1.0
+        self._retry_at = max(self._retry_at, time.time() + delay)
+
+    def retry_in(self) -> float:
+        """Seconds the server asked us to wait before the next request, 0 if none."""
+        return max(0.0, self._retry_at - time.time())
+
+    def close(self) -> None:
+        self.invalidate()
+        self.session.close()
+
+
+def _token_exp(token: str) -> float:
+    """``exp`` claim of a JWT (unverified; only used to decide when to log in again), 0 if absent."""
     try:
-        r = requests.post(f"{SYNC_SERVER}/auth/login", json={"agent_code": AGENT_CODE, "password": AGENT_PASSWORD}, timeout=5)
-        r.raise_for_status()
-        return r.json()["access_token"]
+        claims = token.split(".")[1]
+        return float(json.loads(base64.urlsafe_b64decode(claims + "=" * (-len(claims) % 4)))["exp"])
     except Exception:
-        return ""
+        return 0.0
+
+
+def _get_token() -> str:
+    return client.token()
+
 
+def _choose_codec(state: dict[str, Any]) -> tuple[str, Optional[int]]:
+    # Servers that never advertised codecs only understand legacy gzip
+    offered = state.get("server_codecs") or ["gzip"]
+    dict_id = state.get("sync_dict_id")
+    usable = [c for c in offered if c in ("gzip", "identity") or zstandard is not None]
+    if "zstd-dict" in usable and (dict_id is None or not SYNC_DICT_PATH.exists()):
+        usable.remove("zstd-dict")
+    if SYNC_CODEC != "auto":
+        codec = SYNC_CODEC if SYNC_CODEC in usable else "gzip"
+    else:
+        codec = next((c for c in ("zstd-dict", "zstd") if c in usable), "gzip")
+    return codec, dict_id if codec == "zstd-dict" else None
 
-def _encrypt_payload(data: dict[str, Any]) -> dict[str, str]:
+
+def _compress(pt: bytes, codec: tuple[str, Optional[int]]) -> tuple[bytes, str, Optional[int]]:
+    name, dict_id = codec
+    if name == "identity":
+        return pt, name, None
+    if name in ("zstd", "zstd-dict"):
+        zdict = zstandard.ZstdCompressionDict(SYNC_DICT_PATH.read_bytes()) if dict_id is not None else None
+        return zstandard.ZstdCompressor(level=3, dict_data=zdict).compress(pt), name, dict_id
+    return gzip.compress(pt), "gzip", None
+
+
+def _seal(data: dict[str, Any], codec: tuple[str, Optional[int]]) -> tuple[bytes, bytes, str, Optional[int]]:
+    """Compress + AES-GCM; returns (nonce, ciphertext with the 16-byte tag appended, codec, dict_id)."""
     key = base64.b64decode(SYNC_AES_KEY_BASE64) if SYNC_AES_KEY_BASE64 else AESGCM.generate_key(bit_length=256)
     aes = AESGCM(key)
     nonce = os.urandom(12)
     pt = json.dumps(data).encode("utf-8")
-    ptz = gzip.compress(pt)
-    ct = aes.encrypt(nonce, ptz, None)
+    ptz, name, dict_id = _compress(pt, codec)
+    return nonce, aes.encrypt(nonce, ptz, None), name, dict_id
+
+
+def _encrypt_payload(data: dict[str, Any], codec: tuple[str, Optional[int]]) -> dict[str, Any]:
+    nonce, ct, codec, dict_id = _seal(data, codec)
     tag = ct[-16:]
     body = ct[:-16]
     return {
         "nonce": base64.b64encode(nonce).decode(),
         "ciphertext": base64.b64encode(body).decode(),
         "tag": base64.b64encode(tag).decode(),
+        "codec": codec,
+        "dict_id": dict_id,
+    }
+
+
+def _encrypt_frame(data: dict[str, Any], codec: tuple[str, Optional[int]]) -> tuple[bytes, dict[str, str]]:
+    """Binary frame plus the headers that carry its codec."""
+    nonce, ct, codec, dict_id = _seal(data, codec)
+    headers = {"X-Sync-Codec": codec}
+    if dict_id is not None:
+        headers["X-Sync-Dict"] = str(dict_id)
+    return nonce + ct, headers
+
+
+def _ndjson_records(payload: dict[str, list]) -> Iterator[bytes]:
+    for key, kind in (("products", "product"), ("customers", "customer"), ("sales", "sale")):
+        for row in payload.get(key, []):
+            yield (json.dumps({"type": kind, **row}) + "\n").encode("utf-8")
+
+
+def _encrypt_stream(lines: Iterable[bytes], segment_size: int = STREAM_SEGMENT_SIZE) -> Iterator[bytes]:
+    """gzip + segmented AES-GCM, produced lazily; the server's ``encrypt_segments`` format."""
+    key = base64.b64decode(SYNC_AES_KEY_BASE64) if SYNC_AES_KEY_BASE64 else AESGCM.generate_key(bit_length=256)
+    aes = AESGCM(key)
+    prefix = os.urandom(7)
+    header = b"SGS1" + struct.pack(">I", segment_size) + prefix
+    yield header
+    deflate = zlib.compressobj(wbits=31)
+    buf = bytearray()
+    index = 0
+
+    def seal(n: int, final: bool) -> bytes:
+        nonlocal index
+        ct = aes.encrypt(prefix + struct.pack(">IB", index, final), bytes(buf[:n]), header)
+        del buf[:n]
+        index += 1
+        return ct
+
+    for line in lines:
+        buf += deflate.compress(line)
+        while len(buf) > segment_size:
+            yield seal(segment_size, False)
+    buf += deflate.flush()
+    while len(buf) > segment_size:
+        yield seal(segment_size, False)
+    yield seal(len(buf), True)
+
+
+def _decrypt_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Inverse of ``_encrypt_stream`` minus the gzip layer; raises if the stream is tampered with or cut short."""
+    aes = AESGCM(base64.b64decode(SYNC_AES_KEY_BASE64))
+    buf = bytearray()
+    header = b""
+    sealed = 0
+    index = 0
+    for chunk in chunks:
+        buf += chunk
+        if not header:
+            if len(buf) < 15:
+                continue
+            header = bytes(buf[:15])
+            if header[:4] != b"SGS1":
+                raise ValueError("Not a segmented stream")
+            sealed = struct.unpack(">I", header[4:8])[0] + 16
+            del buf[:15]
+        # The last segment is only known once the input ends
+        while len(buf) > sealed:
+            yield aes.decrypt(header[8:] + struct.pack(">IB", index, False), bytes(buf[:sealed]), header)
+            del buf[:sealed]
+            index += 1
+    if not header:
+        raise ValueError("Truncated stream")
+    yield aes.decrypt(header[8:] + struct.pack(">IB", index, True), bytes(buf), header)
+
+
+def _batch_key(payload: dict[str, list]) -> str:
+    """Idempotency key derived from what the batch contains, not when it was built.
+
+    Retries of an unchanged batch reuse the key, so a server that already
+    committed it replays its response; any new row yields a new key.
+    """
+    h = hashlib.sha256()
+    for key in ("products", "customers", "sales"):
+        for row in payload.get(key, []):
+            h.update(f"{key}|{row.get('external_id')}|{row.get('updated_at') if key != 'sales' else ''}\n".encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+COLLECT_PAGE_SIZE = 1000
+# Upload batches: whichever limit is hit first closes a batch (a single row
+# bigger than SYNC_BATCH_BYTES travels alone)
+SYNC_BATCH_ROWS = int(os.getenv("SYNC_BATCH_ROWS", "500"))
+SYNC_BATCH_BYTES = int(os.getenv("SYNC_BATCH_BYTES", str(256 * 1024)))
+SYNC_IN_FLIGHT = max(1, int(os.getenv("SYNC_IN_FLIGHT", "2")))
+SYNC_UPLOAD_TIMEOUT = float(os.getenv("SYNC_UPLOAD_TIMEOUT", "20"))
+
+# One pooled connection per in-flight upload, plus one for a pull running alongside
+client = SyncClient(pool_size=SYNC_IN_FLIGHT + 1)
+
+# Catalog upload progress in sync_state: (updated_at, id) of the last
+# acknowledged row, so a sync interrupted between batches resumes after it.
+_CATALOG = (
+    ("products", Product, "last_upload_products",
+     (Product.external_id, Product.name, Product.price, Product.cost_price, Product.stock, Product.updated_at, Product.deleted_at)),
+    ("customers", Customer, "last_upload_customers",
+     (Customer.external_id, Customer.name, Customer.email, Customer.phone, Customer.updated_at, Customer.deleted_at)),
+)
+
+
+def _since(state: dict[str, Any], key: str) -> datetime:
+    try:
+        return datetime.fromisoformat(state.get(key) or "1970-01-01T00:00:00")
+    except ValueError:
+        return datetime(1970, 1, 1)
+
+
+def _backfill_external_ids(session) -> None:
+    """Give every row without an external_id ``<agent>-p-<id>`` / ``<agent>-c-<id>`` in one UPDATE per table."""
+    for model, tag in ((Product, "p"), (Customer, "c")):
+        session.execute(
+            update(model).where(model.external_id.is_(None))
+            .values(external_id=literal(f"{AGENT_CODE}-{tag}-") + cast(model.id, String))
+            .execution_options(synchronize_session="fetch")
+        )
+    session.commit()
+
+
+def _product_row(ext, name, price, cost_price, stock, updated_at, deleted_at) -> dict[str, Any]:
+    return {
+        "external_id": ext,
+        "name": name,
+        "price": float(price),
+        "cost_price": float(cost_price or 0),
+        "stock": int(stock),
+        "updated_at": updated_at.isoformat(),
+        "deleted_at": deleted_at.isoformat() if deleted_at else None,
+    }
+
+
+def _customer_row(ext, name, email, phone, updated_at, deleted_at) -> dict[str, Any]:
+    return {
+        "external_id": ext,
+        "name": name,
+        "email": email,
+        "phone": phone,
+        "updated_at": updated_at.isoformat(),
+        "deleted_at": deleted_at.isoformat() if deleted_at else None,
     }
 
 
+def _changed(session, model, columns, since: datetime, after_id: Any) -> Iterator[Any]:
+    """``(id, *columns)`` rows with (updated_at, id) past the mark, in that order.
+
+    The row-value predicate ``(updated_at, id) > (:ts, :id)`` and the ORDER BY
+    are both served by the composite (updated_at, id) index, so a page costs
+    its own rows with no sort. Pages are keyset queries read to the end, so no
+    cursor (and no read lock on sales.db) stays open while batches are being
+    uploaded.
+    """
+    # A mark saved by older builds holds an external_id; resending that timestamp's rows is harmless
+    ts, last = since, after_id if isinstance(after_id, int) else 0
+    key = tuple_(model.updated_at, model.id)
+    while True:
+        q = select(model.id, *columns).where(key > tuple_(ts, last)).order_by(model.updated_at, model.id).limit(COLLECT_PAGE_SIZE)
+        rows = session.execute(q).all()
+        yield from rows
+        if len(rows) < COLLECT_PAGE_SIZE:
+            return
+        ts, last = rows[-1].updated_at, rows[-1].id
+
+
 def _collect_changes(session) -> tuple[list[dict], list[dict]]:
-    state = _load_state()
-    since_p = state.get("last_upload_products", "1970-01-01T00:00:00")
-    since_c = state.get("last_upload_customers", "1970-01-01T00:00:00")
+    """Products and customers changed since the last acknowledged upload.
 
-    prod_rows = session.execute(select(Product)).scalars().all()
-    products: list[dict] = []
-    for p in prod_rows:
-        if not p.updated_at or p.updated_at.isoformat() <= since_p:
-            continue
-        if not p.external_id:
-            p.external_id = f"{AGENT_CODE}-p-{p.id}"
-        products.append({
-            "external_id": p.external_id,
-            "name": p.name,
-            "price": float(p.price),
-            "cost_price": float(p.cost_price or 0),
-            "stock": int(p.stock),
-            "updated_at": p.updated_at.isoformat(),
-            "deleted_at": p.deleted_at.isoformat() if p.deleted_at else None,
-        })
-
-    cust_rows = session.execute(select(Customer)).scalars().all()
-    customers: list[dict] = []
-    for c in cust_rows:
-        if not c.updated_at or c.updated_at.isoformat() <= since_c:
-            continue
-        if not c.external_id:
-            c.external_id = f"{AGENT_CODE}-c-{c.id}"
-        customers.append({
-            "external_id": c.external_id,
-            "name": c.name,
-            "email": c.email,
-            "phone": c.phone,
-            "updated_at": c.updated_at.isoformat(),
-            "deleted_at": c.deleted_at.isoformat() if c.deleted_at else None,
-        })
+    Rows come back as plain tuples, so the cost follows the number of changed
+    rows rather than the catalog size.
+    """
+    state = _load_state()
+    _backfill_external_ids(session)
+    (_, pm, pkey, pcols), (_, cm, ckey, ccols) = _CATALOG
+    products = [_product_row(*r[1:]) for r in _changed(session, pm, pcols, _since(state, pkey), state.get(pkey + "_id"))]
+    customers = [_customer_row(*r[1:]) for r in _changed(session, cm, ccols, _since(state, ckey), state.get(ckey + "_id"))]
     return products, customers
 
 
-def attempt_sync(session=None) -> bool:
-    queue = _read_queue()
-    token = _get_token()
-    if not token:
-        return False
+def _event_sale(ev) -> Optional[dict[str, Any]]:
+    if ev.event_type != "sale_created":
+        return None  # product_archived / customer_archived travel as catalog rows
+    if "sale" in ev.payload:
+        return ev.payload["sale"]
+    # Queued before snapshots were captured; only the id is known
+    return {
+        "external_id": f"{AGENT_CODE}-{ev.payload['sale_id']}",
+        "agent_code": AGENT_CODE,
+        "customer_external_id": None,
+        "created_at": datetime.utcnow().isoformat(),
+        "updated_at": datetime.utcnow().isoformat(),
+        "items": [],
+    }
+
+
+def _pending_rows(session, state: dict[str, Any], failed: Optional[set[str]] = None) -> Iterator[tuple[str, Optional[dict], tuple]]:
+    """(payload key, row, progress mark) for everything waiting to be uploaded, in upload order.
 
-    products = []
-    customers = []
+    Outbox events that carry no row still yield a mark so they get acknowledged.
+    A catalog table that cannot be read adds its mark name to ``failed``; the
+    caller must leave that mark where it is so the rows go out next sync.
+    """
     if session is not None:
+        catalog = _CATALOG
         try:
-            p, c = _collect_changes(session)
-            products, customers = p, c
+            _backfill_external_ids(session)
         except Exception:
-            products, customers = [], []
-
-    sales = []
-    for ev in queue:
-        if ev.get("event_type") == "sale_created":
-            sales.append({
-                "external_id": f"{AGENT_CODE}-{ev['payload']['sale_id']}",
-                "agent_code": AGENT_CODE,
-                "customer_external_id": None,
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat(),
-                "items": [],
-            })
-        elif ev.get("event_type") == "product_archived":
-            pass
-        elif ev.get("event_type") == "customer_archived":
-            pass
-
-    payload = {"products": products, "customers": customers, "sales": sales}
-    started = time.time()
-    enc = _encrypt_payload(payload)
+            session.rollback()
+            catalog = ()
+            if failed is not None:
+                failed.update(mark for _, _, mark, _ in _CATALOG)
+        for key, model, mark, columns in catalog:
+            to_row = _product_row if key == "products" else _customer_row
+            try:
+                for r in _changed(session, model, columns, _since(state, mark), state.get(mark + "_id")):
+                    yield key, to_row(*r[1:]), (mark, r.updated_at.isoformat(), r.id)
+            except Exception:
+                session.rollback()  # sales still go out
+                if failed is not None:
+                    failed.add(mark)
+    after = outbox.acked()
+    while events := outbox.pending(limit=COLLECT_PAGE_SIZE, after=after):
+        for ev in events:
+            yield "sales", _event_sale(ev), ("outbox", ev.seq)
+        after = events[-1].seq
+
+
+class UploadBatch(NamedTuple):
+    payload: dict[str, list]
+    marks: dict[str, tuple]  # progress to commit once the server accepted it
+
 
+def _batches(rows: Iterable[tuple[str, Optional[dict], tuple]], max_rows: int = SYNC_BATCH_ROWS, max_bytes: int = SYNC_BATCH_BYTES) -> Iterator[UploadBatch]:
+    payload: dict[str, list] = {"products": [], "customers": [], "sales": []}
+    marks: dict[str, tuple] = {}
+    n = size = 0
+    for key, row, mark in rows:
+        if row is not None:
+            row_bytes = len(json.dumps(row)) + 1
+            if n and (n + 1 > max_rows or size + row_bytes > max_bytes):
+                yield UploadBatch(payload, marks)
+                payload, marks, n, size = {"products": [], "customers": [], "sales": []}, {}, 0, 0
+            payload[key].append(row)
+            n += 1
+            size += row_bytes
+        marks[mark[0]] = mark
+    if n or marks:
+        yield UploadBatch(payload, marks)
+
+
+def _post_batch(payload: dict[str, list], token: str, codec: tuple[str, Optional[int]]) -> Optional[int]:
+    """Upload one batch in the configured format; returns bytes sent, or None if it was not accepted.
+
+    ``codec`` is ``_choose_codec`` of the sync's state, picked once by the
+    caller so worker threads never read sync_state.json.
+    """
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": _batch_key(payload)}
+    if SYNC_UPLOAD_FORMAT == "binary":
+        frame, codec_headers = _encrypt_frame(payload, codec)
+        request_kwargs = {"data": frame, "headers": {**headers, **codec_headers, "Content-Type": "application/octet-stream"}}
+        url = f"{client.server}/sync/upload.bin"
+        size_bytes = [len(frame)]
+    elif SYNC_UPLOAD_FORMAT == "stream":
+        size_bytes = [0]
+
+        def body() -> Iterator[bytes]:
+            for part in _encrypt_stream(_ndjson_records(payload)):
+                size_bytes[0] += len(part)
+                yield part
+
+        request_kwargs = {"data": body(), "headers": {**headers, "Content-Type": "application/octet-stream"}}
+        url = f"{client.server}/sync/upload.stream"
+    else:
+        enc = _encrypt_payload(payload, codec)
+        request_kwargs = {"json": enc, "headers": headers}
+        url = f"{client.server}/sync/upload"
+        size_bytes = [len(enc.get("ciphertext", "").encode("utf-8"))]
     try:
-        r = requests.post(f"{SYNC_SERVER}/sync/upload", json=enc, headers={"Authorization": f"Bearer {token}"}, timeout=20)
+        # The per-row results are never read; ask for counts only
+        r = client.session.post(url, params={"response": "summary"}, timeout=SYNC_UPLOAD_TIMEOUT, **request_kwargs)
+        if r.status_code == 401:
+            client.invalidate()  # e.g. the server restarted with a new secret; the retry logs in again
+        client.throttled(r)
         r.raise_for_status()
-        duration = time.time() - started
-        size_bytes = len(enc.get("ciphertext", "").encode("utf-8"))
-        state = _load_state()
-        now = datetime.utcnow().isoformat()
-        state["last_upload_products"] = now
-        state["last_upload_customers"] = now
-        state["last_sync_duration_sec"] = round(duration, 3)
-        state["last_sync_payload_bytes"] = size_bytes
-        _save_state(state)
-        _write_queue([])
-        return True
+        return size_bytes[0]
     except Exception:
+        return None
+
+
+def _commit_progress(state: dict[str, Any], marks: dict[str, tuple]) -> None:
+    for name, mark in marks.items():
+        if name == "outbox":
+            outbox.ack(mark[1])
+        else:
+            state[name], state[name + "_id"] = mark[1], mark[2]
+    _save_state(state)
+
+
+def attempt_sync(session=None) -> bool:
+    """Upload pending catalog rows and outbox sales in batches capped by row count and size.
+
+    Up to SYNC_IN_FLIGHT batches are sent at once, but progress is committed
+    strictly in order: catalog marks to sync_state and sales to the outbox
+    offset, one batch at a time. After a failure nothing past the first
+    unconfirmed batch is committed, so the next attempt resumes there (batches
+    the server did take are replayed through their Idempotency-Key).
+    """
+    token = _get_token()
+    if not token:
         return False
+    state = _load_state()
+    started = datetime.utcnow()
+    sent = 0
+    ok = True
+    unread: set[str] = set()
+    batches = _batches(_pending_rows(session, state, unread))
+    codec = _choose_codec(state)
+    with ThreadPoolExecutor(max_workers=SYNC_IN_FLIGHT) as pool:
+        window: deque[tuple[UploadBatch, Future]] = deque()
+        while True:
+            while ok and len(window) < SYNC_IN_FLIGHT and (batch := next(batches, None)) is not None:
+                window.append((batch, pool.submit(_post_batch, batch.payload, token, codec)))
+            if not window:
+                break
+            batch, future = window.popleft()
+            n = future.result()
+            if n is None:
+                ok = False
+            if ok:
+                _commit_progress(state, batch.marks)
+                sent += n
+    if not ok:
+        return False
+    # Everything changed before the sync started is up; later edits carry later timestamps.
+    # A table that could not be read keeps its last acknowledged row as the mark.
+    for _, _, mark, _ in _CATALOG:
+        if mark in unread:
+            continue
+        state[mark] = max(_since(state, mark), started).isoformat()
+        state.pop(mark + "_id", None)
+    state["last_sync_duration_sec"] = round((datetime.utcnow() - started).total_seconds(), 3)
+    state["last_sync_payload_bytes"] = sent
+    _save_state(state)
+    outbox.compact()
+    return True
 
 
 def attempt_sync_with_backoff(session=None, max_attempts: int = 5) -> bool:
@@ -193,6 +573,7 @@ def attempt_sync_with_backoff(session=None, max_attempts: int = 5) -> bool:
         if ok:
             return True
         sleep_s = base_delay * (2 ** attempt) + random.uniform(0, 0.5)
-        time.sleep(min(sleep_s, 60.0))
+        # A rate-limited server's Retry-After wins over a shorter backoff
+        time.sleep(max(min(sleep_s, 60.0), client.retry_in()))
         attempt += 1
     return False
\ No newline at end of file
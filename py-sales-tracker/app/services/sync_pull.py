@@ -1,17 +1,20 @@
 from __future__ import annotations
 
+import base64
+import hashlib
 import os
+from bisect import bisect_left
 from datetime import datetime
 from typing import Any
 
-import requests
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.data.models import Product, Customer
-from app.services.sync import _load_state, _save_state, _get_token
+from app.services.bootstrap import bootstrap_from_snapshot, needs_bootstrap
+from app.services.sync import SYNC_DICT_PATH, _load_state, _save_state, _get_token, client
 
-SYNC_SERVER = os.getenv("SYNC_SERVER", "http://127.0.0.1:8000")
+PULL_PAGE_SIZE = int(os.getenv("SYNC_PULL_PAGE_SIZE", "500"))
 
 
 def _parse_dt(s: str) -> datetime:
@@ -21,33 +24,33 @@ def _parse_dt(s: str) -> datetime:
         return datetime.utcnow()
 
 
-def pull_updates(session: Session) -> bool:
-    state = _load_state()
-    since = state.get("last_download", "1970-01-01T00:00:00")
-    token = _get_token()
-    if not token:
-        return False
+def _existing_by_external_id(session: Session, model, rows: list[dict]) -> dict[str, Any]:
+    ids = [r["external_id"] for r in rows if r.get("external_id")]
+    if not ids:
+        return {}
+    return {o.external_id: o for o in session.execute(select(model).where(model.external_id.in_(ids))).scalars()}
 
-    try:
-        r = requests.get(f"{SYNC_SERVER}/sync/download", params={"since": since}, headers={"Authorization": f"Bearer {token}"}, timeout=8)
-        r.raise_for_status()
-        data = r.json()
-    except Exception:
-        return False
 
-    changed = False
+def _server_wins(existing, row: dict, ties: bool) -> bool:
+    if not existing.updated_at:
+        return True
+    ts = _parse_dt(row["updated_at"])
+    return ts > existing.updated_at or (ties and ts == existing.updated_at)
+
 
-    for p in data.get("products", []):
-        existing = None
-        if p.get("external_id"):
-            existing = session.execute(select(Product).where(Product.external_id == p["external_id"])) .scalar_one_or_none()
+def _apply_products(session: Session, rows: list[dict], ties: bool = False) -> bool:
+    """Upsert server rows by external_id; local rows are only replaced by newer ones (or equally new with ``ties``)."""
+    changed = False
+    existing_map = _existing_by_external_id(session, Product, rows)
+    for p in rows:
+        existing = existing_map.get(p.get("external_id"))
         if existing:
-            if not existing.updated_at or _parse_dt(p["updated_at"]) > existing.updated_at:
+            if _server_wins(existing, p, ties):
                 existing.name = p["name"]
                 existing.price = p["price"]
                 existing.cost_price = p.get("cost_price") or existing.cost_price
                 existing.stock = p["stock"]
-                existing.updated_at = _parse_dt(p["updated_at"]) 
+                existing.updated_at = _parse_dt(p["updated_at"])
                 existing.deleted_at = _parse_dt(p["deleted_at"]) if p.get("deleted_at") else None
                 changed = True
         else:
@@ -61,18 +64,23 @@ def pull_updates(session: Session) -> bool:
                 deleted_at=_parse_dt(p["deleted_at"]) if p.get("deleted_at") else None,
             )
             session.add(row)
+            if row.external_id:
+                existing_map[row.external_id] = row
             changed = True
+    return changed
+
 
-    for c in data.get("customers", []):
-        existing = None
-        if c.get("external_id"):
-            existing = session.execute(select(Customer).where(Customer.external_id == c["external_id"])) .scalar_one_or_none()
+def _apply_customers(session: Session, rows: list[dict], ties: bool = False) -> bool:
+    changed = False
+    existing_map = _existing_by_external_id(session, Customer, rows)
+    for c in rows:
+        existing = existing_map.get(c.get("external_id"))
         if existing:
-            if not existing.updated_at or _parse_dt(c["updated_at"]) > existing.updated_at:
+            if _server_wins(existing, c, ties):
                 existing.name = c["name"]
                 existing.email = c.get("email")
                 existing.phone = c.get("phone")
-                existing.updated_at = _parse_dt(c["updated_at"]) 
+                existing.updated_at = _parse_dt(c["updated_at"])
                 existing.deleted_at = _parse_dt(c["deleted_at"]) if c.get("deleted_at") else None
                 changed = True
         else:
@@ -85,12 +93,216 @@ def pull_updates(session: Session) -> bool:
                 deleted_at=_parse_dt(c["deleted_at"]) if c.get("deleted_at") else None,
             )
             session.add(row)
+            if row.external_id:
+                existing_map[row.external_id] = row
             changed = True
+    return changed
 
+
+def _remember_codecs(state: dict[str, Any], data: dict) -> None:
+    """Keep the server's upload codecs and its newest compression dictionary."""
+    if "codecs" in data:
+        state["server_codecs"] = data["codecs"]
+    dictionary = data.get("dictionary")
+    if dictionary:
+        SYNC_DICT_PATH.write_bytes(base64.b64decode(dictionary["data"]))
+        state["sync_dict_id"] = dictionary["id"]
+
+
+def _apply_deletes(session: Session, refs: list[dict]) -> bool:
+    """Rows hard-deleted on the server are archived locally (``deleted_at``)."""
+    changed = False
+    for kind, model in (("product", Product), ("customer", Customer)):
+        rows = [{"external_id": r["external_id"]} for r in refs if r.get("type") == kind]
+        for obj in _existing_by_external_id(session, model, rows).values():
+            if obj.deleted_at is None:
+                obj.deleted_at = datetime.utcnow()
+                changed = True
+    return changed
+
+
+def _get_page(token: str, params: dict, path: str = "/sync/download") -> dict | None:
+    try:
+        r = client.session.get(f"{client.server}{path}", params=params, headers={"Authorization": f"Bearer {token}"}, timeout=8)
+        if r.status_code == 401:
+            client.invalidate()
+        client.throttled(r)
+        r.raise_for_status()
+        return r.json()
+    except Exception:
+        return None
+
+
+def _apply_page(session: Session, data: dict) -> bool:
+    changed = _apply_products(session, data.get("products", []))
+    changed = _apply_customers(session, data.get("customers", [])) or changed
+    changed = _apply_deletes(session, data.get("deleted", [])) or changed
     if changed:
         session.commit()
+    return changed
+
+
+def pull_updates(session: Session) -> bool:
+    """Pull catalog changes by change-log sequence, or by timestamp from older servers.
+
+    Each page is committed as it arrives and its position saved, so an
+    interrupted pull resumes where it stopped. A fresh install first imports
+    the server's catalog snapshot and only pulls what changed after it.
+    """
+    state = _load_state()
+    token = _get_token()
+    if not token:
+        return False
+    if state.get("download_mode") != "since":
+        bootstrapped = needs_bootstrap(state) and bootstrap_from_snapshot(session, state, token)
+        changed = _pull_by_seq(session, state, token)
+        if changed is not None:
+            return changed or bootstrapped
+    return _pull_by_time(session, state, token)
+
+
+def _pull_by_seq(session: Session, state: dict[str, Any], token: str) -> bool | None:
+    """Returns None when the server does not know ``after_seq``."""
+    changed = False
+    while True:
+        # ``since`` keeps the request valid for servers without a change log; they answer without last_seq
+        params = {"after_seq": state.get("download_seq", 0), "since": state.get("last_download", "1970-01-01T00:00:00"), "limit": PULL_PAGE_SIZE}
+        if state.get("sync_dict_id") is not None:
+            params["dict_id"] = state["sync_dict_id"]
+        data = _get_page(token, params)
+        if data is None:
+            return changed
+        if data.get("last_seq") is None:
+            state["download_mode"] = "since"
+            _save_state(state)
+            return None
+        changed = _apply_page(session, data) or changed
+        _remember_codecs(state, data)
+        state["download_seq"] = data["last_seq"]
+        _save_state(state)
+        if not data.get("has_more"):
+            return changed
+
+
+def _pull_by_time(session: Session, state: dict[str, Any], token: str) -> bool:
+    """``since`` paging; the cursor is saved after every page and ``last_download``
+    only advances once the last page is in."""
+    since = state.get("last_download", "1970-01-01T00:00:00")
+    cursor = state.get("download_cursor")
+    # server_time of the first page: rows changed while we page are re-fetched next time
+    watermark = state.get("download_watermark")
+    changed = False
+    while True:
+        params = {"since": since, "limit": PULL_PAGE_SIZE}
+        if state.get("sync_dict_id") is not None:
+            params["dict_id"] = state["sync_dict_id"]
+        if cursor:
+            params["cursor"] = cursor
+        data = _get_page(token, params)
+        if data is None:
+            return changed
+
+        changed = _apply_page(session, data) or changed
+        _remember_codecs(state, data)
+        watermark = watermark or data.get("server_time")
+        cursor = data.get("next_cursor")
+        if not cursor:
+            break
+        state["download_cursor"] = cursor
+        state["download_watermark"] = watermark
+        _save_state(state)
 
     # Advance watermark
-    state["last_download"] = data.get("server_time")
+    state["last_download"] = watermark
+    state.pop("download_cursor", None)
+    state.pop("download_watermark", None)
     _save_state(state)
-    return changed 
\ No newline at end of file
+    return changed
+
+
+# --- Digest reconciliation ---
+# Mirrors the server's app/digest.py: live rows (external_id set, not archived)
+# hash to 16 bytes, an external_id range [lo, hi) to the hash of its row hashes
+# in external_id order. Comparing the server's range digests level by level finds the
+# ranges that differ for a few KB of requests instead of a full download.
+RECONCILE_LEAF_ROWS = 256
+_ENTITIES = (("product", Product, "products", "last_upload_products"), ("customer", Customer, "customers", "last_upload_customers"))
+
+
+def row_hash(kind: str, r) -> bytes:
+    if kind == "product":
+        fields = (r.external_id, r.name, f"{float(r.price):.2f}", str(int(r.stock)), r.updated_at.isoformat())
+    else:
+        fields = (r.external_id, r.name, r.email or "", r.phone or "", r.updated_at.isoformat())
+    return hashlib.blake2b("\x1f".join(fields).encode("utf-8"), digest_size=16).digest()
+
+
+class LocalDigest:
+    def __init__(self, session: Session, kind: str, model) -> None:
+        q = select(model).where(model.external_id.is_not(None), model.deleted_at.is_(None), model.updated_at.is_not(None))
+        rows = sorted((r.external_id, row_hash(kind, r)) for r in session.execute(q).scalars())
+        self.ids = [r[0] for r in rows]
+        self.hashes = [r[1] for r in rows]
+
+    def _span(self, lo: str, hi: str) -> tuple[int, int]:
+        return bisect_left(self.ids, lo), bisect_left(self.ids, hi) if hi else len(self.ids)
+
+    def digest(self, lo: str, hi: str) -> str:
+        i, j = self._span(lo, hi)
+        return hashlib.blake2b(b"".join(self.hashes[i:j]), digest_size=16).hexdigest()
+
+    def external_ids(self, lo: str, hi: str) -> list[str]:
+        i, j = self._span(lo, hi)
+        return self.ids[i:j]
+
+
+def reconcile(session: Session) -> dict[str, int] | None:
+    """Check the local catalog against the server's digests and repair ranges that differ.
+
+    Returns the number of rows re-fetched per entity (0 = in sync), or None if
+    the server could not be reached. Local rows the server no longer has are
+    archived unless they are still waiting to be uploaded.
+    """
+    token = _get_token()
+    if not token:
+        return None
+    state = _load_state()
+    fetched: dict[str, int] = {}
+    for kind, model, key, upload_mark in _ENTITIES:
+        local = LocalDigest(session, kind, model)
+        fetched[kind] = 0
+        pending = [("", "")]
+        while pending:
+            lo, hi = pending.pop()
+            node = _get_page(token, {"entity": kind, "lo": lo, "hi": hi}, path="/sync/digest")
+            if node is None:
+                return None
+            if node["digest"] == local.digest(lo, hi):
+                continue
+            if not node["children"]:
+                leaves = [(lo, hi)]
+            else:
+                differ = [c for c in node["children"] if c["digest"] != local.digest(c["lo"], c["hi"])]
+                pending.extend((c["lo"], c["hi"]) for c in differ if c["count"] > RECONCILE_LEAF_ROWS)
+                leaves = [(c["lo"], c["hi"]) for c in differ if c["count"] <= RECONCILE_LEAF_ROWS]
+            for a, b in leaves:
+                data = _get_page(token, {"entity": kind, "lo": a, "hi": b}, path="/sync/digest/rows")
+                if data is None:
+                    return None
+                rows = data[key]
+                _repair_range(session, kind, model, rows, local.external_ids(a, b), state.get(upload_mark, "1970-01-01T00:00:00"))
+                fetched[kind] += len(rows)
+    return fetched
+
+
+def _repair_range(session: Session, kind: str, model, rows: list[dict], local_ids: list[str], uploaded_until: str) -> None:
+    if kind == "product":
+        _apply_products(session, rows, ties=True)
+    else:
+        _apply_customers(session, rows, ties=True)
+    on_server = {r["external_id"] for r in rows}
+    gone = [{"external_id": ext} for ext in local_ids if ext not in on_server]
+    for obj in _existing_by_external_id(session, model, gone).values():
+        if obj.updated_at.isoformat() <= uploaded_until:
+            obj.deleted_at = datetime.utcnow()
+    session.commit()
@@ -12,7 +12,8 @@ from sqlalchemy.orm import Session
 from sqlalchemy import select
 
 from app.data.models import Product, Customer, Sale, SaleItem
-from app.services.sync import enqueue
+from app.services.outbox import outbox
+from app.services.sync import sale_snapshot
 
 
 class SalesEntryWidget(QWidget):
@@ -159,6 +160,7 @@ class SalesEntryWidget(QWidget):
         self.session.flush()
 
         # Validate stock again and deduct
+        lines = []
         for r in range(self.table.rowCount()):
             name = self.table.item(r, 0).text()
             qty = int(self.table.item(r, 1).text())
@@ -170,9 +172,12 @@ class SalesEntryWidget(QWidget):
                 return
             product.stock -= qty
             self.session.add(SaleItem(sale_id=sale.id, product_id=product.id, quantity=qty, price=price))
+            lines.append((product, qty, price))
 
+        # Queued in the same transaction as the sale, with everything the upload needs
+        customer = self.session.get(Customer, customer_id) if customer_id else None
+        outbox.stage(self.session, "sale_created", {"sale_id": sale.id, "sale": sale_snapshot(sale, customer, lines)})
         self.session.commit()
-        enqueue("sale_created", {"sale_id": sale.id})
         QMessageBox.information(self, "Saved", f"Sale #{sale.id} saved.")
         self.table.setRowCount(0)
         self.update_total()
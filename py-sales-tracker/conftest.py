@@ -2,6 +2,7 @@
 Pytest configuration file to fix import paths for the Sales Tracker application.
 """
 import sys
+import tempfile
 from pathlib import Path
 
 # Add the project root to Python path so tests can import app modules
@@ -15,3 +16,6 @@ if current_path:
     os.environ['PYTHONPATH'] = f"{project_root}{os.pathsep}{current_path}"
 else:
     os.environ['PYTHONPATH'] = str(project_root)
+
+# Keep sales.db, sync_state.json and the outbox out of the working tree
+os.environ.setdefault('SALES_TRACKER_DATA_DIR', tempfile.mkdtemp(prefix='sales-tracker-tests-'))
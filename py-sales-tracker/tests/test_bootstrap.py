@@ -0,0 +1,55 @@
+import base64
+import sys
+from datetime import datetime
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.data.models import Product, init_db
+from app.services import sync
+from app.services.bootstrap import import_snapshot
+from app.scripts.bench_bootstrap import _catalog, _snapshot
+
+
+def test_snapshot_import_keeps_newer_local_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(sync, "SYNC_AES_KEY_BASE64", base64.b64encode(b"\x02" * 32).decode())
+    engine = create_engine(f"sqlite:///{(tmp_path / 'client.db').as_posix()}", future=True)
+    init_db(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    with Session() as s:
+        s.add(Product(external_id="SKU-000000", name="Local edit", price=1, stock=1, updated_at=datetime(2030, 1, 1)))
+        s.add(Product(external_id="SKU-000001", name="Stale", price=1, stock=1, updated_at=datetime(2000, 1, 1)))
+        s.commit()
+
+    sealed = _snapshot(_catalog(3), tmp_path / "snap.sqlite")
+    assert import_snapshot(engine, iter(sealed)) == 3
+    with Session() as s:
+        names = s.execute(select(Product.external_id, Product.name).order_by(Product.external_id)).all()
+    assert names == [("SKU-000000", "Local edit"), ("SKU-000001", "Product 1"), ("SKU-000002", "Product 2")]
+
+    with pytest.raises(Exception):
+        import_snapshot(engine, iter(sealed[:-1]))
+
+
+def test_snapshot_import_merges_local_products_by_name(tmp_path, monkeypatch):
+    monkeypatch.setattr(sync, "SYNC_AES_KEY_BASE64", base64.b64encode(b"\x02" * 32).decode())
+    engine = create_engine(f"sqlite:///{(tmp_path / 'client.db').as_posix()}", future=True)
+    init_db(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    with Session() as s:
+        s.add(Product(name="Product 1", price=1, stock=1, updated_at=datetime(2000, 1, 1)))  # not uploaded yet
+        s.commit()
+
+    sealed = _snapshot(_catalog(3), tmp_path / "snap.sqlite")
+    assert import_snapshot(engine, iter(sealed)) == 3
+    with Session() as s:
+        assert s.execute(select(Product.external_id).where(Product.name == "Product 1")).scalar() == "SKU-000001"
+        assert s.query(Product).count() == 3
+
+        # A name held under another external_id cannot be placed; the pull must start from 0
+        s.add(Product(external_id="LOCAL-9", name="Product 5", price=1, stock=1))
+        s.commit()
+    assert import_snapshot(engine, iter(_snapshot(_catalog(6), tmp_path / "snap6.sqlite"))) == 0
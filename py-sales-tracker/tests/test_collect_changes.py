@@ -0,0 +1,39 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.data.models import Customer, Product, init_db
+from app.services import sync as s
+from app.services.migrate import TARGET_VERSION, migrate
+
+
+def test_collect_changes_selects_by_indexed_updated_at(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{(tmp_path / 'sales.db').as_posix()}", future=True)
+    init_db(engine)
+    migrate(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT version FROM schema_version")).scalar() == TARGET_VERSION
+        plan = str(conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM products WHERE (updated_at, id) > ('2024-01-01', 5) ORDER BY updated_at, id LIMIT 1000"
+        )).all())
+        assert "ix_products_updated_at_id" in plan and "TEMP B-TREE" not in plan
+
+    session = sessionmaker(bind=engine, future=True)()
+    session.add_all([
+        Product(name="Old", price=1, stock=1, updated_at=datetime(2023, 1, 1)),
+        Product(name="New", price=2, stock=3, updated_at=datetime(2024, 6, 1), external_id="SKU-N"),
+        Product(name="Fresh", price=2, stock=3, updated_at=datetime(2024, 7, 1)),
+        Customer(name="Ann", updated_at=datetime(2024, 6, 1)),
+    ])
+    session.commit()
+    monkeypatch.setattr(s, "_load_state", lambda: {"last_upload_products": "2024-01-01T00:00:00", "last_upload_customers": "2024-01-01T00:00:00"})
+    products, customers = s._collect_changes(session)
+    fresh_id = session.query(Product.id).filter(Product.name == "Fresh").scalar()
+    assert sorted(p["external_id"] for p in products) == sorted(["SKU-N", f"{s.AGENT_CODE}-p-{fresh_id}"])
+    assert customers[0]["external_id"].startswith(f"{s.AGENT_CODE}-c-")
+    # Backfilled ids are stored, not just sent
+    assert session.query(Product).filter(Product.external_id.is_(None)).count() == 0
@@ -1,17 +1,101 @@
+import json
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from app.services.sync import _read_queue, _write_queue, enqueue
+from sqlalchemy import create_engine
+
+from app.services.outbox import Outbox
+
+
+def _outbox(tmp_path, legacy=None) -> Outbox:
+    engine = create_engine(f"sqlite:///{(tmp_path / 'sales.db').as_posix()}", future=True)
+    return Outbox(engine, legacy_path=legacy or tmp_path / 'offline_queue.json')
 
 
 def test_queue_roundtrip(tmp_path, monkeypatch):
-    qp = tmp_path / 'offline_queue.json'
-    monkeypatch.setenv('PYTHONHASHSEED', '0')
     from app.services import sync as s
-    s.QUEUE_PATH = qp
-    _write_queue([])
-    assert _read_queue() == []
-    enqueue('sale_created', {'sale_id': 1})
-    q = _read_queue()
-    assert q and q[0]['event_type'] == 'sale_created' 
\ No newline at end of file
+    monkeypatch.setattr(s, 'outbox', _outbox(tmp_path))
+    assert s.outbox.pending() == []
+    s.enqueue('sale_created', {'sale_id': 1})
+    q = s.outbox.pending()
+    assert q and q[0].event_type == 'sale_created' and q[0].payload == {'sale_id': 1}
+
+
+def test_ack_by_offset_and_compaction(tmp_path):
+    box = _outbox(tmp_path)
+    seqs = [box.append('sale_created', {'sale_id': i}) for i in range(5)]
+    batch = box.pending(limit=2)
+    assert [e.seq for e in batch] == seqs[:2]
+    box.ack(batch[-1].seq)
+    box.ack(seqs[0])  # never moves back
+    assert [e.payload['sale_id'] for e in box.pending()] == [2, 3, 4] and len(box) == 3
+    assert box.compact() == 2
+    assert box.append('sale_created', {'sale_id': 5}) > seqs[-1]  # offsets are not reused
+    assert len(box) == 4
+
+
+def test_legacy_json_queue_is_imported_once(tmp_path):
+    legacy = tmp_path / 'offline_queue.json'
+    legacy.write_text(json.dumps([{'event_type': 'sale_created', 'payload': {'sale_id': 7}, 'ts': '2024-01-01T00:00:00'}]))
+    box = _outbox(tmp_path, legacy)
+    assert [e.payload for e in box.pending()] == [{'sale_id': 7}]
+    assert not legacy.exists() and (tmp_path / 'offline_queue.json.imported').exists()
+
+
+def test_sale_snapshot_is_queued_with_the_sale(tmp_path, monkeypatch):
+    from decimal import Decimal
+
+    from sqlalchemy.orm import sessionmaker
+
+    from app.data.models import Customer, Product, Sale, init_db
+    from app.services import sync as s
+
+    box = _outbox(tmp_path)
+    init_db(box.engine)
+    session = sessionmaker(bind=box.engine, future=True)()
+    tea, ann = Product(name="Tea", price=2, stock=5), Customer(name="Ann", external_id="C-1")
+    session.add_all([tea, ann])
+    session.flush()
+
+    sale = Sale(customer_id=ann.id)
+    session.add(sale)
+    session.flush()
+    box.stage(session, 'sale_created', {'sale_id': sale.id, 'sale': s.sale_snapshot(sale, ann, [(tea, 2, Decimal("1.50"))])})
+    session.rollback()
+    assert box.pending() == []  # nothing is queued for a sale that was not saved
+
+    session.add_all([tea, ann])
+    session.flush()
+    sale = Sale(customer_id=ann.id)
+    session.add(sale)
+    session.flush()
+    box.stage(session, 'sale_created', {'sale_id': sale.id, 'sale': s.sale_snapshot(sale, ann, [(tea, 2, Decimal("1.50"))])})
+    session.commit()
+
+    sent = {}
+    monkeypatch.setattr(s, 'outbox', box)
+    monkeypatch.setattr(s, '_get_token', lambda: 'tok')
+    monkeypatch.setattr(s, '_encrypt_payload', lambda payload, codec: sent.update(payload) or {})
+    monkeypatch.setattr(s.client.session, 'post', lambda *a, **k: (_ for _ in ()).throw(OSError('offline')))
+    assert s.attempt_sync() is False
+    assert sent['sales'] == [{
+        'external_id': f'{s.AGENT_CODE}-{sale.id}', 'agent_code': s.AGENT_CODE, 'customer_external_id': 'C-1',
+        'created_at': sale.created_at.isoformat(), 'updated_at': sale.created_at.isoformat(),
+        'items': [{'product_external_id': f'{s.AGENT_CODE}-p-{tea.id}', 'quantity': 2, 'price': 1.5}],
+    }]
+    assert len(box) == 1  # still pending after the failed upload
+
+
+def test_legacy_json_queue_survives_failed_import(tmp_path, monkeypatch):
+    import pytest
+
+    legacy = tmp_path / 'offline_queue.json'
+    legacy.write_text(json.dumps([{'event_type': 'sale_created', 'payload': {'sale_id': 8}}]))
+    box = _outbox(tmp_path, legacy)
+    monkeypatch.setattr(box, '_import_legacy', lambda conn: (Outbox._import_legacy(box, conn), conn.exec_driver_sql('SELECT * FROM no_such_table')))
+    with pytest.raises(Exception):
+        box.pending()
+    assert legacy.exists()  # the rollback kept nothing, so the file must stay
+    monkeypatch.undo()
+    assert [e.payload for e in box.pending()] == [{'sale_id': 8}]
@@ -0,0 +1,53 @@
+import sys
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.data.models import Product, init_db
+from app.services import sync_pull
+from app.services.sync_pull import LocalDigest, reconcile, row_hash
+
+
+def test_row_hash_matches_server():
+    # Pinned in cloud-backend/tests/test_digest.py as well
+    p = SimpleNamespace(external_id="SKU-1", name="Tea", price=Decimal("2.5"), stock=7, updated_at=datetime(2024, 1, 2, 3, 4, 5, 600000))
+    c = SimpleNamespace(external_id="C-1", name="Ann", email=None, phone="555", updated_at=datetime(2024, 1, 2))
+    assert row_hash("product", p).hex() == "30b52f82a8bdfb9de62f538460e23a9b"
+    assert row_hash("customer", c).hex() == "62ce4826bf53fb4bd2c890eeb601673b"
+
+
+def test_reconcile_repairs_differing_range(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{(tmp_path / 'client.db').as_posix()}", future=True)
+    init_db(engine)
+    session = sessionmaker(bind=engine, future=True)()
+    t = datetime(2024, 1, 1)
+    session.add_all([
+        Product(external_id="A", name="Apple", price=1, stock=1, updated_at=t),
+        Product(external_id="B", name="Banana", price=1, stock=9, updated_at=t),  # server says stock 2, same timestamp
+        Product(external_id="C", name="Cherry", price=1, stock=1, updated_at=t),  # gone on the server
+    ])
+    session.commit()
+    server = [{"external_id": "A", "name": "Apple", "price": 1, "stock": 1, "updated_at": t.isoformat()},
+              {"external_id": "B", "name": "Banana", "price": 1, "stock": 2, "updated_at": t.isoformat()}]
+    requests_made = []
+
+    def fake_get(token, params, path="/sync/download"):
+        requests_made.append((path, params["entity"]))
+        if params["entity"] == "customer":
+            return {"digest": LocalDigest(session, "customer", sync_pull.Customer).digest("", ""), "children": []}
+        if path == "/sync/digest":
+            return {"digest": "server", "children": []}
+        return {"products": server, "customers": []}
+
+    monkeypatch.setattr(sync_pull, "_get_token", lambda: "tok")
+    monkeypatch.setattr(sync_pull, "_load_state", lambda: {"last_upload_products": "2024-06-01T00:00:00"})
+    monkeypatch.setattr(sync_pull, "_get_page", fake_get)
+    assert reconcile(session) == {"product": 2, "customer": 0}
+    rows = {p.external_id: p for p in session.execute(select(Product)).scalars()}
+    assert rows["B"].stock == 2 and rows["C"].deleted_at is not None and rows["A"].deleted_at is None
+    assert requests_made == [("/sync/digest", "product"), ("/sync/digest/rows", "product"), ("/sync/digest", "customer")]
@@ -5,4 +5,62 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from app.services.sync import attempt_sync_with_backoff
 
 def test_sync_backoff_smoke():
-    assert attempt_sync_with_backoff(session=None, max_attempts=1) in (True, False) 
\ No newline at end of file
+    assert attempt_sync_with_backoff(session=None, max_attempts=1) in (True, False) 
+
+def test_login_token_is_reused_until_near_expiry(monkeypatch):
+    import base64
+    import json
+    import time
+
+    from app.services import sync as s
+
+    logins = []
+
+    class Resp:
+        status_code = 200
+
+        def __init__(self, exp):
+            claims = base64.urlsafe_b64encode(json.dumps({"sub": "a", "exp": exp}).encode()).rstrip(b"=").decode()
+            self.token = f"h.{claims}.sig"
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"access_token": self.token}
+
+    client = s.SyncClient(server="http://sync.invalid")
+    monkeypatch.setattr(client.session, "post", lambda *a, **k: logins.append(1) or Resp(time.time() + 3600))
+    first = client.token()
+    assert client.token() == first and len(logins) == 1
+    client.invalidate()
+    client.token()
+    assert len(logins) == 2
+    monkeypatch.setattr(client.session, "post", lambda *a, **k: logins.append(1) or Resp(time.time() + s.TOKEN_REFRESH_MARGIN - 1))
+    client.invalidate()
+    client.token()
+    client.token()
+    assert len(logins) == 4  # too close to exp to be reused
+
+
+def test_backoff_waits_for_retry_after(monkeypatch):
+    from app.services import sync as s
+
+    class Resp:
+        status_code = 429
+        headers = {"Retry-After": "30"}
+
+        def raise_for_status(self):
+            raise RuntimeError("429")
+
+    client = s.SyncClient(server="http://sync.invalid")
+    monkeypatch.setattr(client.session, "post", lambda *a, **k: Resp())
+    monkeypatch.setattr(s, "client", client)
+    monkeypatch.setattr(s, "_get_token", lambda: "tok")
+    monkeypatch.setattr(s, "_load_state", lambda: {})
+    monkeypatch.setattr(s, "_save_state", lambda st: None)
+    monkeypatch.setattr(s, "_pending_rows", lambda session, state, failed=None: iter([("sales", {"external_id": "S-1"}, ("outbox", 1))]))
+    slept = []
+    monkeypatch.setattr(s.time, "sleep", slept.append)
+    assert s.attempt_sync_with_backoff(max_attempts=1) is False
+    assert 29 < slept[0] <= 30  # longer than the 2 s first backoff
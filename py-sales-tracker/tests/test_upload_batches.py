@@ -0,0 +1,106 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.data.models import Product, init_db
+from app.services import sync as s
+from app.services.outbox import Outbox
+
+
+def test_batches_respect_row_and_byte_caps():
+    rows = [("products", {"external_id": f"P{i}", "name": "x" * 40}, ("last_upload_products", "t", f"P{i}")) for i in range(5)]
+    rows.append(("sales", None, ("outbox", 9)))  # an event with nothing to send is still acknowledged
+    assert [len(b.payload["products"]) for b in s._batches(rows, max_rows=2, max_bytes=10**6)] == [2, 2, 1]
+    assert [len(b.payload["products"]) for b in s._batches(rows, max_rows=100, max_bytes=150)] == [2, 2, 1]
+    last = list(s._batches(rows, max_rows=2, max_bytes=10**6))[-1]
+    assert last.marks == {"last_upload_products": ("last_upload_products", "t", "P4"), "outbox": ("outbox", 9)}
+
+
+def test_failed_batch_resumes_after_last_acknowledged(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{(tmp_path / 'sales.db').as_posix()}", future=True)
+    init_db(engine)
+    session = sessionmaker(bind=engine, future=True)()
+    session.add_all([Product(name=f"P{i}", price=1, stock=1, external_id=f"SKU-{i}", updated_at=datetime(2024, 1, 1, 0, 0, i // 2)) for i in range(6)])
+    session.commit()
+    box = Outbox(engine, legacy_path=tmp_path / "offline_queue.json")
+    for i in range(2):
+        box.append("sale_created", {"sale_id": i, "sale": {"external_id": f"S-{i}", "items": []}})
+
+    state: dict = {}
+    sent: list[list[str]] = []
+    fail_on = {2}
+
+    def post(payload, token, codec):
+        sent.append([r["external_id"] for k in ("products", "sales") for r in payload[k]])
+        return None if len(sent) in fail_on else 100
+
+    monkeypatch.setattr(s, "outbox", box)
+    monkeypatch.setattr(s, "_get_token", lambda: "tok")
+    monkeypatch.setattr(s, "_load_state", lambda: state)
+    monkeypatch.setattr(s, "_save_state", lambda st: None)
+    monkeypatch.setattr(s, "_post_batch", post)
+    monkeypatch.setattr(s, "SYNC_IN_FLIGHT", 1)
+    monkeypatch.setattr(s, "_batches", lambda rows, _b=s._batches: _b(rows, max_rows=3))
+
+    assert s.attempt_sync(session) is False
+    assert sent == [["SKU-0", "SKU-1", "SKU-2"], ["SKU-3", "SKU-4", "SKU-5"]]
+    third = session.query(Product.id).filter(Product.external_id == "SKU-2").scalar()
+    assert (state["last_upload_products"], state["last_upload_products_id"]) == ("2024-01-01T00:00:01", third)
+    assert len(box) == 2
+
+    fail_on.clear()
+    assert s.attempt_sync(session) is True
+    assert sent[2:] == [["SKU-3", "SKU-4", "SKU-5"], ["S-0", "S-1"]]  # ties on updated_at resume by id
+    assert len(box) == 0 and "last_upload_products_id" not in state
+    assert state["last_sync_payload_bytes"] == 200
+
+
+def test_unreadable_catalog_goes_out_next_sync(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{(tmp_path / 'sales.db').as_posix()}", future=True)
+    init_db(engine)
+    session = sessionmaker(bind=engine, future=True)()
+    session.add_all([Product(name=f"P{i}", price=1, stock=1, external_id=f"SKU-{i}", updated_at=datetime(2024, 1, 1)) for i in range(2)])
+    session.commit()
+    box = Outbox(engine, legacy_path=tmp_path / "offline_queue.json")
+    box.append("sale_created", {"sale_id": 0, "sale": {"external_id": "S-0", "items": []}})
+
+    state: dict = {}
+    sent: list[list[str]] = []
+
+    def post(payload, token, codec):
+        sent.append([r["external_id"] for k in ("products", "sales") for r in payload[k]])
+        return 100
+
+    broken = {Product}
+
+    def unreadable(session, model, *args, _changed=s._changed):
+        if model in broken:
+            raise RuntimeError("database is locked")
+        return _changed(session, model, *args)
+
+    monkeypatch.setattr(s, "outbox", box)
+    monkeypatch.setattr(s, "_get_token", lambda: "tok")
+    monkeypatch.setattr(s, "_load_state", lambda: state)
+    monkeypatch.setattr(s, "_save_state", lambda st: None)
+    monkeypatch.setattr(s, "_post_batch", post)
+    monkeypatch.setattr(s, "_changed", unreadable)
+
+    assert s.attempt_sync(session) is True
+    assert sent == [["S-0"]]
+    assert "last_upload_products" not in state and "last_upload_customers" in state
+
+    broken.clear()
+    assert s.attempt_sync(session) is True
+    assert sent[1:] == [["SKU-0", "SKU-1"]]
+
+
+def test_state_is_replaced_whole(tmp_path, monkeypatch):
+    monkeypatch.setattr(s, "SYNC_STATE_PATH", tmp_path / "sync_state.json")
+    s._save_state({"last_download": "2024-01-01T00:00:00"})
+    s._save_state({"last_download": "2024-02-01T00:00:00", "sync_dict_id": 3})
+    assert s._load_state() == {"last_download": "2024-02-01T00:00:00", "sync_dict_id": 3}
+    assert [p.name for p in tmp_path.iterdir()] == ["sync_state.json"]